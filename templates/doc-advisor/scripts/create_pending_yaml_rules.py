@@ -4,22 +4,28 @@
 Generate pending YAML templates in .claude/doc-advisor/toc/rules/.toc_work/
 
 Usage:
-    python3 .claude/doc-advisor/scripts/create_pending_yaml_rules.py [--full]
+    python3 .claude/doc-advisor/scripts/create_pending_yaml_rules.py [--full] [--paranoid] [--jobs N] [--source hash|git]
 
 Options:
-    --full    Process all files (default: changed files only)
+    --full      Process all files (default: changed files only)
+    --paranoid  Re-hash every file (default: skip files whose stat is unchanged)
+    --jobs N    Hashing threads (default: common.parallel.max_workers in config.yaml)
+    --source git
+                Detect changes from git index blob ids (clean tracked files whose
+                blob id is unchanged are not hashed; untracked/dirty files use SHA-256)
 
 Run from: Project root
 """
 
-import os
+import sqlite3
 import sys
-import hashlib
-import re
-from datetime import datetime, timezone
 from pathlib import Path
 
-from toc_utils import get_project_root, load_config, should_exclude, resolve_config_path, get_system_exclude_patterns, rglob_follow_symlinks, normalize_path
+from toc_utils import get_project_root, load_config, resolve_config_path, get_system_exclude_patterns, compile_exclude_patterns
+from toc_utils import ChecksumStore, FileHashCache, get_checksum_format, get_parallel_config, parse_jobs_option
+from toc_utils import load_git_blobs, parse_source_option
+from toc_utils import WorkDB, get_work_db_enabled, WORK_DB_FILENAME, atomic_write, acquire_toc_lock
+from toc_utils import toc_scan, open_dir_cache, SCAN_RESULT_FILENAME
 
 # Global configuration (initialized in init_config())
 CONFIG = None
@@ -30,7 +36,7 @@ TOC_WORK_DIR = None
 CHECKSUMS_FILE = None
 RULES_TOC_FILE = None
 PATTERNS_CONFIG = None
-EXCLUDE_PATTERNS = None
+EXCLUDE_MATCHER = None
 
 
 def init_config():
@@ -41,7 +47,7 @@ def init_config():
         bool: True on success, False on failure
     """
     global CONFIG, PROJECT_ROOT, RULES_DIR, RULES_DIR_NAME, TOC_WORK_DIR, CHECKSUMS_FILE
-    global RULES_TOC_FILE, PATTERNS_CONFIG, EXCLUDE_PATTERNS
+    global RULES_TOC_FILE, PATTERNS_CONFIG, EXCLUDE_MATCHER
 
     try:
         CONFIG = load_config('rules')
@@ -60,7 +66,8 @@ def init_config():
     RULES_TOC_FILE = resolve_config_path(CONFIG.get('toc_file', 'rules_toc.yaml'), RULES_DIR, PROJECT_ROOT)
     PATTERNS_CONFIG = CONFIG.get('patterns', {})
     # System patterns (always excluded) + user-defined patterns
-    EXCLUDE_PATTERNS = get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', [])
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', []))
     return True
 
 # Pending YAML template
@@ -77,66 +84,19 @@ keywords: []
 """
 
 
-def get_all_md_files():
-    """Get list of target .md files (symlink-aware)"""
-    md_files = []
-    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
-
-    for filepath in rglob_follow_symlinks(RULES_DIR, target_glob):
-        if should_exclude(filepath, RULES_DIR, EXCLUDE_PATTERNS):
-            continue
-        md_files.append(filepath)
+def scan_md_files(visited_dirs=None):
+    """Scan target .md files once (symlink-aware, exclude applied)
 
-    md_files.sort()
-    return md_files
-
-
-def calculate_file_hash(filepath):
+    Args:
+        visited_dirs: Optional list filled with every directory walked (used by watch_toc.py)
     """
-    Calculate SHA256 hash of file
-
-    Returns:
-        str: Hash value, None on error
-    """
-    try:
-        with open(filepath, "rb") as f:
-            return hashlib.sha256(f.read()).hexdigest()
-    except (IOError, OSError, PermissionError) as e:
-        print(f"Warning: File read error: {filepath} - {e}")
-        return None
-
-
-def load_checksums():
-    """Load existing checksum file (standard library only)"""
-    if not CHECKSUMS_FILE.exists():
-        return {}
-
-    checksums = {}
-    try:
-        with open(CHECKSUMS_FILE, "r", encoding="utf-8") as f:
-            in_checksums = False
-            for line in f:
-                stripped = line.strip()
-                if stripped == "checksums:":
-                    in_checksums = True
-                    continue
-                if in_checksums and stripped and not stripped.startswith("#"):
-                    match = re.match(r"^\s+(.+?):\s*([a-f0-9]+)\s*$", line)
-                    if match:
-                        filepath = match.group(1)
-                        hash_val = match.group(2)
-                        checksums[filepath] = hash_val
-    except (IOError, OSError, PermissionError) as e:
-        print(f"Warning: Failed to read checksums file: {e}")
-        return {}
-
-    return checksums
-
-
-def get_source_file_path(md_file):
-    """Get project-relative path with RULES_DIR prefix (e.g., 'rules/core/architecture_rule.md')"""
-    rel_path = normalize_path(md_file.relative_to(RULES_DIR))
-    return f"{RULES_DIR_NAME}/{rel_path}"
+    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
+    dir_cache = open_dir_cache(CHECKSUMS_FILE)
+    scan = toc_scan('rules', RULES_DIR, RULES_DIR_NAME, EXCLUDE_MATCHER, target_glob=target_glob, dir_cache=dir_cache,
+                    visited_dirs=visited_dirs)
+    if dir_cache is not None:
+        print(dir_cache.summary())
+    return scan
 
 
 def get_yaml_filename(source_file):
@@ -155,7 +115,7 @@ def create_pending_yaml(source_file):
     yaml_path = TOC_WORK_DIR / yaml_name
 
     try:
-        with open(yaml_path, "w", encoding="utf-8") as f:
+        with atomic_write(yaml_path) as f:
             f.write(PENDING_TEMPLATE.format(source_file=source_file))
         return yaml_path
     except (IOError, OSError, PermissionError) as e:
@@ -163,36 +123,54 @@ def create_pending_yaml(source_file):
         return None
 
 
-def save_pending_checksums(all_files):
+def create_pending_entries(target_files):
+    """
+    Create pending rows in .toc_work/work.db instead of per-file YAMLs (common.work.db)
+
+    Returns:
+        list: Source files of the created entries, None on error
+    """
+    rows = []
+    for entry in target_files:
+        rows.append((get_yaml_filename(entry.source_file), entry.source_file, None))
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR, create=True)
+        try:
+            work_db.add_pending(rows)
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Error: Failed to write {WORK_DB_FILENAME}: {e}")
+        return None
+    return [source_file for _, source_file, _ in rows]
+
+
+def save_pending_checksums(scan, hash_cache):
     """Save checksums snapshot at Phase 1 time to .toc_work/
 
     Used to replace .toc_checksums.yaml after merge (Phase 3).
     This ensures that files modified during Phase 2 will be
     detected as changed in the next incremental run.
+    Hashes come from hash_cache, so files already hashed during
+    change detection are not read again.
     """
     checksums = {}
-    for md_file in all_files:
-        source_file = get_source_file_path(md_file)
-        hash_value = calculate_file_hash(md_file)
+    for entry in scan:
+        hash_value = hash_cache.get(entry.source_file, entry.path, entry.signature)
         if hash_value is not None:
-            checksums[source_file] = hash_value
+            checksums[entry.source_file] = hash_value
+    stats = hash_cache.get_stats(checksums)
+    blobs = hash_cache.get_blobs(checksums)
 
     pending_checksums_path = TOC_WORK_DIR / ".toc_checksums_pending.yaml"
-    lines = [
-        "# Phase 1 snapshot - used to replace .toc_checksums.yaml after merge",
-        "# Auto-generated - do not edit",
-        f"generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
-        f"file_count: {len(checksums)}",
-        "checksums:",
-    ]
-    for path, hash_val in sorted(checksums.items()):
-        lines.append(f"  {path}: {hash_val}")
-
+    store = ChecksumStore(checksums, stats, blobs)
     try:
-        with open(pending_checksums_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines) + '\n')
+        store.write(pending_checksums_path, get_checksum_format(), comments=[
+            "Phase 1 snapshot - used to replace .toc_checksums.yaml after merge",
+            "Auto-generated - do not edit",
+        ])
         print(f"Saved pending checksums: {len(checksums)} files")
-    except (IOError, OSError, PermissionError) as e:
+    except (OSError, ValueError) as e:
         print(f"Warning: Failed to save pending checksums: {e}")
 
 
@@ -201,8 +179,29 @@ def main():
     if not init_config():
         return 1
 
+    # Serialize with merge / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(RULES_TOC_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        return run()
+    finally:
+        lock.release()
+
+
+def run():
     # Parse options
     full_mode = "--full" in sys.argv
+    paranoid = "--paranoid" in sys.argv
+    max_workers, fallback_to_serial = get_parallel_config()
+    jobs = parse_jobs_option(sys.argv, max_workers)
+    if jobs is None:
+        print("Error: --jobs requires a positive integer")
+        return 1
+    source = parse_source_option(sys.argv)
+    if source is None:
+        print("Error: --source must be 'hash' or 'git'")
+        return 1
 
     # Force full mode if rules_toc.yaml doesn't exist
     if not RULES_TOC_FILE.exists():
@@ -214,50 +213,65 @@ def main():
         full_mode = True
         print(".toc_checksums.yaml not found, running in full mode")
 
-    # Get target files
-    all_files = get_all_md_files()
+    # Scan target files once (reused by merge via .toc_work/.scan.json)
+    scan = scan_md_files()
+
+    # Previous checksums and stat signatures (stat fast path)
+    old_store = ChecksumStore.load(CHECKSUMS_FILE)
+    old_checksums = old_store.hashes
+    # --source git: blob ids of clean tracked files (None falls back to hashing)
+    git_blobs = load_git_blobs(PROJECT_ROOT, RULES_DIR_NAME) if source == 'git' else None
+    # Shared by change detection and the Phase 1 snapshot (each file read once)
+    hash_cache = FileHashCache(old_checksums, old_store.stats, paranoid, old_store.blobs, git_blobs)
+    try:
+        hash_cache.prefetch(scan, jobs, fallback_to_serial)
+    except (RuntimeError, OSError) as e:
+        print(f"Error: Parallel hashing failed: {e}")
+        return 1
 
     if full_mode:
         # Full mode: process all files
-        target_files = all_files
+        target_files = list(scan)
         deleted_files = []
         print(f"Full mode: processing {len(target_files)} files")
     else:
         # Incremental mode: changed files only
-        old_checksums = load_checksums()
-        current_files = {get_source_file_path(f): f for f in all_files}
-
         target_files = []
 
         # Detect new/changed files
-        for source_file, full_path in current_files.items():
-            current_hash = calculate_file_hash(full_path)
+        for entry in scan:
+            source_file = entry.source_file
+            current_hash = hash_cache.get(source_file, entry.path, entry.signature)
             if current_hash is None:
                 continue  # Skip on hash calculation failure
             old_hash = old_checksums.get(source_file)
 
             if old_hash is None:
                 print(f"  [New] {source_file}")
-                target_files.append(full_path)
+                target_files.append(entry)
             elif current_hash != old_hash:
                 print(f"  [Modified] {source_file}")
-                target_files.append(full_path)
+                target_files.append(entry)
 
         # Detect deleted files
         deleted_files = [
             sf for sf in old_checksums.keys()
-            if sf not in current_files
+            if sf not in scan
         ]
         for sf in deleted_files:
             print(f"  [Deleted] {sf}")
 
         if not target_files and not deleted_files:
+            print(hash_cache.summary())
             print("No changes - rules_toc.yaml is up to date")
             return 0
 
         if not target_files and deleted_files:
+            print(hash_cache.summary())
             print(f"\nDeleted files only: {len(deleted_files)} files")
             print("Use --delete-only with merge script")
+            # No scan result for this cycle: drop one left by an earlier cycle
+            (TOC_WORK_DIR / SCAN_RESULT_FILENAME).unlink(missing_ok=True)
             return 0
 
         print(f"\nIncremental mode: {len(target_files)} changes, {len(deleted_files)} deletions")
@@ -266,13 +280,26 @@ def main():
     TOC_WORK_DIR.mkdir(parents=True, exist_ok=True)
 
     # Save Phase 1 checksums snapshot (for all target files, not just changed ones)
-    save_pending_checksums(all_files)
+    save_pending_checksums(scan, hash_cache)
+    print(hash_cache.summary())
+
+    # Persist scan result so merge can skip re-walking the tree
+    scan.save(TOC_WORK_DIR / SCAN_RESULT_FILENAME)
+
+    if get_work_db_enabled():
+        created_files = create_pending_entries(target_files)
+        if created_files is None:
+            return 1
+        print(f"\nCreated {len(created_files)} pending entries in {TOC_WORK_DIR / WORK_DB_FILENAME}:")
+        for sf in created_files:
+            print(f"  - {sf}")
+        return 0
 
     # Generate pending YAMLs
     created_files = []
     failed_count = 0
-    for md_file in target_files:
-        source_file = get_source_file_path(md_file)
+    for entry in target_files:
+        source_file = entry.source_file
         yaml_path = create_pending_yaml(source_file)
         if yaml_path is None:
             failed_count += 1
@@ -4,22 +4,28 @@
 Generate pending YAML templates in .claude/doc-advisor/toc/specs/.toc_work/
 
 Usage:
-    python3 .claude/doc-advisor/scripts/create_pending_yaml_specs.py [--full]
+    python3 .claude/doc-advisor/scripts/create_pending_yaml_specs.py [--full] [--paranoid] [--jobs N] [--source hash|git]
 
 Options:
-    --full    Process all files (default: changed files only)
+    --full      Process all files (default: changed files only)
+    --paranoid  Re-hash every file (default: skip files whose stat is unchanged)
+    --jobs N    Hashing threads (default: common.parallel.max_workers in config.yaml)
+    --source git
+                Detect changes from git index blob ids (clean tracked files whose
+                blob id is unchanged are not hashed; untracked/dirty files use SHA-256)
 
 Run from: Project root
 """
 
-import os
+import sqlite3
 import sys
-import hashlib
-import re
-from datetime import datetime, timezone
 from pathlib import Path
 
-from toc_utils import get_project_root, load_config, should_exclude, resolve_config_path, get_default_target_dirs, get_system_exclude_patterns, rglob_follow_symlinks, normalize_path
+from toc_utils import get_project_root, load_config, resolve_config_path, get_default_target_dirs, get_system_exclude_patterns, compile_exclude_patterns
+from toc_utils import ChecksumStore, FileHashCache, get_checksum_format, get_parallel_config, parse_jobs_option
+from toc_utils import load_git_blobs, parse_source_option
+from toc_utils import WorkDB, get_work_db_enabled, WORK_DB_FILENAME, atomic_write, acquire_toc_lock
+from toc_utils import toc_scan, open_dir_cache, SCAN_RESULT_FILENAME
 
 # Global configuration (initialized in init_config())
 CONFIG = None
@@ -31,7 +37,7 @@ CHECKSUMS_FILE = None
 SPECS_TOC_FILE = None
 PATTERNS_CONFIG = None
 TARGET_DIRS = None
-EXCLUDE_PATTERNS = None
+EXCLUDE_MATCHER = None
 
 
 def init_config():
@@ -42,7 +48,7 @@ def init_config():
         bool: True on success, False on failure
     """
     global CONFIG, PROJECT_ROOT, SPECS_DIR, SPECS_DIR_NAME, TOC_WORK_DIR, CHECKSUMS_FILE
-    global SPECS_TOC_FILE, PATTERNS_CONFIG, TARGET_DIRS, EXCLUDE_PATTERNS
+    global SPECS_TOC_FILE, PATTERNS_CONFIG, TARGET_DIRS, EXCLUDE_MATCHER
 
     try:
         CONFIG = load_config('specs')
@@ -63,7 +69,8 @@ def init_config():
     # target_dirs はマッピング形式: {doc_type: dir_name}
     TARGET_DIRS = PATTERNS_CONFIG.get('target_dirs', get_default_target_dirs())
     # System patterns (always excluded) + user-defined patterns
-    EXCLUDE_PATTERNS = get_system_exclude_patterns('specs') + PATTERNS_CONFIG.get('exclude', [])
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('specs') + PATTERNS_CONFIG.get('exclude', []))
     return True
 
 # Pending YAML template
@@ -81,103 +88,18 @@ keywords: []
 """
 
 
-def is_target_dir(filepath):
-    """Check if file is under target directory"""
-    rel_path = normalize_path(filepath.relative_to(SPECS_DIR))
-    parts = rel_path.split('/')
-    # パスのどこかに target_dirs のディレクトリ名が含まれるかチェック
-    # e.g., main/requirements/app.md → ['main', 'requirements', 'app.md']
-    #       → 'requirements' in target_dir_names → True
-    target_dir_names = TARGET_DIRS.values()
-    return any(part in target_dir_names for part in parts)
-
-
-def get_all_md_files():
-    """Get list of target .md files (symlink-aware)"""
-    md_files = []
-
-    for filepath in rglob_follow_symlinks(SPECS_DIR, "**/*.md"):
-        if should_exclude(filepath, SPECS_DIR, EXCLUDE_PATTERNS):
-            continue
-        if not is_target_dir(filepath):
-            continue
-        md_files.append(filepath)
-
-    md_files.sort()
-    return md_files
-
-
-def calculate_file_hash(filepath):
-    """
-    Calculate SHA256 hash of file
-
-    Returns:
-        str: Hash value, None on error
-    """
-    try:
-        with open(filepath, "rb") as f:
-            return hashlib.sha256(f.read()).hexdigest()
-    except (IOError, OSError, PermissionError) as e:
-        print(f"Warning: File read error: {filepath} - {e}")
-        return None
-
-
-def load_checksums():
-    """Load existing checksum file (standard library only)"""
-    if not CHECKSUMS_FILE.exists():
-        return {}
-
-    checksums = {}
-    try:
-        with open(CHECKSUMS_FILE, "r", encoding="utf-8") as f:
-            in_checksums = False
-            for line in f:
-                stripped = line.strip()
-                if stripped == "checksums:":
-                    in_checksums = True
-                    continue
-                if in_checksums and stripped and not stripped.startswith("#"):
-                    match = re.match(r"^\s+(.+?):\s*([a-f0-9]+)\s*$", line)
-                    if match:
-                        filepath = match.group(1)
-                        hash_val = match.group(2)
-                        checksums[filepath] = hash_val
-    except (IOError, OSError, PermissionError) as e:
-        print(f"Warning: Failed to read checksums file: {e}")
-        return {}
-
-    return checksums
-
-
-def get_source_file_path(md_file):
-    """Get project-relative path with SPECS_DIR prefix (e.g., 'specs/main/requirements/app.md')"""
-    rel_path = normalize_path(md_file.relative_to(SPECS_DIR))
-    return f"{SPECS_DIR_NAME}/{rel_path}"
-
-
-def get_doc_type(source_file):
-    """
-    Determine doc_type from path using TARGET_DIRS
+def scan_md_files(visited_dirs=None):
+    """Scan target .md files once (symlink-aware, exclude/target_dirs applied)
 
     Args:
-        source_file: Project-relative path (e.g., 'specs/main/requirements/login.md')
-
-    Returns:
-        str: doc_type ('requirement', 'design', etc.) or None
+        visited_dirs: Optional list filled with every directory walked (used by watch_toc.py)
     """
-    parts = source_file.split('/')
-    # Skip the first part (root directory like 'specs') to avoid false matches
-    # when subdirectory name equals root directory name
-    parts_without_root = parts[1:] if len(parts) > 1 else parts
-
-    # Create reverse mapping: directory name → doc_type
-    # e.g., {'requirements': 'requirement', 'design': 'design'}
-    dir_to_doctype = {v: k for k, v in TARGET_DIRS.items()}
-
-    for part in parts_without_root:
-        if part in dir_to_doctype:
-            return dir_to_doctype[part]
-    return None
+    dir_cache = open_dir_cache(CHECKSUMS_FILE)
+    scan = toc_scan('specs', SPECS_DIR, SPECS_DIR_NAME, EXCLUDE_MATCHER, target_dirs=TARGET_DIRS, dir_cache=dir_cache,
+                    visited_dirs=visited_dirs)
+    if dir_cache is not None:
+        print(dir_cache.summary())
+    return scan
 
 
 def path_to_yaml_filename(source_file):
@@ -196,7 +118,7 @@ def create_pending_yaml(source_file, doc_type):
     yaml_path = TOC_WORK_DIR / yaml_name
 
     try:
-        with open(yaml_path, "w", encoding="utf-8") as f:
+        with atomic_write(yaml_path) as f:
             f.write(PENDING_TEMPLATE.format(source_file=source_file, doc_type=doc_type))
         return yaml_path
     except (IOError, OSError, PermissionError) as e:
@@ -204,36 +126,57 @@ def create_pending_yaml(source_file, doc_type):
         return None
 
 
-def save_pending_checksums(all_files):
+def create_pending_entries(target_files):
+    """
+    Create pending rows in .toc_work/work.db instead of per-file YAMLs (common.work.db)
+
+    Returns:
+        list: Source files of the created entries, None on error
+    """
+    rows = []
+    for entry in target_files:
+        if entry.doc_type is None:
+            print(f"Warning: Cannot determine doc_type - {entry.source_file}")
+            continue
+        rows.append((path_to_yaml_filename(entry.source_file), entry.source_file, entry.doc_type))
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR, create=True)
+        try:
+            work_db.add_pending(rows)
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Error: Failed to write {WORK_DB_FILENAME}: {e}")
+        return None
+    return [source_file for _, source_file, _ in rows]
+
+
+def save_pending_checksums(scan, hash_cache):
     """Save checksums snapshot at Phase 1 time to .toc_work/
 
     Used to replace .toc_checksums.yaml after merge (Phase 3).
     This ensures that files modified during Phase 2 will be
     detected as changed in the next incremental run.
+    Hashes come from hash_cache, so files already hashed during
+    change detection are not read again.
     """
     checksums = {}
-    for md_file in all_files:
-        source_file = get_source_file_path(md_file)
-        hash_value = calculate_file_hash(md_file)
+    for entry in scan:
+        hash_value = hash_cache.get(entry.source_file, entry.path, entry.signature)
         if hash_value is not None:
-            checksums[source_file] = hash_value
+            checksums[entry.source_file] = hash_value
+    stats = hash_cache.get_stats(checksums)
+    blobs = hash_cache.get_blobs(checksums)
 
     pending_checksums_path = TOC_WORK_DIR / ".toc_checksums_pending.yaml"
-    lines = [
-        "# Phase 1 snapshot - used to replace .toc_checksums.yaml after merge",
-        "# Auto-generated - do not edit",
-        f"generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
-        f"file_count: {len(checksums)}",
-        "checksums:",
-    ]
-    for path, hash_val in sorted(checksums.items()):
-        lines.append(f"  {path}: {hash_val}")
-
+    store = ChecksumStore(checksums, stats, blobs)
     try:
-        with open(pending_checksums_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines) + '\n')
+        store.write(pending_checksums_path, get_checksum_format(), comments=[
+            "Phase 1 snapshot - used to replace .toc_checksums.yaml after merge",
+            "Auto-generated - do not edit",
+        ])
         print(f"Saved pending checksums: {len(checksums)} files")
-    except (IOError, OSError, PermissionError) as e:
+    except (OSError, ValueError) as e:
         print(f"Warning: Failed to save pending checksums: {e}")
 
 
@@ -242,8 +185,29 @@ def main():
     if not init_config():
         return 1
 
+    # Serialize with merge / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(SPECS_TOC_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        return run()
+    finally:
+        lock.release()
+
+
+def run():
     # Parse options
     full_mode = "--full" in sys.argv
+    paranoid = "--paranoid" in sys.argv
+    max_workers, fallback_to_serial = get_parallel_config()
+    jobs = parse_jobs_option(sys.argv, max_workers)
+    if jobs is None:
+        print("Error: --jobs requires a positive integer")
+        return 1
+    source = parse_source_option(sys.argv)
+    if source is None:
+        print("Error: --source must be 'hash' or 'git'")
+        return 1
 
     # Force full mode if specs_toc.yaml doesn't exist
     if not SPECS_TOC_FILE.exists():
@@ -255,50 +219,65 @@ def main():
         full_mode = True
         print(".toc_checksums.yaml not found, running in full mode")
 
-    # Get target files
-    all_files = get_all_md_files()
+    # Scan target files once (reused by merge via .toc_work/.scan.json)
+    scan = scan_md_files()
+
+    # Previous checksums and stat signatures (stat fast path)
+    old_store = ChecksumStore.load(CHECKSUMS_FILE)
+    old_checksums = old_store.hashes
+    # --source git: blob ids of clean tracked files (None falls back to hashing)
+    git_blobs = load_git_blobs(PROJECT_ROOT, SPECS_DIR_NAME) if source == 'git' else None
+    # Shared by change detection and the Phase 1 snapshot (each file read once)
+    hash_cache = FileHashCache(old_checksums, old_store.stats, paranoid, old_store.blobs, git_blobs)
+    try:
+        hash_cache.prefetch(scan, jobs, fallback_to_serial)
+    except (RuntimeError, OSError) as e:
+        print(f"Error: Parallel hashing failed: {e}")
+        return 1
 
     if full_mode:
         # Full mode: process all files
-        target_files = all_files
+        target_files = list(scan)
         deleted_files = []
         print(f"Full mode: processing {len(target_files)} files")
     else:
         # Incremental mode: changed files only
-        old_checksums = load_checksums()
-        current_files = {get_source_file_path(f): f for f in all_files}
-
         target_files = []
 
         # Detect new/changed files
-        for source_file, full_path in current_files.items():
-            current_hash = calculate_file_hash(full_path)
+        for entry in scan:
+            source_file = entry.source_file
+            current_hash = hash_cache.get(source_file, entry.path, entry.signature)
             if current_hash is None:
                 continue  # Skip on hash calculation failure
             old_hash = old_checksums.get(source_file)
 
             if old_hash is None:
                 print(f"  [New] {source_file}")
-                target_files.append(full_path)
+                target_files.append(entry)
             elif current_hash != old_hash:
                 print(f"  [Modified] {source_file}")
-                target_files.append(full_path)
+                target_files.append(entry)
 
         # Detect deleted files
         deleted_files = [
             sf for sf in old_checksums.keys()
-            if sf not in current_files
+            if sf not in scan
         ]
         for sf in deleted_files:
             print(f"  [Deleted] {sf}")
 
         if not target_files and not deleted_files:
+            print(hash_cache.summary())
             print("No changes - specs_toc.yaml is up to date")
             return 0
 
         if not target_files and deleted_files:
+            print(hash_cache.summary())
             print(f"\nDeleted files only: {len(deleted_files)} files")
             print("Use --delete-only with merge script")
+            # No scan result for this cycle: drop one left by an earlier cycle
+            (TOC_WORK_DIR / SCAN_RESULT_FILENAME).unlink(missing_ok=True)
             return 0
 
         print(f"\nIncremental mode: {len(target_files)} changes, {len(deleted_files)} deletions")
@@ -307,14 +286,27 @@ def main():
     TOC_WORK_DIR.mkdir(parents=True, exist_ok=True)
 
     # Save Phase 1 checksums snapshot (for all target files, not just changed ones)
-    save_pending_checksums(all_files)
+    save_pending_checksums(scan, hash_cache)
+    print(hash_cache.summary())
+
+    # Persist scan result so merge can skip re-walking the tree
+    scan.save(TOC_WORK_DIR / SCAN_RESULT_FILENAME)
+
+    if get_work_db_enabled():
+        created_files = create_pending_entries(target_files)
+        if created_files is None:
+            return 1
+        print(f"\nCreated {len(created_files)} pending entries in {TOC_WORK_DIR / WORK_DB_FILENAME}:")
+        for sf in created_files:
+            print(f"  - {sf}")
+        return 0
 
     # Generate pending YAMLs
     created_files = []
     failed_count = 0
-    for md_file in target_files:
-        source_file = get_source_file_path(md_file)
-        doc_type = get_doc_type(source_file)
+    for entry in target_files:
+        source_file = entry.source_file
+        doc_type = entry.doc_type
         if doc_type is None:
             print(f"Warning: Cannot determine doc_type - {source_file}")
             continue
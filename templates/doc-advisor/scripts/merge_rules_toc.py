@@ -4,7 +4,7 @@
 """
 rules_toc.yaml Merge Script (standard library only)
 
-Reads all entries from .claude/doc-advisor/toc/rules/.toc_work/*.yaml,
+Reads all entries from .claude/doc-advisor/toc/rules/.toc_work/*.yaml (and work.db, if present),
 removes _meta sections, merges them, and generates .claude/doc-advisor/toc/rules/rules_toc.yaml.
 
 Usage:
@@ -15,7 +15,9 @@ Options:
     --mode      full (default): Generate new, incremental: Differential merge
 """
 
+import sqlite3
 import sys
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -25,14 +27,30 @@ from toc_utils import (
     load_entry_file,
     yaml_escape,
     backup_existing_file,
+    atomic_write,
+    acquire_toc_lock,
     load_checksums,
     cleanup_work_dir,
-    should_exclude,
     resolve_config_path,
     get_system_exclude_patterns,
-    rglob_follow_symlinks,
-    normalize_path,
+    compile_exclude_patterns,
+    toc_scan,
+    open_dir_cache,
+    load_scan_result,
+    get_scan_fingerprint,
+    SCAN_RESULT_FILENAME,
+    WorkDB,
+    TocSplice,
+    read_toc_entries,
+    write_toc_caches,
+    load_toc_sidecar_header,
+    cached_load,
+    delegate_to_server,
 )
+from toc_schema import SCHEMA_VERSION, compile_entry_check, describe_problem, has_intact_stamp
+
+# ToC format check for entries without an intact schema stamp (toc_schema.py)
+CHECK_ENTRY = compile_entry_check('rules', 'toc')
 
 # Global configuration (initialized in init_config())
 CONFIG = None
@@ -44,7 +62,7 @@ OUTPUT_FILE = None
 CHECKSUMS_FILE = None
 OUTPUT_CONFIG = None
 PATTERNS_CONFIG = None
-EXCLUDE_PATTERNS = None
+EXCLUDE_MATCHER = None
 
 
 def init_config():
@@ -55,7 +73,7 @@ def init_config():
         bool: True on success, False on failure
     """
     global CONFIG, PROJECT_ROOT, RULES_DIR, RULES_DIR_NAME, TOC_WORK_DIR, OUTPUT_FILE
-    global CHECKSUMS_FILE, OUTPUT_CONFIG, PATTERNS_CONFIG, EXCLUDE_PATTERNS
+    global CHECKSUMS_FILE, OUTPUT_CONFIG, PATTERNS_CONFIG, EXCLUDE_MATCHER
 
     try:
         CONFIG = load_config('rules')
@@ -75,7 +93,8 @@ def init_config():
     OUTPUT_CONFIG = CONFIG.get('output', {})
     PATTERNS_CONFIG = CONFIG.get('patterns', {})
     # System patterns (always excluded) + user-defined patterns
-    EXCLUDE_PATTERNS = get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', [])
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', []))
     return True
 
 
@@ -85,120 +104,168 @@ def load_existing_toc(toc_path):
         return {}
 
     try:
-        with open(toc_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except (IOError, OSError, PermissionError) as e:
+        # Shallow copy: merge adds/removes entries, the cached dict stays intact
+        return dict(cached_load(toc_path, read_toc_entries))
+    except (IOError, OSError, PermissionError, UnicodeDecodeError) as e:
         print(f"Warning: Failed to read {toc_path}: {e}")
         return {}
 
-    docs = {}
-    current_file = None
-    current_entry = {}
-    current_list = None
-    in_docs = False
-
-    for line in content.split('\n'):
-        stripped = line.strip()
-
-        if stripped.startswith('#') or not stripped:
-            continue
-
-        if stripped == 'docs:':
-            in_docs = True
-            continue
-
-        if not in_docs:
-            continue
-
-        # Detect file path (2-space indent ending with :)
-        if line.startswith('  ') and not line.startswith('    ') and stripped.endswith(':'):
-            if current_file and current_entry:
-                docs[current_file] = current_entry
-            current_file = stripped.rstrip(':')
-            current_entry = {}
-            current_list = None
-        elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
-            if current_file:
-                key, _, val = stripped.partition(':')
-                key = key.strip()
-                val = val.strip().strip('"\'')
-                if val == '[]':
-                    # Inline empty array (e.g., "references: []")
-                    current_list = []
-                    current_entry[key] = current_list
-                elif val:
-                    current_entry[key] = val
-                else:
-                    current_list = []
-                    current_entry[key] = current_list
-        elif stripped.startswith('- ') and current_list is not None:
-            item = stripped[2:].strip().strip('"\'')
-            current_list.append(item)
-
-    if current_file and current_entry:
-        docs[current_file] = current_entry
-
-    return docs
-
-
-def get_existing_files():
-    """Get list of currently existing files with RULES_DIR prefix (symlink-aware)"""
-    files = set()
-    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
-    for filepath in rglob_follow_symlinks(RULES_DIR, target_glob):
-        if should_exclude(filepath, RULES_DIR, EXCLUDE_PATTERNS):
-            continue
-        rel_path = normalize_path(filepath.relative_to(RULES_DIR))
-        # Include RULES_DIR prefix for project-relative path
-        prefixed_path = f"{RULES_DIR_NAME}/{rel_path}"
-        files.add(prefixed_path)
-    return files
-
 
-def write_yaml_output(docs, output_path):
+def get_existing_files(reuse_scan=True):
     """
-    Write YAML file
+    Get set of currently existing target files with RULES_DIR prefix (symlink-aware)
 
-    Returns:
-        bool: True on success, False on failure
+    Reuses the Phase 1 scan result (.toc_work/.scan.json) when it matches
+    the current settings and no scanned directory changed since
+    (load_scan_result()), otherwise scans the tree.
+
+    Args:
+        reuse_scan: False to always scan (--delete-only: Phase 1 saves no scan
+            result for a deletion-only change, a .scan.json is from an earlier cycle)
     """
-    lines = []
+    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
+    fingerprint = get_scan_fingerprint('rules', RULES_DIR, EXCLUDE_MATCHER, target_glob=target_glob)
+    scan = load_scan_result(TOC_WORK_DIR / SCAN_RESULT_FILENAME, fingerprint) if reuse_scan else None
+    if scan is None:
+        dir_cache = open_dir_cache(CHECKSUMS_FILE)
+        scan = toc_scan('rules', RULES_DIR, RULES_DIR_NAME, EXCLUDE_MATCHER, target_glob=target_glob, dir_cache=dir_cache)
+        if dir_cache is not None:
+            print(dir_cache.summary())
+    else:
+        print(f"Using Phase 1 scan result: {len(scan)} files")
+    return scan.source_files()
+
 
-    # File header comment
+def format_header_lines(file_count):
+    """Lines before the first entry (header comment, metadata, 'docs:')"""
     header_comment = OUTPUT_CONFIG.get('header_comment', 'Development Document Search Index for rules-advisor Subagent')
     metadata_name = OUTPUT_CONFIG.get('metadata_name', 'Development Document Search Index')
 
-    lines.append("# .claude/doc-advisor/toc/rules/rules_toc.yaml")
-    lines.append(f"# {header_comment}")
-    lines.append("")
+    return [
+        "# .claude/doc-advisor/toc/rules/rules_toc.yaml",
+        f"# {header_comment}",
+        "",
+        "metadata:",
+        f"  name: {metadata_name}",
+        f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f"  file_count: {file_count}",
+        "",
+        "docs:",
+    ]
 
-    lines.append("metadata:")
-    lines.append(f"  name: {metadata_name}")
-    lines.append(f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
-    lines.append(f"  file_count: {len(docs)}")
-    lines.append("")
 
-    lines.append("docs:")
-    for source_file, entry in sorted(docs.items()):
-        lines.append(f"  {source_file}:")
+def format_entry_lines(source_file, entry):
+    """Lines of one docs: entry"""
+    lines = [f"  {source_file}:"]
 
-        for key in ['title', 'purpose']:
-            if key in entry:
-                lines.append(f"    {key}: {yaml_escape(entry[key])}")
+    for key in ['title', 'purpose']:
+        if key in entry:
+            lines.append(f"    {key}: {yaml_escape(entry[key])}")
 
-        for key in ['content_details', 'applicable_tasks', 'keywords']:
-            if key in entry and entry[key]:
-                lines.append(f"    {key}:")
-                for item in entry[key]:
-                    lines.append(f"      - {yaml_escape(item)}")
+    for key in ['content_details', 'applicable_tasks', 'keywords']:
+        if key in entry and entry[key]:
+            lines.append(f"    {key}:")
+            for item in entry[key]:
+                lines.append(f"      - {yaml_escape(item)}")
+    return lines
+
+
+def write_yaml_output(docs, output_path, schema_checked=False):
+    """
+    Write YAML file
+
+    Args:
+        schema_checked: Every entry passed the entry schema (recorded in the
+            sidecar header, see was_schema_checked())
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    lines = format_header_lines(len(docs))
+    for source_file, entry in sorted(docs.items()):
+        lines.extend(format_entry_lines(source_file, entry))
 
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with atomic_write(output_path) as f:
             f.write('\n'.join(lines) + '\n')
-        return True
     except (IOError, OSError, PermissionError) as e:
         print(f"Error: Failed to write file: {output_path} - {e}")
         return False
+    write_toc_caches(output_path, SCHEMA_VERSION if schema_checked else None)
+    return True
+
+
+def splice_toc(changes, existing_files, deleted_files, schema_checked=False):
+    """
+    Incremental update without loading the whole ToC (see TocSplice)
+
+    Existing entries are copied verbatim unless replaced by changes or no
+    longer in existing_files. schema_checked: as in write_yaml_output(), for
+    the spliced file (the copied entries included).
+
+    Returns:
+        bool or None: True on success, False on failure,
+            None if the ToC cannot be spliced (caller rewrites it in full)
+    """
+    try:
+        splice = TocSplice(OUTPUT_FILE, changes, lambda source_file: source_file in existing_files)
+    except ValueError as e:
+        print(f"Note: Rewriting rules_toc.yaml in full ({e})")
+        return None
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Warning: Failed to read {OUTPUT_FILE}: {e}")
+        return None
+
+    for source_file in splice.dropped:
+        if source_file in deleted_files:
+            print(f"  Deleted: {source_file}")
+        else:
+            print(f"  Deleted (stale): {source_file}")
+    if splice.file_count == 0:
+        print("Error: No valid entries")
+        return False
+
+    try:
+        splice.write(OUTPUT_FILE, format_header_lines(splice.file_count), format_entry_lines)
+    except (IOError, OSError, PermissionError, ValueError) as e:
+        print(f"Error: Failed to write file: {OUTPUT_FILE} - {e}")
+        return False
+    write_toc_caches(OUTPUT_FILE, SCHEMA_VERSION if schema_checked else None, index=False, graph=False)
+
+    print(f"\nGeneration complete: {OUTPUT_FILE}")
+    print(f"   - File count: {splice.file_count} ({len(changes) - splice.replaced} added, "
+          f"{splice.replaced} replaced, {len(splice.dropped)} deleted)")
+    return True
+
+
+def was_schema_checked(toc_path):
+    """
+    True if every entry of the existing ToC passed the current entry schema
+
+    Read from the sidecar header written with the ToC; a ToC written by an
+    older version or edited by hand counts as unchecked.
+    """
+    header = load_toc_sidecar_header(toc_path)
+    return header is not None and header.get('schema_version') == SCHEMA_VERSION
+
+
+def check_entry_schema(filename, meta, entry, errors):
+    """
+    Check a completed entry unless its _meta.schema_stamp is intact (toc_schema.py)
+
+    Entries stamped by write_rules_pending.py were checked at write time and
+    are trusted; others (older writers, hand edits) get the ToC format check.
+    Problems are added to errors as warnings; the entry is still merged.
+
+    Returns:
+        str: 'stamped', 'checked' or 'invalid'
+    """
+    if has_intact_stamp('rules', meta, entry):
+        return 'stamped'
+    problems = CHECK_ENTRY(entry)
+    for problem in problems:
+        errors.append(f"{filename}: {describe_problem(problem)}")
+    return 'invalid' if problems else 'checked'
 
 
 def delete_only_mode():
@@ -212,12 +279,13 @@ def delete_only_mode():
     # Create backup
     backup_existing_file(OUTPUT_FILE)
 
-    # Load existing data
+    # Load existing data (deleting entries keeps a schema-checked ToC checked)
     docs = load_existing_toc(OUTPUT_FILE)
+    schema_checked = was_schema_checked(OUTPUT_FILE)
 
     # Delete entries that exist in checksums but file doesn't exist
     checksum_files = load_checksums(CHECKSUMS_FILE)
-    existing_files = get_existing_files()
+    existing_files = get_existing_files(reuse_scan=False)
     deleted_files = checksum_files - existing_files
 
     deleted_count = 0
@@ -238,21 +306,44 @@ def delete_only_mode():
         print("No entries to delete")
         return True
 
-    if not write_yaml_output(docs, OUTPUT_FILE):
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
         return False
 
     print(f"\nDeletion complete: {deleted_count} entries deleted")
     return True
 
 
+def load_work_db_entries():
+    """
+    Load all entries of .toc_work/work.db (common.work.db)
+
+    Returns:
+        dict: {entry name: (meta, entry)}; empty if there is no work.db
+    """
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR)
+        if work_db is None:
+            return {}
+        try:
+            return {name: (meta, entry) for name, meta, entry in work_db.entries()}
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Failed to read work.db: {e}")
+        return {}
+
+
 def merge_toc_files(mode='full'):
-    yaml_files = sorted(f for f in TOC_WORK_DIR.glob("*.yaml") if not f.name.startswith('.'))
+    # work.db rows plus any per-file YAMLs (e.g. exported or written by the watcher)
+    db_entries = load_work_db_entries()
+    yaml_files = {f.name: f for f in TOC_WORK_DIR.glob("*.yaml") if not f.name.startswith('.')}
+    entry_names = sorted(set(db_entries) | set(yaml_files))
 
-    if not yaml_files:
+    if not entry_names:
         print(f"Error: No YAML files found in {TOC_WORK_DIR}")
         return False
 
-    print(f"Target files: {len(yaml_files)}")
+    print(f"Target files: {len(entry_names)}")
     print(f"Mode: {mode}")
 
     # Create backup (common to all modes)
@@ -261,25 +352,16 @@ def merge_toc_files(mode='full'):
     # Get current valid files (exclude applied)
     existing_files = get_existing_files()
 
-    # In incremental mode, load existing data
-    if mode == 'incremental':
-        docs = load_existing_toc(OUTPUT_FILE)
-        # Delete entries that exist in checksums but file doesn't exist
-        checksum_files = load_checksums(CHECKSUMS_FILE)
-        deleted_files = checksum_files - existing_files
-        for del_file in deleted_files:
-            if del_file in docs:
-                del docs[del_file]
-                print(f"  Deleted: {del_file}")
-    else:
-        docs = {}
-
+    changes = {}
     errors = []
+    schema_results = Counter()
 
-    for filepath in yaml_files:
-        filename = filepath.name
+    for filename in entry_names:
         try:
-            meta, entry = load_entry_file(filepath)
+            if filename in db_entries:
+                meta, entry = db_entries[filename]
+            else:
+                meta, entry = load_entry_file(yaml_files[filename])
             source_file = meta.get('source_file')
             status = meta.get('status')
 
@@ -296,29 +378,41 @@ def merge_toc_files(mode='full'):
                 errors.append(f"{filename}: Skipped (excluded or missing: {source_file})")
                 continue
 
-            docs[source_file] = entry
+            schema_results[check_entry_schema(filename, meta, entry, errors)] += 1
+            changes[source_file] = entry
             print(f"  {source_file}")
 
         except Exception as e:
             errors.append(f"{filename}: {e}")
 
-    # Remove stale entries not in current valid files
-    if mode == 'incremental':
-        stale_entries = [p for p in docs if p not in existing_files]
-        for stale in stale_entries:
-            del docs[stale]
-            print(f"  Deleted (stale): {stale}")
-
     if errors:
         print("\nWarnings:")
         for err in errors:
             print(f"  - {err}")
+    print(f"Schema: {schema_results['stamped']} stamped at write time, "
+          f"{schema_results['checked'] + schema_results['invalid']} checked, {schema_results['invalid']} invalid")
+
+    # The ToC is schema-checked if every entry is: the new ones and, when kept, the existing ones
+    schema_checked = schema_results['invalid'] == 0
+    if mode == 'incremental' and OUTPUT_FILE.exists():
+        schema_checked = schema_checked and was_schema_checked(OUTPUT_FILE)
+        # Entries in checksums whose file no longer exists
+        deleted_files = load_checksums(CHECKSUMS_FILE) - existing_files
+        result = splice_toc(changes, existing_files, deleted_files, schema_checked)
+        if result is not None:
+            return result
+
+    # Full rewrite: full mode, no existing ToC, or a ToC that cannot be spliced
+    docs = {}
+    if mode == 'incremental':
+        docs = {p: e for p, e in load_existing_toc(OUTPUT_FILE).items() if p in existing_files}
+    docs.update(changes)
 
     if not docs:
         print("Error: No valid entries")
         return False
 
-    if not write_yaml_output(docs, OUTPUT_FILE):
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
         return False
 
     print(f"\nGeneration complete: {OUTPUT_FILE}")
@@ -344,16 +438,24 @@ def main():
     print("rules_toc.yaml Merge Script")
     print("=" * 50)
 
-    if delete_only:
-        success = delete_only_mode()
-    else:
-        success = merge_toc_files(mode)
+    # Serialize with Phase 1 / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(OUTPUT_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        if delete_only:
+            success = delete_only_mode()
+        else:
+            success = merge_toc_files(mode)
 
-    if success and cleanup:
-        cleanup_work_dir(TOC_WORK_DIR)
+        if success and cleanup:
+            cleanup_work_dir(TOC_WORK_DIR)
+    finally:
+        lock.release()
 
     return 0 if success else 1
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    exit_code = delegate_to_server('merge', 'rules')
+    sys.exit(main() if exit_code is None else exit_code)
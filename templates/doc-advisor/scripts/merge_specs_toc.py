@@ -4,9 +4,14 @@
 """
 specs_toc.yaml Merge Script (standard library only)
 
-Reads all entries from .claude/doc-advisor/toc/specs/.toc_work/*.yaml,
+Reads all entries from .claude/doc-advisor/toc/specs/.toc_work/*.yaml (and work.db, if present),
 removes _meta sections, merges them, and generates .claude/doc-advisor/toc/specs/specs_toc.yaml.
 
+With specs.output.shards: true, also writes one shard per feature directory
+(.claude/doc-advisor/toc/specs/shards/<feature>.yaml, the feature's entries
+copied from specs_toc.yaml) and specs_toc_manifest.yaml with per-shard counts
+and top keywords, so the specs-advisor can read only the relevant shards.
+
 Usage:
     python3 merge_specs_toc.py [--cleanup] [--mode full|incremental]
 
@@ -15,8 +20,10 @@ Options:
     --mode      full (default): Generate new, incremental: Differential merge
 """
 
+import sqlite3
 import sys
 import re
+from collections import Counter
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -26,15 +33,32 @@ from toc_utils import (
     load_entry_file,
     yaml_escape,
     backup_existing_file,
+    atomic_write,
+    acquire_toc_lock,
     load_checksums,
     cleanup_work_dir,
-    should_exclude,
     resolve_config_path,
     get_default_target_dirs,
     get_system_exclude_patterns,
-    rglob_follow_symlinks,
-    normalize_path,
+    compile_exclude_patterns,
+    toc_scan,
+    open_dir_cache,
+    load_scan_result,
+    get_scan_fingerprint,
+    SCAN_RESULT_FILENAME,
+    WorkDB,
+    TocSplice,
+    read_toc_entries,
+    write_toc_caches,
+    load_toc_sidecar_header,
+    iter_toc_blocks,
+    cached_load,
+    delegate_to_server,
 )
+from toc_schema import SCHEMA_VERSION, compile_entry_check, describe_problem, has_intact_stamp
+
+# ToC format check for entries without an intact schema stamp (toc_schema.py)
+CHECK_ENTRY = compile_entry_check('specs', 'toc')
 
 # Global configuration (initialized in init_config())
 CONFIG = None
@@ -47,7 +71,14 @@ CHECKSUMS_FILE = None
 OUTPUT_CONFIG = None
 PATTERNS_CONFIG = None
 TARGET_DIRS = None
-EXCLUDE_PATTERNS = None
+EXCLUDE_MATCHER = None
+SHARDS_DIR = None
+MANIFEST_FILE = None
+
+# Shard for documents directly under <specs root>/<target dir>/ (no feature directory)
+ROOT_SHARD_NAME = '_root'
+# Most frequent keywords listed per shard in the manifest
+MANIFEST_KEYWORDS = 10
 
 
 def init_config():
@@ -58,7 +89,8 @@ def init_config():
         bool: True on success, False on failure
     """
     global CONFIG, PROJECT_ROOT, SPECS_DIR, SPECS_DIR_NAME, TOC_WORK_DIR, OUTPUT_FILE
-    global CHECKSUMS_FILE, OUTPUT_CONFIG, PATTERNS_CONFIG, TARGET_DIRS, EXCLUDE_PATTERNS
+    global CHECKSUMS_FILE, OUTPUT_CONFIG, PATTERNS_CONFIG, TARGET_DIRS, EXCLUDE_MATCHER
+    global SHARDS_DIR, MANIFEST_FILE
 
     try:
         CONFIG = load_config('specs')
@@ -80,69 +112,279 @@ def init_config():
     # target_dirs はマッピング形式: {doc_type: dir_name}
     TARGET_DIRS = PATTERNS_CONFIG.get('target_dirs', get_default_target_dirs())
     # System patterns (always excluded) + user-defined patterns
-    EXCLUDE_PATTERNS = get_system_exclude_patterns('specs') + PATTERNS_CONFIG.get('exclude', [])
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('specs') + PATTERNS_CONFIG.get('exclude', []))
+    # Sharded output (specs.output.shards) next to specs_toc.yaml
+    SHARDS_DIR = OUTPUT_FILE.parent / 'shards'
+    MANIFEST_FILE = OUTPUT_FILE.with_name(OUTPUT_FILE.stem + '_manifest.yaml')
     return True
 
 
-def write_yaml_output(docs, output_path):
+def format_header_lines(file_count):
+    """Lines before the first entry (header comment, metadata, 'docs:')"""
+    header_comment = OUTPUT_CONFIG.get('header_comment', 'Requirement & Design Document Search Index for specs-advisor Subagent')
+    metadata_name = OUTPUT_CONFIG.get('metadata_name', 'Requirement & Design Document Search Index')
+
+    return [
+        "# .claude/doc-advisor/toc/specs/specs_toc.yaml",
+        f"# {header_comment}",
+        "",
+        "metadata:",
+        f"  name: {metadata_name}",
+        f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f"  file_count: {file_count}",
+        "",
+        "docs:",
+    ]
+
+
+def format_entry_lines(file_path, entry):
+    """Lines of one docs: entry"""
+    lines = [f"  {file_path}:"]
+    for key in ['doc_type', 'title', 'purpose']:
+        if key in entry:
+            lines.append(f"    {key}: {yaml_escape(entry[key])}")
+    if 'content_details' in entry and entry['content_details']:
+        lines.append("    content_details:")
+        for item in entry['content_details']:
+            lines.append(f"      - {yaml_escape(item)}")
+    if 'applicable_tasks' in entry and entry['applicable_tasks']:
+        lines.append("    applicable_tasks:")
+        for task in entry['applicable_tasks']:
+            lines.append(f"      - {yaml_escape(task)}")
+    if 'keywords' in entry and entry['keywords']:
+        lines.append("    keywords:")
+        for kw in entry['keywords']:
+            lines.append(f"      - {yaml_escape(kw)}")
+    # references フィールド（空配列許容）
+    if 'references' in entry:
+        if entry['references']:
+            lines.append("    references:")
+            for ref in entry['references']:
+                lines.append(f"      - {yaml_escape(ref)}")
+        else:
+            lines.append("    references: []")
+    return lines
+
+
+def write_yaml_output(docs, output_path, schema_checked=False):
     """
     Write YAML file
 
+    Args:
+        schema_checked: Every entry passed the entry schema (recorded in the
+            sidecar header, see was_schema_checked())
+
     Returns:
         bool: True on success, False on failure
     """
-    lines = []
+    lines = format_header_lines(len(docs))
+    for file_path, entry in sorted(docs.items()):
+        lines.extend(format_entry_lines(file_path, entry))
+
+    try:
+        with atomic_write(output_path) as f:
+            f.write('\n'.join(lines) + '\n')
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Error: Failed to write file: {output_path} - {e}")
+        return False
+    write_toc_caches(output_path, SCHEMA_VERSION if schema_checked else None)
+    return True
+
+
+def splice_toc(changes, existing_files, deleted_files, schema_checked=False):
+    """
+    Incremental update without loading the whole ToC (see TocSplice)
+
+    Existing entries are copied verbatim unless replaced by changes or no
+    longer in existing_files. schema_checked: as in write_yaml_output(), for
+    the spliced file (the copied entries included).
+
+    Returns:
+        bool or None: True on success, False on failure,
+            None if the ToC cannot be spliced (caller rewrites it in full)
+    """
+    try:
+        splice = TocSplice(OUTPUT_FILE, changes, lambda source_file: source_file in existing_files)
+    except ValueError as e:
+        print(f"Note: Rewriting specs_toc.yaml in full ({e})")
+        return None
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Warning: Failed to read {OUTPUT_FILE}: {e}")
+        return None
+
+    for source_file in splice.dropped:
+        if source_file in deleted_files:
+            print(f"  Deleted: {source_file}")
+        else:
+            print(f"  Deleted (stale): {source_file}")
+    if splice.file_count == 0:
+        print("Error: No valid entries")
+        return False
 
-    # File header comment
+    try:
+        splice.write(OUTPUT_FILE, format_header_lines(splice.file_count), format_entry_lines)
+    except (IOError, OSError, PermissionError, ValueError) as e:
+        print(f"Error: Failed to write file: {OUTPUT_FILE} - {e}")
+        return False
+    write_toc_caches(OUTPUT_FILE, SCHEMA_VERSION if schema_checked else None, index=False, graph=False)
+
+    print(f"\nGeneration complete: {OUTPUT_FILE}")
+    print(f"   - docs: {splice.file_count} ({len(changes) - splice.replaced} added, "
+          f"{splice.replaced} replaced, {len(splice.dropped)} deleted)")
+    return True
+
+
+def get_shard(file_path):
+    """
+    Shard of a ToC key: the directories between the specs root and the first target directory
+
+    Returns:
+        tuple: (shard name, feature path); e.g. ('main', 'specs/main/') for
+            specs/main/requirements/app.md, ('web_admin', 'specs/web/admin/') for nested features
+    """
+    prefix = SPECS_DIR_NAME + '/'
+    parts = (file_path[len(prefix):] if file_path.startswith(prefix) else file_path).split('/')
+    target_dir_names = set(TARGET_DIRS.values())
+    depth = next((i for i, part in enumerate(parts[:-1]) if part in target_dir_names), len(parts) - 1)
+    feature = parts[:depth]
+    feature_path = '/'.join([SPECS_DIR_NAME] + feature) + '/'
+    return ('_'.join(feature) or ROOT_SHARD_NAME), feature_path
+
+
+def format_shard_header_lines(shard_name, file_count):
+    """Lines before the first entry of a shard (no generated_at: unchanged shards keep their bytes)"""
     header_comment = OUTPUT_CONFIG.get('header_comment', 'Requirement & Design Document Search Index for specs-advisor Subagent')
     metadata_name = OUTPUT_CONFIG.get('metadata_name', 'Requirement & Design Document Search Index')
 
-    lines.append("# .claude/doc-advisor/toc/specs/specs_toc.yaml")
-    lines.append(f"# {header_comment}")
-    lines.append("")
+    return [
+        f"# .claude/doc-advisor/toc/specs/shards/{shard_name}.yaml",
+        f"# {header_comment} (shard of {OUTPUT_FILE.name})",
+        "",
+        "metadata:",
+        f"  name: {metadata_name}",
+        f"  shard: {shard_name}",
+        f"  file_count: {file_count}",
+        "",
+        "docs:",
+    ]
+
+
+def format_manifest_lines(shards, file_count):
+    """Lines of specs_toc_manifest.yaml (shards: {name: summary dict})"""
+    metadata_name = OUTPUT_CONFIG.get('metadata_name', 'Requirement & Design Document Search Index')
+    lines = [
+        f"# .claude/doc-advisor/toc/specs/{MANIFEST_FILE.name}",
+        f"# Shards of {OUTPUT_FILE.name}: read this file, then every shard whose feature may be relevant",
+        "",
+        "metadata:",
+        f"  name: {metadata_name}",
+        f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f"  file_count: {file_count}",
+        f"  shard_count: {len(shards)}",
+        "",
+        "shards:",
+    ]
+    for name, summary in sorted(shards.items()):
+        lines.append(f"  {name}:")
+        lines.append(f"    file: {SHARDS_DIR.name}/{name}.yaml")
+        lines.append("    paths:")
+        for feature_path in sorted(summary['paths']):
+            lines.append(f"      - {yaml_escape(feature_path)}")
+        lines.append(f"    file_count: {summary['file_count']}")
+        for doc_type in sorted(TARGET_DIRS):
+            lines.append(f"    {doc_type}_count: {summary['doc_types'][doc_type]}")
+        keywords = sorted(summary['keywords'].items(), key=lambda item: (-item[1], item[0]))[:MANIFEST_KEYWORDS]
+        if keywords:
+            lines.append("    keywords:")
+            for keyword, _ in keywords:
+                lines.append(f"      - {yaml_escape(keyword)}")
+    return lines
 
-    lines.append("metadata:")
-    lines.append(f"  name: {metadata_name}")
-    lines.append(f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}")
-    lines.append(f"  file_count: {len(docs)}")
-    lines.append("")
 
-    # docs section
-    lines.append("docs:")
-    for file_path, entry in sorted(docs.items()):
-        lines.append(f"  {file_path}:")
-        for key in ['doc_type', 'title', 'purpose']:
-            if key in entry:
-                lines.append(f"    {key}: {yaml_escape(entry[key])}")
-        if 'content_details' in entry and entry['content_details']:
-            lines.append("    content_details:")
-            for item in entry['content_details']:
-                lines.append(f"      - {yaml_escape(item)}")
-        if 'applicable_tasks' in entry and entry['applicable_tasks']:
-            lines.append("    applicable_tasks:")
-            for task in entry['applicable_tasks']:
-                lines.append(f"      - {yaml_escape(task)}")
-        if 'keywords' in entry and entry['keywords']:
-            lines.append("    keywords:")
-            for kw in entry['keywords']:
-                lines.append(f"      - {yaml_escape(kw)}")
-        # references フィールド（空配列許容）
-        if 'references' in entry:
-            if entry['references']:
-                lines.append("    references:")
-                for ref in entry['references']:
-                    lines.append(f"      - {yaml_escape(ref)}")
-            else:
-                lines.append("    references: []")
+def write_shards():
+    """
+    Split specs_toc.yaml into shards/<feature>.yaml and write the manifest
+
+    Shard entries are copied verbatim from specs_toc.yaml; shards whose bytes
+    are unchanged are not rewritten, shards of features that no longer exist
+    are removed. The per-shard summaries come from the parsed ToC (sidecar).
 
+    Returns:
+        bool: True on success, False on failure
+    """
+    shards = {}
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines) + '\n')
+        for file_path, block in iter_toc_blocks(OUTPUT_FILE):
+            name, feature_path = get_shard(file_path)
+            summary = shards.setdefault(name, {
+                'paths': set(), 'file_count': 0, 'doc_types': Counter(), 'keywords': Counter(), 'lines': []})
+            summary['paths'].add(feature_path)
+            summary['file_count'] += 1
+            summary['lines'].extend(block)
+        for file_path, entry in read_toc_entries(OUTPUT_FILE):
+            summary = shards[get_shard(file_path)[0]]
+            summary['doc_types'][entry.get('doc_type', '')] += 1
+            summary['keywords'].update(entry.get('keywords') or [])
+    except (IOError, OSError, PermissionError, UnicodeDecodeError, ValueError) as e:
+        print(f"Error: Failed to read {OUTPUT_FILE} for sharding: {e}")
+        return False
+
+    written = 0
+    try:
+        SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+        for name, summary in shards.items():
+            shard_file = SHARDS_DIR / f"{name}.yaml"
+            content = '\n'.join(format_shard_header_lines(name, summary['file_count'])) + '\n' + ''.join(summary['lines'])
+            try:
+                if shard_file.read_text(encoding='utf-8') == content:
+                    continue
+            except (OSError, UnicodeDecodeError):
+                pass
+            with atomic_write(shard_file) as f:
+                f.write(content)
+            written += 1
+        removed = [f for f in SHARDS_DIR.glob('*.yaml') if f.stem not in shards]
+        for shard_file in removed:
+            shard_file.unlink()
+        with atomic_write(MANIFEST_FILE) as f:
+            f.write('\n'.join(format_manifest_lines(shards, sum(s['file_count'] for s in shards.values()))) + '\n')
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Error: Failed to write shards: {e}")
+        return False
+
+    print(f"Shards: {len(shards)} ({written} written, {len(shards) - written} unchanged, "
+          f"{len(removed)} removed) -> {SHARDS_DIR}")
+    return True
+
+
+def remove_shards():
+    """
+    Remove the manifest and shards/ left by an earlier merge with specs.output.shards: true
+
+    The specs-advisor reads the manifest whenever it exists, so a stale one
+    would hide every later merge. The manifest goes first: a failure after
+    it never leaves a manifest pointing at removed shards.
+
+    Returns:
+        bool: True on success (also when there is nothing to remove), False on failure
+    """
+    if not MANIFEST_FILE.exists() and not SHARDS_DIR.exists():
         return True
+    try:
+        MANIFEST_FILE.unlink(missing_ok=True)
+        removed = list(SHARDS_DIR.glob('*.yaml')) if SHARDS_DIR.is_dir() else []
+        for shard_file in removed:
+            shard_file.unlink()
+        if SHARDS_DIR.is_dir() and not any(SHARDS_DIR.iterdir()):
+            SHARDS_DIR.rmdir()
     except (IOError, OSError, PermissionError) as e:
-        print(f"Error: Failed to write file: {output_path} - {e}")
+        print(f"Error: Failed to remove shards: {e}")
         return False
 
+    print(f"Shards disabled: removed {MANIFEST_FILE.name} and {len(removed)} shards")
+    return True
+
 
 def load_existing_toc(toc_path):
     """Load existing specs_toc.yaml"""
@@ -150,92 +392,65 @@ def load_existing_toc(toc_path):
         return {}
 
     try:
-        with open(toc_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except (IOError, OSError, PermissionError) as e:
+        # Shallow copy: merge adds/removes entries, the cached dict stays intact
+        return dict(cached_load(toc_path, read_toc_entries))
+    except (IOError, OSError, PermissionError, UnicodeDecodeError) as e:
         print(f"Warning: Failed to read {toc_path}: {e}")
         return {}
 
-    docs = {}
-    current_section = None
-    current_path = None
-    current_entry = {}
-    current_list = None
-    current_list_key = None
-
-    for line in content.split('\n'):
-        stripped = line.strip()
-
-        if stripped.startswith('#') or not stripped:
-            continue
-
-        if stripped == 'docs:':
-            current_section = 'docs'
-            continue
-        elif stripped.startswith('metadata:'):
-            current_section = 'metadata'
-            continue
-
-        if current_section == 'docs':
-            # Detect file path as key (e.g., main/requirements/app.md:)
-            # Unicode-safe: 2-space indent (not 4-space) and .md: suffix
-            if line.startswith('  ') and not line.startswith('    ') and stripped.endswith('.md:'):
-                if current_path and current_entry:
-                    docs[current_path] = current_entry
-                current_path = stripped.rstrip(':')
-                current_entry = {}
-                current_list = None
-                current_list_key = None
-            elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
-                if current_path:
-                    key, _, val = stripped.partition(':')
-                    key = key.strip()
-                    val = val.strip().strip('"\'')
-                    if val == '[]':
-                        # Inline empty array (e.g., "references: []")
-                        current_list = []
-                        current_list_key = key
-                        current_entry[key] = current_list
-                    elif val:
-                        current_entry[key] = val
-                    else:
-                        current_list = []
-                        current_list_key = key
-                        current_entry[key] = current_list
-            elif stripped.startswith('- ') and current_list is not None:
-                item = stripped[2:].strip().strip('"\'')
-                current_list.append(item)
-
-    if current_path and current_entry:
-        docs[current_path] = current_entry
-
-    return docs
-
-
-def is_target_dir(filepath):
-    """Check if file is under target directory"""
-    rel_path = normalize_path(filepath.relative_to(SPECS_DIR))
-    parts = rel_path.split('/')
-    # パスのどこかに target_dirs のディレクトリ名が含まれるかチェック
-    # e.g., main/requirements/app.md → ['main', 'requirements', 'app.md']
-    #       → 'requirements' in target_dir_names → True
-    target_dir_names = TARGET_DIRS.values()
-    return any(part in target_dir_names for part in parts)
-
-
-def get_existing_files():
-    """Get list of currently existing files with SPECS_DIR prefix (symlink-aware)"""
-    files = set()
-    for filepath in rglob_follow_symlinks(SPECS_DIR, "**/*.md"):
-        if should_exclude(filepath, SPECS_DIR, EXCLUDE_PATTERNS):
-            continue
-        if not is_target_dir(filepath):
-            continue
-        rel_path = normalize_path(filepath.relative_to(SPECS_DIR))
-        # Include SPECS_DIR prefix for project-relative path
-        prefixed_path = f"{SPECS_DIR_NAME}/{rel_path}"
-        files.add(prefixed_path)
-    return files
+
+def get_existing_files(reuse_scan=True):
+    """
+    Get set of currently existing target files with SPECS_DIR prefix (symlink-aware)
+
+    Reuses the Phase 1 scan result (.toc_work/.scan.json) when it matches
+    the current settings and no scanned directory changed since
+    (load_scan_result()), otherwise scans the tree.
+
+    Args:
+        reuse_scan: False to always scan (--delete-only: Phase 1 saves no scan
+            result for a deletion-only change, a .scan.json is from an earlier cycle)
+    """
+    fingerprint = get_scan_fingerprint('specs', SPECS_DIR, EXCLUDE_MATCHER, target_dirs=TARGET_DIRS)
+    scan = load_scan_result(TOC_WORK_DIR / SCAN_RESULT_FILENAME, fingerprint) if reuse_scan else None
+    if scan is None:
+        dir_cache = open_dir_cache(CHECKSUMS_FILE)
+        scan = toc_scan('specs', SPECS_DIR, SPECS_DIR_NAME, EXCLUDE_MATCHER, target_dirs=TARGET_DIRS, dir_cache=dir_cache)
+        if dir_cache is not None:
+            print(dir_cache.summary())
+    else:
+        print(f"Using Phase 1 scan result: {len(scan)} files")
+    return scan.source_files()
+
+
+def was_schema_checked(toc_path):
+    """
+    True if every entry of the existing ToC passed the current entry schema
+
+    Read from the sidecar header written with the ToC; a ToC written by an
+    older version or edited by hand counts as unchecked.
+    """
+    header = load_toc_sidecar_header(toc_path)
+    return header is not None and header.get('schema_version') == SCHEMA_VERSION
+
+
+def check_entry_schema(filename, meta, entry, errors):
+    """
+    Check a completed entry unless its _meta.schema_stamp is intact (toc_schema.py)
+
+    Entries stamped by write_specs_pending.py were checked at write time and
+    are trusted; others (older writers, hand edits) get the ToC format check.
+    Problems are added to errors as warnings; the entry is still merged.
+
+    Returns:
+        str: 'stamped', 'checked' or 'invalid'
+    """
+    if has_intact_stamp('specs', meta, entry):
+        return 'stamped'
+    problems = CHECK_ENTRY(entry)
+    for problem in problems:
+        errors.append(f"{filename}: {describe_problem(problem)}")
+    return 'invalid' if problems else 'checked'
 
 
 def delete_only_mode():
@@ -249,12 +464,13 @@ def delete_only_mode():
     # Create backup
     backup_existing_file(OUTPUT_FILE)
 
-    # Load existing data
+    # Load existing data (deleting entries keeps a schema-checked ToC checked)
     docs = load_existing_toc(OUTPUT_FILE)
+    schema_checked = was_schema_checked(OUTPUT_FILE)
 
     # Delete entries that exist in checksums but file doesn't exist
     checksum_files = load_checksums(CHECKSUMS_FILE)
-    existing_files = get_existing_files()
+    existing_files = get_existing_files(reuse_scan=False)
     deleted_files = checksum_files - existing_files
 
     deleted_count = 0
@@ -275,21 +491,44 @@ def delete_only_mode():
         print("No entries to delete")
         return True
 
-    if not write_yaml_output(docs, OUTPUT_FILE):
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
         return False
 
     print(f"\nDeletion complete: {deleted_count} entries deleted")
     return True
 
 
+def load_work_db_entries():
+    """
+    Load all entries of .toc_work/work.db (common.work.db)
+
+    Returns:
+        dict: {entry name: (meta, entry)}; empty if there is no work.db
+    """
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR)
+        if work_db is None:
+            return {}
+        try:
+            return {name: (meta, entry) for name, meta, entry in work_db.entries()}
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Failed to read work.db: {e}")
+        return {}
+
+
 def merge_toc_files(mode='full'):
-    yaml_files = sorted(f for f in TOC_WORK_DIR.glob("*.yaml") if not f.name.startswith('.'))
+    # work.db rows plus any per-file YAMLs (e.g. exported or written by the watcher)
+    db_entries = load_work_db_entries()
+    yaml_files = {f.name: f for f in TOC_WORK_DIR.glob("*.yaml") if not f.name.startswith('.')}
+    entry_names = sorted(set(db_entries) | set(yaml_files))
 
-    if not yaml_files:
+    if not entry_names:
         print(f"Error: No YAML files found in {TOC_WORK_DIR}")
         return False
 
-    print(f"Target files: {len(yaml_files)}")
+    print(f"Target files: {len(entry_names)}")
     print(f"Mode: {mode}")
 
     # Create backup (common to all modes)
@@ -298,25 +537,16 @@ def merge_toc_files(mode='full'):
     # Get current valid files (exclude/target_dir applied)
     existing_files = get_existing_files()
 
-    # In incremental mode, load existing data
-    if mode == 'incremental':
-        docs = load_existing_toc(OUTPUT_FILE)
-        # Delete entries that exist in checksums but file doesn't exist
-        checksum_files = load_checksums(CHECKSUMS_FILE)
-        deleted_files = checksum_files - existing_files
-        for del_file in deleted_files:
-            if del_file in docs:
-                del docs[del_file]
-                print(f"  Deleted: {del_file}")
-    else:
-        docs = {}
-
+    changes = {}
     errors = []
+    schema_results = Counter()
 
-    for filepath in yaml_files:
-        filename = filepath.name
+    for filename in entry_names:
         try:
-            meta, entry = load_entry_file(filepath)
+            if filename in db_entries:
+                meta, entry = db_entries[filename]
+            else:
+                meta, entry = load_entry_file(yaml_files[filename])
             source_file = meta.get('source_file')
             status = meta.get('status')
             doc_type = meta.get('doc_type')
@@ -334,33 +564,45 @@ def merge_toc_files(mode='full'):
                 errors.append(f"{filename}: Skipped (excluded or missing: {source_file})")
                 continue
 
-            # Add doc_type to entry
+            # Add doc_type to entry (part of the stamped fields)
             entry['doc_type'] = doc_type
+            schema_results[check_entry_schema(filename, meta, entry, errors)] += 1
 
-            # Add to docs (key is file path)
-            docs[source_file] = entry
+            # Add to changes (key is file path)
+            changes[source_file] = entry
             print(f"  {source_file}")
 
         except Exception as e:
             errors.append(f"{filename}: {e}")
 
-    # Remove stale entries not in current valid files
-    if mode == 'incremental':
-        stale_entries = [p for p in docs if p not in existing_files]
-        for stale in stale_entries:
-            del docs[stale]
-            print(f"  Deleted (stale): {stale}")
-
     if errors:
         print("\nWarnings:")
         for err in errors:
             print(f"  - {err}")
+    print(f"Schema: {schema_results['stamped']} stamped at write time, "
+          f"{schema_results['checked'] + schema_results['invalid']} checked, {schema_results['invalid']} invalid")
+
+    # The ToC is schema-checked if every entry is: the new ones and, when kept, the existing ones
+    schema_checked = schema_results['invalid'] == 0
+    if mode == 'incremental' and OUTPUT_FILE.exists():
+        schema_checked = schema_checked and was_schema_checked(OUTPUT_FILE)
+        # Entries in checksums whose file no longer exists
+        deleted_files = load_checksums(CHECKSUMS_FILE) - existing_files
+        result = splice_toc(changes, existing_files, deleted_files, schema_checked)
+        if result is not None:
+            return result
+
+    # Full rewrite: full mode, no existing ToC, or a ToC that cannot be spliced
+    docs = {}
+    if mode == 'incremental':
+        docs = {p: e for p, e in load_existing_toc(OUTPUT_FILE).items() if p in existing_files}
+    docs.update(changes)
 
     if not docs:
         print("Error: No valid entries")
         return False
 
-    if not write_yaml_output(docs, OUTPUT_FILE):
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
         return False
 
     print(f"\nGeneration complete: {OUTPUT_FILE}")
@@ -386,16 +628,29 @@ def main():
     print("specs_toc.yaml Merge Script")
     print("=" * 50)
 
-    if delete_only:
-        success = delete_only_mode()
-    else:
-        success = merge_toc_files(mode)
+    # Serialize with Phase 1 / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(OUTPUT_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        if delete_only:
+            success = delete_only_mode()
+        else:
+            success = merge_toc_files(mode)
+
+        if success and OUTPUT_CONFIG.get('shards', False):
+            success = write_shards()
+        elif success:
+            success = remove_shards()
 
-    if success and cleanup:
-        cleanup_work_dir(TOC_WORK_DIR)
+        if success and cleanup:
+            cleanup_work_dir(TOC_WORK_DIR)
+    finally:
+        lock.release()
 
     return 0 if success else 1
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    exit_code = delegate_to_server('merge', 'specs')
+    sys.exit(main() if exit_code is None else exit_code)
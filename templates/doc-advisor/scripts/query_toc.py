@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# doc-advisor-version-xK9XmQ: {{DOC_ADVISOR_VERSION}}
+"""
+ToC query CLI: ranked candidate paths from the inverted keyword index
+
+Usage:
+    python3 .claude/doc-advisor/scripts/query_toc.py search --target rules|specs [options] QUERY ...
+    python3 .claude/doc-advisor/scripts/query_toc.py rank --target rules|specs [options] QUERY ...
+    python3 .claude/doc-advisor/scripts/query_toc.py refs --target rules|specs [options] PATH ...
+
+Commands:
+    search      Entries containing the query's tokens: most distinct tokens
+                matched first, then by weight (keywords 3, title 2,
+                applicable_tasks 1, purpose 1, content_details 1)
+    rank        Top entries by BM25 relevance to the query, e.g. the task
+                description as written: rare tokens weigh most, so entries
+                sharing only some of its words still rank
+    refs        Documents within --hops reference links of the given ToC
+                paths (e.g. the designs of a requirement and what they
+                reference), with their distance
+
+Options:
+    --target      rules or specs (required)
+    --limit N     Maximum candidates to print (search default: 30, rank default: 10, 0: all)
+    --doc-type T  Only entries with doc_type T (specs: requirement, design;
+                  refs: links are followed through all entries, the given paths are always listed)
+    --json        Print {query, terms, total, results: [{path, score, ...}]}
+                  (refs: {seeds, hops, direction, results: [{path, doc_type, distance}]})
+    --hops N      refs: links to follow (default: 1, 0: the given paths only)
+    --direction D refs: out (documents they reference), in (documents
+                  referencing them) or both (default)
+
+Tokens are NFKC-normalized and case-folded words; Japanese/CJK text is
+split into overlapping bigrams, so "ログイン画面" also matches "ログイン".
+
+The index (<toc>.index.json) and the reference graph (<toc>.graph.json)
+next to the ToC are written by merge_*_toc.py; an incremental merge leaves
+them out. When one is missing or does not match the ToC (incremental merge,
+hand-edited ToC), it is rebuilt from the ToC, saved for the next query and
+a note is printed. References that do not name a ToC entry
+(abstract descriptions, other files) are not part of the graph.
+
+Run from: Project root
+"""
+
+import argparse
+import json
+import sys
+
+from toc_utils import (
+    get_project_root,
+    load_config,
+    resolve_config_path,
+    cached_load,
+    TocIndex,
+    TocGraph,
+    build_toc_derived,
+    get_toc_index_path,
+    get_toc_graph_path,
+    delegate_to_server,
+)
+
+DEFAULT_LIMIT = 30
+DEFAULT_RANK_LIMIT = 10
+DEFAULT_HOPS = 1
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Query the ToC keyword index')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--target', choices=('rules', 'specs'), required=True)
+    common.add_argument('--doc-type')
+    common.add_argument('--json', action='store_true')
+    commands = parser.add_subparsers(dest='command', required=True)
+    search = commands.add_parser('search', parents=[common], help='Ranked candidates for the query tokens')
+    search.add_argument('--limit', type=int, default=DEFAULT_LIMIT)
+    search.add_argument('query', nargs='+')
+    rank = commands.add_parser('rank', parents=[common], help='Top entries by BM25 relevance')
+    rank.add_argument('--limit', type=int, default=DEFAULT_RANK_LIMIT)
+    rank.add_argument('query', nargs='+')
+    refs = commands.add_parser('refs', parents=[common], help='k-hop reference neighborhood of ToC paths')
+    refs.add_argument('--hops', type=int, default=DEFAULT_HOPS)
+    refs.add_argument('--direction', choices=TocGraph.DIRECTIONS, default='both')
+    refs.add_argument('paths', nargs='+')
+    return parser.parse_args()
+
+
+def get_toc_file(target):
+    """
+    ToC file of a target from config.yaml
+
+    Returns:
+        Path or None: None (error printed) when the config cannot be loaded
+    """
+    try:
+        config = load_config(target)
+        project_root = get_project_root()
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        return None
+    root_dir = project_root / config.get('root_dir', target).rstrip('/')
+    return resolve_config_path(config.get('toc_file', f'{target}_toc.yaml'), root_dir, project_root)
+
+
+def load_index(toc_path):
+    """
+    Load the ToC's index, rebuilding and saving it when missing or stale
+
+    An incremental merge does not write the index (see write_toc_caches()),
+    so the first query after it rebuilds the index here.
+
+    Returns:
+        tuple: (TocIndex, rebuilt)
+
+    Raises:
+        OSError / UnicodeDecodeError: When the ToC cannot be read for a rebuild
+    """
+    index = TocIndex.load(toc_path)
+    if index is not None:
+        return index, False
+    index, _ = build_toc_derived(toc_path, TocIndex, get_toc_index_path(toc_path))
+    return index, True
+
+
+def load_graph(toc_path):
+    """
+    Load the ToC's reference graph, rebuilding and saving it when missing or stale
+
+    Like the index, an incremental merge leaves the graph to its first use.
+
+    Returns:
+        tuple: (TocGraph, rebuilt)
+
+    Raises:
+        OSError / UnicodeDecodeError: When the ToC cannot be read for a rebuild
+    """
+    graph = TocGraph.load(toc_path)
+    if graph is not None:
+        return graph, False
+    graph, _ = build_toc_derived(toc_path, TocGraph, get_toc_graph_path(toc_path))
+    return graph, True
+
+
+def open_index(target, loader=load_index):
+    """
+    Index (or, with loader=load_graph, reference graph) of a target's ToC for a command
+
+    Returns:
+        tuple: (toc_path, TocIndex or TocGraph, rebuilt), or None (error printed)
+    """
+    toc_path = get_toc_file(target)
+    if toc_path is None:
+        return None
+    if not toc_path.exists():
+        print(f"Error: {toc_path} does not exist (run the ToC generation first)")
+        return None
+    try:
+        index, rebuilt = cached_load(toc_path, loader)
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Error: Failed to read {toc_path}: {e}")
+        return None
+    return toc_path, index, rebuilt
+
+
+def print_rebuilt_note(toc_path, what='index'):
+    print(f"Note: {toc_path.name} {what} missing or outdated, rebuilt from the ToC")
+
+
+def search_main(args):
+    opened = open_index(args.target)
+    if opened is None:
+        return 1
+    toc_path, index, rebuilt = opened
+
+    query = ' '.join(args.query)
+    results, terms = index.search(query, doc_type=args.doc_type)
+    shown = results[:args.limit] if args.limit > 0 else results
+
+    if args.json:
+        print(json.dumps({
+            'query': query,
+            'terms': terms,
+            'total': len(results),
+            'results': [{'path': path, 'score': score, 'matched': matched} for path, score, matched in shown],
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    if rebuilt:
+        print_rebuilt_note(toc_path)
+    print(f"Query: {query} ({terms} terms) -> {len(results)} of {len(index)} entries")
+    for path, score, matched in shown:
+        print(f"{matched}/{terms}\t{score}\t{path}")
+    if len(shown) < len(results):
+        print(f"... {len(results) - len(shown)} more (--limit 0 for all)")
+    return 0
+
+
+def rank_main(args):
+    opened = open_index(args.target)
+    if opened is None:
+        return 1
+    toc_path, index, rebuilt = opened
+
+    query = ' '.join(args.query)
+    results, total, terms = index.rank(query, limit=max(args.limit, 0), doc_type=args.doc_type)
+
+    if args.json:
+        print(json.dumps({
+            'query': query,
+            'terms': terms,
+            'total': total,
+            'results': [{'path': path, 'score': round(score, 4)} for path, score in results],
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    if rebuilt:
+        print_rebuilt_note(toc_path)
+    print(f"Query: {query} ({terms} terms) -> {total} of {len(index)} entries scored")
+    for path, score in results:
+        print(f"{score:.3f}\t{path}")
+    if len(results) < total:
+        print(f"... {total - len(results)} more (--limit 0 for all)")
+    return 0
+
+
+def refs_main(args):
+    opened = open_index(args.target, load_graph)
+    if opened is None:
+        return 1
+    toc_path, graph, rebuilt = opened
+
+    unknown = [path for path in args.paths if path not in graph.ids()]
+    if unknown:
+        for path in unknown:
+            print(f"Error: Not in {toc_path.name}: {path}")
+        return 1
+    results = graph.expand(args.paths, hops=max(args.hops, 0), direction=args.direction)
+    if args.doc_type is not None:
+        results = [result for result in results if result[2] == 0 or result[1] == args.doc_type]
+
+    if args.json:
+        print(json.dumps({
+            'seeds': args.paths,
+            'hops': args.hops,
+            'direction': args.direction,
+            'results': [{'path': path, 'doc_type': doc_type, 'distance': distance}
+                        for path, doc_type, distance in results],
+        }, ensure_ascii=False, indent=2))
+        return 0
+
+    if rebuilt:
+        print_rebuilt_note(toc_path, 'reference graph')
+    print(f"Seeds: {len(args.paths)}, hops: {args.hops}, direction: {args.direction} -> {len(results)} documents")
+    for path, doc_type, distance in results:
+        print(f"{distance}\t{doc_type}\t{path}")
+    return 0
+
+
+def main():
+    args = parse_args()
+    if args.command == 'search':
+        return search_main(args)
+    if args.command == 'rank':
+        return rank_main(args)
+    if args.command == 'refs':
+        return refs_main(args)
+    return 1
+
+
+if __name__ == '__main__':
+    exit_code = delegate_to_server('query_toc')
+    sys.exit(main() if exit_code is None else exit_code)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# doc-advisor-version-xK9XmQ: {{DOC_ADVISOR_VERSION}}
+"""
+Long-lived ToC server: runs ToC script calls in one process over a Unix socket
+
+Usage:
+    python3 .claude/doc-advisor/scripts/serve_toc.py            (serve until --stop / SIGTERM)
+    python3 .claude/doc-advisor/scripts/serve_toc.py --status
+    python3 .claude/doc-advisor/scripts/serve_toc.py --stop
+    python3 .claude/doc-advisor/scripts/serve_toc.py --query --target rules|specs [SOURCE_FILE ...]
+
+Options:
+    --status    Exit 0 if a server is listening, 1 otherwise
+    --stop      Ask the running server to exit
+    --query     Print ToC entries as JSON ({source_file: entry}; all entries without arguments).
+                Answered by the server when it is running, in-process otherwise
+
+While the server listens on .claude/doc-advisor/toc/.toc_serve.sock, these
+scripts send their arguments to it instead of starting their own work:
+
+    write_rules_pending.py / write_specs_pending.py   (write_entry)
+    merge_rules_toc.py / merge_specs_toc.py           (merge)
+    validate_rules_toc.py / validate_specs_toc.py     (validate)
+    create_checksums.py                               (checksums)
+    serve_toc.py --query                              (query)
+    query_toc.py search / rank / refs                 (query_toc)
+
+The server runs the same main() in-process with the client's arguments and
+returns its exit code and output, so results are identical either way.
+config.yaml, the parsed ToC, its keyword index, its reference graph and .toc_work/.scan.json stay
+in memory between calls and are re-read only when their stat signature
+changes. Calls are handled one at a time. Set DOC_ADVISOR_NO_SERVER=1 to bypass the server;
+restart it after running setup.sh.
+
+Protocol: one JSON request line per connection
+    {"call": ..., "target": "rules"|"specs"|null, "argv": [...], "cwd": ..., "stdin": ...}
+answered by one JSON line {"exit_code": N, "stdout": ..., "stderr": ...}
+or {"error": ...} (the client then runs the script in-process).
+A call interrupted by SIGTERM is answered with exit code 1 and the server exits.
+
+Run from: Project root
+"""
+
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+import traceback
+from contextlib import redirect_stderr, redirect_stdout
+
+from toc_utils import (
+    SERVE_SOCKET_PATH,
+    delegate_to_server,
+    enable_load_cache,
+    get_load_cache_stats,
+)
+
+import create_checksums
+import merge_rules_toc
+import merge_specs_toc
+import query_toc
+import validate_rules_toc
+import validate_specs_toc
+import write_rules_pending
+import write_specs_pending
+
+# Upper bound for a request line (write_entry --batch - forwards stdin)
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+# Client side of --status / --stop
+CONTROL_TIMEOUT = 5.0
+
+# Merge modules provide init_config(), OUTPUT_FILE and load_existing_toc()
+MERGE_MODULES = {
+    'rules': merge_rules_toc,
+    'specs': merge_specs_toc,
+}
+
+
+def parse_option(argv, name, default):
+    """Get the value following an option (default if absent, None if missing value)"""
+    if name not in argv:
+        return default
+    idx = argv.index(name)
+    return argv[idx + 1] if idx + 1 < len(argv) else None
+
+
+def query_main():
+    """
+    serve_toc.py --query: print ToC entries as JSON
+
+    Returns:
+        int: 0 on success, 1 on error (unknown target, missing ToC or source file)
+    """
+    target = parse_option(sys.argv, '--target', None)
+    if target not in MERGE_MODULES:
+        print("Error: --query requires --target rules or --target specs")
+        return 1
+    merge = MERGE_MODULES[target]
+    if not merge.init_config():
+        return 1
+    if not merge.OUTPUT_FILE.exists():
+        print(f"Error: {merge.OUTPUT_FILE} does not exist")
+        return 1
+
+    docs = merge.load_existing_toc(merge.OUTPUT_FILE)
+    idx = sys.argv.index('--target')
+    paths = [a for i, a in enumerate(sys.argv[1:], 1) if not a.startswith('--') and i != idx + 1]
+    if not paths:
+        result = docs
+    else:
+        missing = [p for p in paths if p not in docs]
+        if missing:
+            for path in missing:
+                print(f"Error: Not in {merge.OUTPUT_FILE.name}: {path}")
+            return 1
+        result = {p: docs[p] for p in paths}
+    print(json.dumps(result, ensure_ascii=False, indent=2, sort_keys=True))
+    return 0
+
+
+# {call: {target: main}}; None when the script parses --target itself
+CALLS = {
+    'write_entry': {'rules': write_rules_pending.main, 'specs': write_specs_pending.main},
+    'merge': {'rules': merge_rules_toc.main, 'specs': merge_specs_toc.main},
+    'validate': {'rules': validate_rules_toc.main, 'specs': validate_specs_toc.main},
+    'checksums': {None: create_checksums.main},
+    'query': {None: query_main},
+    'query_toc': {None: query_toc.main},
+}
+
+
+class ServerTerminated(BaseException):
+    """
+    Raised by the SIGTERM handler
+
+    A BaseException other than SystemExit, so neither the scripts nor
+    run_call() mistake it for a script exiting.
+    """
+
+
+def on_sigterm(signum, frame):
+    raise ServerTerminated()
+
+
+def run_call(func, argv, stdin):
+    """
+    Run a script main() with the client's argv/stdin, capturing its output
+
+    Returns:
+        dict: {exit_code, stdout, stderr}; 'terminated': True if SIGTERM
+            interrupted the call (exit_code 1, the server must stop)
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    terminated = False
+    saved_argv, saved_stdin = sys.argv, sys.stdin
+    sys.argv = [func.__module__ + '.py'] + argv
+    sys.stdin = io.StringIO(stdin)
+    try:
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                exit_code = func()
+            except SystemExit as e:  # argparse errors, explicit sys.exit()
+                exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                if isinstance(e.code, str):
+                    print(e.code, file=sys.stderr)
+            except ServerTerminated:
+                print("Error: ToC server terminated (SIGTERM) during the call; it did not complete",
+                      file=sys.stderr)
+                exit_code = 1
+                terminated = True
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+    finally:
+        sys.argv, sys.stdin = saved_argv, saved_stdin
+    response = {'exit_code': exit_code or 0, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue()}
+    if terminated:
+        response['terminated'] = True
+    return response
+
+
+class ToCServer(socketserver.UnixStreamServer):
+    """Single-threaded server: script modules keep per-call state in module globals"""
+
+    def __init__(self, path):
+        super().__init__(path, ToCRequestHandler)
+        self.cwd = os.path.realpath(os.getcwd())
+        self.started = time.time()
+        self.calls = 0
+
+
+class ToCRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline(MAX_REQUEST_BYTES))
+            response = self.dispatch(request)
+        except (ValueError, AttributeError, TypeError) as e:
+            response = {'error': f"Bad request: {e}"}
+        terminated = response.pop('terminated', False)
+        try:
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        except OSError:
+            pass  # Client went away
+        if terminated:
+            # Answered the interrupted call; now stop like --stop does
+            threading.Thread(target=self.server.shutdown).start()
+
+    def dispatch(self, request):
+        call = request.get('call')
+        if call == 'ping':
+            hits, loads = get_load_cache_stats()
+            return {'exit_code': 0, 'stdout': (
+                f"ToC server running: pid {os.getpid()}, {self.server.calls} calls, "
+                f"up {int(time.time() - self.server.started)}s, cache {hits} hits / {loads} loads\n")}
+        if call == 'shutdown':
+            # shutdown() waits for serve_forever() to return, so it cannot run on this thread
+            threading.Thread(target=self.server.shutdown).start()
+            return {'exit_code': 0, 'stdout': "ToC server stopped\n"}
+
+        funcs = CALLS.get(call)
+        if funcs is None:
+            return {'error': f"Unknown call: {call}"}
+        func = funcs.get(request.get('target'))
+        if func is None:
+            return {'error': f"Unknown target for {call}: {request.get('target')}"}
+        if os.path.realpath(request.get('cwd', '')) != self.server.cwd:
+            return {'error': f"Server runs in {self.server.cwd}"}
+        argv = request.get('argv', [])
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            return {'error': "argv must be a list of strings"}
+
+        self.server.calls += 1
+        return run_call(func, argv, request.get('stdin', ''))
+
+
+def control(call):
+    """
+    Send ping/shutdown to the running server
+
+    Returns:
+        int: 0 if the server answered, 1 if no server is running
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONTROL_TIMEOUT)
+    try:
+        sock.connect(SERVE_SOCKET_PATH)
+        sock.sendall(json.dumps({'call': call}).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline())
+    except (OSError, ValueError):
+        print("ToC server not running")
+        return 1
+    finally:
+        sock.close()
+    print(response.get('stdout', ''), end='')
+    return 0
+
+
+def serve():
+    if not os.path.isdir(os.path.dirname(SERVE_SOCKET_PATH)):
+        print(f"Error: {os.path.dirname(SERVE_SOCKET_PATH)} not found (run from the project root)")
+        return 1
+    if os.path.exists(SERVE_SOCKET_PATH):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(SERVE_SOCKET_PATH)
+            print("Error: ToC server already running")
+            return 1
+        except OSError:
+            os.unlink(SERVE_SOCKET_PATH)  # Stale socket of a crashed server
+        finally:
+            probe.close()
+
+    enable_load_cache()
+    # Socket is owner-only: requests run with this user's permissions
+    old_umask = os.umask(0o077)
+    try:
+        server = ToCServer(SERVE_SOCKET_PATH)
+    except OSError as e:
+        print(f"Error: Failed to listen on {SERVE_SOCKET_PATH}: {e}")
+        return 1
+    finally:
+        os.umask(old_umask)
+
+    # SIGTERM between calls unwinds through finally (socket removed); during a
+    # call run_call() answers it with exit code 1 and the server shuts down
+    signal.signal(signal.SIGTERM, on_sigterm)
+    sys.stdout.reconfigure(line_buffering=True)
+    print(f"ToC server listening on {SERVE_SOCKET_PATH} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, ServerTerminated):
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.unlink(SERVE_SOCKET_PATH)
+        except OSError:
+            pass
+    return 0
+
+
+def main():
+    if '--query' in sys.argv:
+        return query_main()
+    if '--status' in sys.argv:
+        return control('ping')
+    if '--stop' in sys.argv:
+        return control('shutdown')
+    return serve()
+
+
+if __name__ == "__main__":
+    exit_code = delegate_to_server('query') if '--query' in sys.argv else None
+    sys.exit(main() if exit_code is None else exit_code)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# doc-advisor-version-xK9XmQ: {{DOC_ADVISOR_VERSION}}
+"""
+Declarative schema of ToC entries (rules / specs)
+
+ENTRY_SCHEMAS lists every entry field per category once; compile_entry_check()
+turns it into a checker function for one of two levels:
+
+    'write'  write_*_pending.py: the authoring minimums (content_details and
+             keywords at least 5 items, applicable_tasks at least 1). An
+             entry that passes is stamped with _meta.schema_stamp (specs:
+             checked with _meta.doc_type, which merge copies into the entry).
+    'toc'    merge_*_toc.py (entries without an intact stamp) and
+             validate_*_toc.py: the ToC format rules (required strings, no
+             null, no empty arrays except references; specs_toc_format.md).
+
+The stamp is "v<SCHEMA_VERSION>-<hash of the entry fields>": it stays
+intact while the entry content is what the writer checked. Bump
+SCHEMA_VERSION whenever a rule below changes, so older stamps stop counting.
+"""
+
+import functools
+import hashlib
+import json
+from collections import namedtuple
+
+SCHEMA_VERSION = 1
+
+# kind: 'string' or 'list'. min_items/max_items apply to lists at the 'write'
+# level; at the 'toc' level a required list only needs one item.
+Field = namedtuple('Field', 'name kind required min_items max_items', defaults=(True, 0, None))
+
+_COMMON_FIELDS = (
+    Field('title', 'string'),
+    Field('purpose', 'string'),
+    Field('content_details', 'list', min_items=5),
+    Field('applicable_tasks', 'list', min_items=1),
+    Field('keywords', 'list', min_items=5),
+)
+
+ENTRY_SCHEMAS = {
+    'rules': _COMMON_FIELDS,
+    'specs': (Field('doc_type', 'string'),) + _COMMON_FIELDS + (
+        Field('references', 'list', required=False),
+    ),
+}
+
+# kind: 'missing', 'type', 'too_few' or 'too_many'; limit/count only for the item counts
+SchemaProblem = namedtuple('SchemaProblem', 'field kind limit count')
+
+
+@functools.lru_cache(maxsize=None)
+def compile_entry_check(category, level='toc'):
+    """
+    Build the entry checker of a category and level
+
+    The schema is flattened into tuples once per (category, level); the
+    returned function only does dict lookups and length checks.
+
+    Args:
+        category: 'rules' or 'specs'
+        level: 'write' or 'toc' (see the module docstring)
+
+    Returns:
+        function: check(entry) -> [SchemaProblem, ...] (empty when valid)
+    """
+    strings = []
+    lists = []
+    for field in ENTRY_SCHEMAS[category]:
+        if field.kind == 'string':
+            strings.append((field.name, field.required))
+        elif level == 'write':
+            lists.append((field.name, field.required, field.min_items, field.max_items))
+        else:
+            lists.append((field.name, field.required, min(field.min_items, 1), None))
+    strings = tuple(strings)
+    lists = tuple(lists)
+
+    def check(entry):
+        problems = []
+        for name, required in strings:
+            value = entry.get(name)
+            if value is None or value == '':
+                if required:
+                    problems.append(SchemaProblem(name, 'missing', None, None))
+            elif not isinstance(value, str):
+                problems.append(SchemaProblem(name, 'type', None, None))
+        for name, required, minimum, maximum in lists:
+            value = entry.get(name)
+            if value is None:
+                if required:
+                    problems.append(SchemaProblem(name, 'missing', None, None))
+            elif not isinstance(value, list):
+                problems.append(SchemaProblem(name, 'type', None, None))
+            elif len(value) < minimum:
+                problems.append(SchemaProblem(name, 'too_few', minimum, len(value)))
+            elif maximum is not None and len(value) > maximum:
+                problems.append(SchemaProblem(name, 'too_many', maximum, len(value)))
+        return problems
+
+    return check
+
+
+def describe_problem(problem):
+    """One-line English description of a SchemaProblem"""
+    if problem.kind == 'missing':
+        return f"Missing required field: {problem.field}"
+    if problem.kind == 'type':
+        return f"Invalid type: {problem.field}"
+    if problem.kind == 'too_few':
+        return f"{problem.field} requires at least {problem.limit} items (got {problem.count})"
+    return f"{problem.field} allows at most {problem.limit} items (got {problem.count})"
+
+
+def make_schema_stamp(category, entry):
+    """
+    Stamp for an entry that passed the 'write' check
+
+    Hashes the schema fields of the category (JSON, in schema order), so
+    any edit of the content or a schema version bump breaks the stamp.
+    """
+    payload = json.dumps([entry.get(field.name) for field in ENTRY_SCHEMAS[category]],
+                         ensure_ascii=False, separators=(',', ':'))
+    return f"v{SCHEMA_VERSION}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+def has_intact_stamp(category, meta, entry):
+    """True if _meta.schema_stamp matches the entry content and the current schema"""
+    stamp = meta.get('schema_stamp')
+    return bool(stamp) and stamp == make_schema_stamp(category, entry)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# doc-advisor-version-xK9XmQ: {{DOC_ADVISOR_VERSION}}
+"""
+Inspect and export the ToC work area (.toc_work/)
+
+Lists entries from .toc_work/work.db (common.work.db) and per-file
+.toc_work/*.yaml alike, and exports work.db to the per-file layout.
+
+Usage:
+    python3 toc_work.py --target rules|specs --list [--status pending|completed|error|all]
+    python3 toc_work.py --target rules|specs --export
+
+Options:
+    --list      Print one line per entry: <entry_file> TAB <source_file> TAB <status>
+                (default --status pending; entry_file is passed to the *-toc-updater subagent)
+    --export    Write every work.db row as .toc_work/<name>.yaml and remove work.db
+
+Run from: Project root
+"""
+
+import sqlite3
+import sys
+
+from toc_utils import get_project_root, load_config, resolve_config_path, load_entry_file, WorkDB, WORK_DB_FILENAME
+from toc_utils import acquire_toc_lock
+
+
+def get_work_dir(target):
+    """Resolve .toc_work/ and the ToC file of the target category"""
+    config = load_config(target)
+    project_root = get_project_root()
+    root_dir = project_root / config.get('root_dir', target).rstrip('/')
+    work_dir = resolve_config_path(config.get('work_dir', '.toc_work'), root_dir, project_root)
+    toc_file = resolve_config_path(config.get('toc_file', f'{target}_toc.yaml'), root_dir, project_root)
+    return project_root, work_dir, toc_file
+
+
+def collect_entries(work_dir):
+    """
+    Collect (name, source_file, status) of all entries
+
+    work.db rows take precedence over per-file YAMLs of the same name.
+    """
+    entries = {}
+    for path in sorted(work_dir.glob('*.yaml')):
+        if path.name.startswith('.'):
+            continue
+        try:
+            meta, _ = load_entry_file(path)
+        except IOError as e:
+            print(f"Warning: {e}", file=sys.stderr)
+            continue
+        entries[path.name] = (meta.get('source_file', ''), meta.get('status', ''))
+
+    work_db = WorkDB.open(work_dir)
+    if work_db is not None:
+        try:
+            for name, meta, _ in work_db.entries():
+                entries[name] = (meta['source_file'], meta['status'])
+        finally:
+            work_db.close()
+    return [(name, source_file, status) for name, (source_file, status) in sorted(entries.items())]
+
+
+def list_entries(project_root, work_dir, status):
+    for name, source_file, entry_status in collect_entries(work_dir):
+        if status != 'all' and entry_status != status:
+            continue
+        entry_file = work_dir / name
+        try:
+            entry_file = entry_file.relative_to(project_root)
+        except ValueError:
+            pass
+        print(f"{entry_file}\t{source_file}\t{entry_status}")
+    return 0
+
+
+def export_entries(work_dir, toc_file):
+    # .toc_work/ changes layout: serialize with Phase 1 / merge runs
+    lock = acquire_toc_lock(toc_file.parent)
+    if lock is None:
+        return 1
+    try:
+        work_db = WorkDB.open(work_dir)
+        if work_db is None:
+            print(f"Error: {work_dir / WORK_DB_FILENAME} does not exist")
+            return 1
+        count = work_db.export(work_dir)
+    finally:
+        lock.release()
+    print(f"Exported {count} entries to {work_dir}")
+    return 0
+
+
+def main():
+    target = None
+    if '--target' in sys.argv:
+        idx = sys.argv.index('--target')
+        target = sys.argv[idx + 1] if idx + 1 < len(sys.argv) else None
+    if target not in ('rules', 'specs'):
+        print("Error: --target must be rules or specs")
+        return 1
+
+    status = 'pending'
+    if '--status' in sys.argv:
+        idx = sys.argv.index('--status')
+        status = sys.argv[idx + 1] if idx + 1 < len(sys.argv) else None
+    if status not in ('pending', 'completed', 'error', 'all'):
+        print("Error: --status must be pending, completed, error or all")
+        return 1
+
+    try:
+        project_root, work_dir, toc_file = get_work_dir(target)
+    except (RuntimeError, FileNotFoundError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    try:
+        if '--export' in sys.argv:
+            return export_entries(work_dir, toc_file)
+        if '--list' in sys.argv:
+            return list_entries(project_root, work_dir, status)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+
+    print("Error: specify --list or --export")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,27 +7,50 @@ rules_toc.yaml 検査スクリプト
 生成された rules_toc.yaml の整合性を検査する。
 
 使用方法:
-    python3 validate_rules_toc.py [--file PATH]
+    python3 validate_rules_toc.py [--file PATH] [--timings]
 
 オプション:
-    --file    検査対象ファイル（デフォルト: .claude/doc-advisor/toc/rules/rules_toc.yaml）
+    --file     検査対象ファイル（デフォルト: .claude/doc-advisor/toc/rules/rules_toc.yaml）
+    --timings  検査段階ごとの処理時間を表示
 
 検査項目:
     1. YAML構文検査
-    2. 必須フィールド検査
-    3. ファイル参照検査
+    2. 必須フィールド検査（merge 時に検査済みの ToC は省略）
+    3. ファイル参照検査（merge と同じ条件の1回の走査結果と照合）
     4. 重複パス検査
 """
 
 import sys
 from pathlib import Path
 
-from toc_utils import get_project_root, load_config, resolve_config_path
+from toc_utils import (
+    get_project_root,
+    load_config,
+    resolve_config_path,
+    cached_load,
+    read_toc_entries,
+    get_system_exclude_patterns,
+    compile_exclude_patterns,
+    toc_scan,
+    open_dir_cache,
+    StageTimer,
+    load_toc_sidecar_header,
+    delegate_to_server,
+)
+from toc_schema import SCHEMA_VERSION, ENTRY_SCHEMAS, compile_entry_check
+
+# ToC フォーマットの必須フィールド検査（toc_schema.py）
+CHECK_ENTRY = compile_entry_check('rules', 'toc')
+STRING_FIELDS = {field.name for field in ENTRY_SCHEMAS['rules'] if field.kind == 'string'}
 
 # Global configuration (initialized in init_config())
 CONFIG = None
 PROJECT_ROOT = None
 RULES_DIR = None
+RULES_DIR_NAME = None
+CHECKSUMS_FILE = None
+TARGET_GLOB = None
+EXCLUDE_MATCHER = None
 DEFAULT_TOC_FILE = None
 
 
@@ -38,7 +61,8 @@ def init_config():
     Returns:
         bool: True on success, False on failure
     """
-    global CONFIG, PROJECT_ROOT, RULES_DIR, DEFAULT_TOC_FILE
+    global CONFIG, PROJECT_ROOT, RULES_DIR, RULES_DIR_NAME, CHECKSUMS_FILE, TARGET_GLOB, EXCLUDE_MATCHER
+    global DEFAULT_TOC_FILE
 
     try:
         CONFIG = load_config('rules')
@@ -50,76 +74,72 @@ def init_config():
         print(f"Error: {e}")
         return False
 
-    RULES_DIR = PROJECT_ROOT / CONFIG.get('root_dir', 'rules').rstrip('/')
+    RULES_DIR_NAME = CONFIG.get('root_dir', 'rules').rstrip('/')
+    RULES_DIR = PROJECT_ROOT / RULES_DIR_NAME
     DEFAULT_TOC_FILE = resolve_config_path(CONFIG.get('toc_file', 'rules_toc.yaml'), RULES_DIR, PROJECT_ROOT)
+    CHECKSUMS_FILE = resolve_config_path(CONFIG.get('checksums_file', '.toc_checksums.yaml'), RULES_DIR, PROJECT_ROOT)
+    # merge_rules_toc.py と同じ走査対象（target_glob + 除外パターン）
+    patterns_config = CONFIG.get('patterns', {})
+    TARGET_GLOB = patterns_config.get('target_glob', '**/*.md')
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('rules') + patterns_config.get('exclude', []))
     return True
 
 
 def load_existing_toc(toc_path):
-    """既存の rules_toc.yaml を読み込み"""
-    if not toc_path.exists():
-        return {}
+    """
+    既存の rules_toc.yaml を (パス, エントリ) のリストとして読み込み
+    （重複キーも保持。merge が書いたサイドカーが最新ならテキストをパースしない）
 
-    try:
-        with open(toc_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except (IOError, OSError, PermissionError) as e:
-        print(f"Warning: Failed to read {toc_path}: {e}")
-        return {}
-
-    docs = {}
-    current_file = None
-    current_entry = {}
-    current_list = None
-    in_docs = False
-
-    for line in content.split('\n'):
-        stripped = line.strip()
-
-        if stripped.startswith('#') or not stripped:
-            continue
-
-        if stripped == 'docs:':
-            in_docs = True
-            continue
-
-        if not in_docs:
-            continue
-
-        # ファイルパスの検出（2スペースインデントで : で終わる）
-        if line.startswith('  ') and not line.startswith('    ') and stripped.endswith(':'):
-            if current_file and current_entry:
-                docs[current_file] = current_entry
-            current_file = stripped.rstrip(':')
-            current_entry = {}
-            current_list = None
-        elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
-            if current_file:
-                key, _, val = stripped.partition(':')
-                key = key.strip()
-                val = val.strip().strip('"\'')
-                if val:
-                    current_entry[key] = val
-                else:
-                    current_list = []
-                    current_entry[key] = current_list
-        elif stripped.startswith('- ') and current_list is not None:
-            item = stripped[2:].strip().strip('"\'')
-            current_list.append(item)
-
-    if current_file and current_entry:
-        docs[current_file] = current_entry
-
-    return docs
-
-
-def validate_toc(toc_path):
+    Raises:
+        OSError / UnicodeDecodeError: 読み込み失敗時
+    """
+    return cached_load(toc_path, read_toc_entries)
+
+
+def get_existing_files():
+    """
+    走査対象の既存ファイル集合（RULES_DIR プレフィックス付き）
+
+    merge_rules_toc.py と同じ条件（target_glob + 除外パターン、除外ディレクトリは
+    降りない）で一度だけ走査する。Phase 1 の .scan.json はその後の削除を反映しない
+    ため使わない（common.scan.dir_cache が有効なら変更のないディレクトリは読まない）。
+    """
+    dir_cache = open_dir_cache(CHECKSUMS_FILE)
+    scan = toc_scan('rules', RULES_DIR, RULES_DIR_NAME, EXCLUDE_MATCHER, target_glob=TARGET_GLOB, dir_cache=dir_cache)
+    return scan.source_files()
+
+
+def is_schema_checked(toc_path):
+    """
+    ToC の全エントリが merge 時に現行スキーマで検査済みか
+
+    merge_rules_toc.py がサイドカーのヘッダーに記録した schema_version を見る。
+    ToC が手で編集された（サイドカーが古い）場合や --file の別ファイルは False。
+    """
+    header = load_toc_sidecar_header(toc_path)
+    return header is not None and header.get('schema_version') == SCHEMA_VERSION
+
+
+def field_error(file_path, problem):
+    """スキーマ検査の問題（toc_schema.SchemaProblem）をエラーメッセージに変換"""
+    if problem.field in STRING_FIELDS and problem.kind == 'type':
+        return f"必須フィールド不正: '{file_path}' の '{problem.field}' が文字列ではありません"
+    if problem.field in STRING_FIELDS:
+        return f"必須フィールド欠落: '{file_path}' に '{problem.field}' がありません"
+    return f"必須配列フィールド不正: '{file_path}' の '{problem.field}' が未設定または空配列です"
+
+
+def validate_toc(toc_path, timings=False):
     """
     生成された toc ファイルを検査する
     - YAML構文検査
     - 必須フィールド検査
     - ファイル参照検査
     - 重複パス検査
+
+    Args:
+        timings: True なら検査段階ごとの処理時間を最後に表示
     """
     print("=" * 50)
     print("rules_toc.yaml 検査")
@@ -127,41 +147,50 @@ def validate_toc(toc_path):
     print(f"対象: {toc_path}")
     print()
 
+    timer = StageTimer()
+    success = run_checks(toc_path, timer)
+    if timings:
+        print()
+        print("処理時間:")
+        print("\n".join(timer.format_lines('合計')))
+    return success
+
+
+def run_checks(toc_path, timer):
+    """validate_toc() の検査本体（各段階を timer で計測）"""
     errors = []
 
     # 1. YAML構文検査（ファイルが読み込めるか）
     try:
-        with open(toc_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        with timer.stage('YAML構文検査'):
+            entries = load_existing_toc(toc_path)
         print("✓ YAML構文検査: OK（ファイル読み込み成功）")
-    except Exception as e:
+    except (OSError, UnicodeDecodeError) as e:
         errors.append(f"YAML構文検査: ファイル読み込み失敗 - {e}")
         print(f"\n❌ 検査失敗: {len(errors)} 件のエラー")
         for err in errors:
             print(f"  - {err}")
         return False
 
-    # パース
-    docs = load_existing_toc(toc_path)
+    # 重複キーは後勝ち（4. で検出）
+    docs = dict(entries)
 
     # 2. 必須フィールド検査
     # title/purpose が必須（文字列）
     # content_details/applicable_tasks/keywords が必須（非空配列）
     # フォーマット定義: No null, No empty arrays (rules_toc_format.md)
-    required_string_fields = ['title', 'purpose']
-    required_array_fields = ['content_details', 'applicable_tasks', 'keywords']
+    # merge 時に全エントリを検査済みの ToC（サイドカーに記録）は再検査しない
     field_errors = []
 
-    for filepath, entry in docs.items():
-        for field in required_string_fields:
-            if not entry.get(field):
-                field_errors.append(f"必須フィールド欠落: '{filepath}' に '{field}' がありません")
-        for field in required_array_fields:
-            value = entry.get(field)
-            if not isinstance(value, list) or len(value) == 0:
-                field_errors.append(f"必須配列フィールド不正: '{filepath}' の '{field}' が未設定または空配列です")
+    with timer.stage('必須フィールド検査'):
+        schema_checked = is_schema_checked(toc_path)
+        if not schema_checked:
+            for filepath, entry in docs.items():
+                field_errors.extend(field_error(filepath, problem) for problem in CHECK_ENTRY(entry))
 
-    if not field_errors:
+    if schema_checked:
+        print(f"✓ 必須フィールド検査: OK（{len(docs)}件のエントリ、merge 時に検査済み）")
+    elif not field_errors:
         print(f"✓ 必須フィールド検査: OK（{len(docs)}件のエントリ）")
     else:
         print(f"✗ 必須フィールド検査: {len(field_errors)}件のエラー")
@@ -169,11 +198,14 @@ def validate_toc(toc_path):
 
     # 3. ファイル参照検査
     # キーはプロジェクトルートからの相対パス（例: rules/core/architecture_rule.md）
+    # 1回の走査で得た集合と照合し、集合にないキー（除外パターン対象など）だけディスクを確認
+    with timer.stage('ディレクトリ走査'):
+        existing_files = get_existing_files()
     file_errors = []
-    for filepath in docs.keys():
-        full_path = PROJECT_ROOT / filepath
-        if not full_path.exists():
-            file_errors.append(f"ファイル不在: '{filepath}' が存在しません")
+    with timer.stage('ファイル参照検査'):
+        for filepath in docs.keys():
+            if filepath not in existing_files and not (PROJECT_ROOT / filepath).exists():
+                file_errors.append(f"ファイル不在: '{filepath}' が存在しません")
 
     if not file_errors:
         print(f"✓ ファイル参照検査: OK（全ファイルが存在）")
@@ -181,8 +213,20 @@ def validate_toc(toc_path):
         print(f"✗ ファイル参照検査: {len(file_errors)}件のエラー")
         errors.extend(file_errors)
 
-    # 4. 重複パス検査（辞書なので本質的に重複はないが確認）
-    print(f"✓ 重複パス検査: OK（{len(docs)}件のユニークパス）")
+    # 4. 重複パス検査（パーサは重複キーもそのまま返す）
+    seen = set()
+    duplicates = []
+    with timer.stage('重複パス検査'):
+        for filepath, _ in entries:
+            if filepath in seen:
+                duplicates.append(f"重複パス: '{filepath}' が複数回定義されています")
+            seen.add(filepath)
+
+    if not duplicates:
+        print(f"✓ 重複パス検査: OK（{len(docs)}件のユニークパス）")
+    else:
+        print(f"✗ 重複パス検査: {len(duplicates)}件の重複")
+        errors.extend(duplicates)
 
     # 結果サマリー
     print()
@@ -213,9 +257,10 @@ def main():
         print(f"エラー: ファイルが存在しません: {toc_path}")
         return 1
 
-    success = validate_toc(toc_path)
+    success = validate_toc(toc_path, timings='--timings' in sys.argv)
     return 0 if success else 1
 
 
 if __name__ == '__main__':
-    sys.exit(main())
+    exit_code = delegate_to_server('validate', 'rules')
+    sys.exit(main() if exit_code is None else exit_code)
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+# doc-advisor-version-xK9XmQ: {{DOC_ADVISOR_VERSION}}
+"""
+Keep Phase 1 output (.toc_work/ pending YAMLs + checksum snapshot) up to date in the background
+
+Usage:
+    python3 .claude/doc-advisor/scripts/watch_toc.py [--target rules|specs|all] [--interval SEC] [--poll] [--once]
+    python3 .claude/doc-advisor/scripts/watch_toc.py --status --target rules|specs
+    python3 .claude/doc-advisor/scripts/watch_toc.py --claim --target rules|specs
+
+Options:
+    --target    Category to watch (default: all)
+    --interval  Heartbeat / polling interval in seconds (default: 2)
+    --poll      Poll instead of using inotify (always polls outside Linux)
+    --once      Refresh once and exit
+    --status    Exit 0 if a healthy watcher is running for the target, 1 otherwise
+    --claim     Hand the watcher's .toc_work/ over to the orchestrator (replaces Phase 1).
+                Exit 1 if no healthy watcher is running (run create_pending_yaml_*.py instead)
+
+While unclaimed, .toc_work/ always matches what create_pending_yaml_*.py
+would produce right now (incremental, or full when the ToC or checksum
+file is missing); it does not exist when nothing changed. --claim freezes
+it: the watcher leaves .toc_work/ alone until it is removed (merge
+--cleanup), then resumes from the updated checksums. A .toc_work/ the
+watcher did not create (e.g. an interrupted manual run) is never touched.
+
+Change detection is always a stat-level rescan with FileHashCache, so only
+modified files are hashed. On Linux, inotify (via ctypes) only decides when
+to rescan; elsewhere, or with --poll, the tree is rescanned every interval.
+
+Run from: Project root
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import json
+import os
+import select
+import shutil
+import signal
+import sys
+import time
+
+from toc_utils import ChecksumStore, FileHashCache, ToCLock, atomic_write, get_parallel_config, SCAN_RESULT_FILENAME
+
+import create_pending_yaml_rules
+import create_pending_yaml_specs
+
+# Phase 1 implementation reused per category (init_config(), scan, template writers)
+PHASE1_MODULES = {
+    'rules': create_pending_yaml_rules,
+    'specs': create_pending_yaml_specs,
+}
+
+# Files next to .toc_checksums.yaml
+WATCH_STATUS_FILENAME = '.toc_watch.json'
+# Written into .toc_work/ by --claim
+CLAIM_MARKER_FILENAME = '.watch_claimed'
+
+DEFAULT_INTERVAL = 2.0
+# Wait after the first inotify event so bursts (editor save, git checkout) become one rescan
+SETTLE_SECONDS = 0.2
+# inotify mode also rescans every N heartbeats (catches directories created during a rescan)
+RESCAN_EVERY = 30
+
+# inotify(7) event masks
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+
+class InotifyWaiter:
+    """Minimal inotify(7) binding via ctypes (Linux only)"""
+
+    mode = 'inotify'
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        # AttributeError here means no inotify (non-Linux libc)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm_watch = libc.inotify_rm_watch
+        self._rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        self._watches = {}  # {path: watch descriptor}
+
+    def sync(self, paths):
+        """
+        Watch exactly the given directories
+
+        Raises:
+            OSError: When a watch cannot be added (e.g. ENOSPC: max_user_watches reached)
+        """
+        wanted = set(paths)
+        for path in [p for p in self._watches if p not in wanted]:
+            wd = self._watches.pop(path)
+            # Paths reaching the same inode share one descriptor
+            if wd not in self._watches.values():
+                self._rm_watch(self.fd, wd)  # EINVAL for already removed directories is harmless
+        for path in wanted - self._watches.keys():
+            wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # Removed since the scan; the parent's event triggers a rescan
+                raise OSError(err, f"inotify_add_watch failed: {path} - {os.strerror(err)}")
+            self._watches[path] = wd
+
+    def wait(self, timeout):
+        """
+        Block until a watched directory changes or timeout expires
+
+        Returns:
+            bool: True if events arrived (rescan needed)
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        time.sleep(SETTLE_SECONDS)
+        # Events are not parsed: any event (including IN_Q_OVERFLOW) means rescan
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollWaiter:
+    """Fallback waiter: rescan every interval"""
+
+    mode = 'poll'
+
+    def sync(self, paths):
+        pass
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return True
+
+    def close(self):
+        pass
+
+
+def make_waiter(poll):
+    """Create inotify waiter, falling back to polling"""
+    if poll or not sys.platform.startswith('linux'):
+        return PollWaiter()
+    try:
+        return InotifyWaiter()
+    except (OSError, AttributeError) as e:
+        print(f"Warning: inotify unavailable, falling back to polling - {e}")
+        return PollWaiter()
+
+
+def read_status(status_file):
+    """Read watcher status file (None if missing or broken)"""
+    try:
+        with open(status_file, 'r', encoding='utf-8') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return status if isinstance(status, dict) else None
+
+
+def is_healthy(status):
+    """
+    Check that the watcher process is alive and its heartbeat is recent
+
+    Returns:
+        bool: True if healthy
+    """
+    if not status:
+        return False
+    try:
+        pid = int(status['pid'])
+        heartbeat = float(status['heartbeat'])
+        interval = float(status.get('interval', DEFAULT_INTERVAL))
+    except (KeyError, TypeError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        pass  # Exists, owned by another user
+    except OSError:
+        return False
+    return time.time() - heartbeat <= max(3 * interval, 10.0)
+
+
+class TargetWatcher:
+    """
+    Keeps one category's Phase 1 output current
+
+    The Phase 1 module's init_config() must have been called.
+    """
+
+    def __init__(self, category):
+        self.category = category
+        self.phase1 = PHASE1_MODULES[category]
+        self.toc_file = getattr(self.phase1, f'{category.upper()}_TOC_FILE')
+        self.checksums_file = self.phase1.CHECKSUMS_FILE
+        self.work_dir = self.phase1.TOC_WORK_DIR
+        toc_dir = self.checksums_file.parent
+        self.status_file = toc_dir / WATCH_STATUS_FILENAME
+
+        self.owns_work_dir = False
+        self.frozen = False
+        self.dirs = []
+        self.hashes = {}  # Live snapshot: {source_file: hash}
+        self.stats = {}   # {source_file: stat signature} of the live snapshot (non-racy only)
+        self.changed = 0
+        self.deleted = 0
+        self._written = None
+        self._control = None
+
+    def lock(self, timeout=None):
+        """ToC lock shared with --claim and Phase 1 / merge / create_checksums runs"""
+        return ToCLock(self.toc_file.parent, timeout=timeout, quiet=True)
+
+    def _yaml_name(self, source_file):
+        if self.category == 'specs':
+            return self.phase1.path_to_yaml_filename(source_file)
+        return self.phase1.get_yaml_filename(source_file)
+
+    def _create_pending(self, entry):
+        if self.category == 'specs':
+            return self.phase1.create_pending_yaml(entry.source_file, entry.doc_type)
+        return self.phase1.create_pending_yaml(entry.source_file)
+
+    def _check_frozen(self):
+        """.toc_work/ is frozen when claimed or not created by this watcher"""
+        if not self.work_dir.exists():
+            if self.owns_work_dir:
+                self._written = None  # Removed externally: rewrite on this refresh
+            self.owns_work_dir = False
+            self.frozen = False
+        else:
+            self.frozen = not self.owns_work_dir or (self.work_dir / CLAIM_MARKER_FILENAME).exists()
+        return self.frozen
+
+    def control_changed(self):
+        """
+        Check checksum file / ToC / .toc_work state (cheap stat calls)
+
+        Returns:
+            bool: True if changed since the last call (recompute needed)
+        """
+        try:
+            st = self.checksums_file.stat()
+            checksums_sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            checksums_sig = None
+        control = (checksums_sig, self.toc_file.exists(), self.work_dir.exists(),
+                   (self.work_dir / CLAIM_MARKER_FILENAME).exists())
+        changed = control != self._control
+        self._control = control
+        return changed
+
+    def refresh(self, jobs=1, fallback_to_serial=True):
+        """
+        Rescan and bring .toc_work/ up to date (unless frozen)
+
+        Returns:
+            str or None: One-line summary when the output changed
+        """
+        visited = []
+        scan = self.phase1.scan_md_files(visited)
+        self.dirs = visited
+
+        # Previous refresh is the stat baseline, so only modified files are read
+        hash_cache = FileHashCache(self.hashes, self.stats)
+        hash_cache.prefetch(scan, jobs, fallback_to_serial)
+        current = {}
+        for entry in scan:
+            hash_value = hash_cache.get(entry.source_file, entry.path, entry.signature)
+            if hash_value is not None:
+                current[entry.source_file] = hash_value
+        self.hashes = current
+        self.stats = hash_cache.get_stats(current)
+
+        lock = self.lock(timeout=0)
+        try:
+            lock.acquire()
+        except TimeoutError:
+            self._control = None  # Another ToC run is active: retry on the next tick
+            return None
+        with lock:
+            if self._check_frozen():
+                return None
+
+            full_mode = not self.toc_file.exists() or not self.checksums_file.exists()
+            old_checksums = {} if full_mode else ChecksumStore.load(self.checksums_file).hashes
+            changed = [e for e in scan
+                       if e.source_file in current and current[e.source_file] != old_checksums.get(e.source_file)]
+            deleted = [] if full_mode else sorted(sf for sf in old_checksums if sf not in scan)
+            self.changed = len(changed)
+            self.deleted = len(deleted)
+
+            state = (full_mode, tuple(sorted(current.items())), tuple(e.source_file for e in changed), tuple(deleted))
+            if state == self._written:
+                return None
+            self._written = state
+
+            if not changed:
+                if self.owns_work_dir:
+                    shutil.rmtree(self.work_dir, ignore_errors=True)
+                    self.owns_work_dir = False
+                if deleted:
+                    return f"[{self.category}] {len(deleted)} deletions (use --delete-only with merge script)"
+                return f"[{self.category}] No changes"
+
+            self.work_dir.mkdir(parents=True, exist_ok=True)
+            self.owns_work_dir = True
+            wanted = {self._yaml_name(e.source_file): e for e in changed}
+            for yaml_path in self.work_dir.glob('*.yaml'):
+                if yaml_path.name not in wanted and not yaml_path.name.startswith('.'):
+                    yaml_path.unlink()  # Reverted to the checksummed content
+            for name, entry in wanted.items():
+                if not (self.work_dir / name).exists():
+                    self._create_pending(entry)
+            self.phase1.save_pending_checksums(scan, hash_cache)
+            scan.save(self.work_dir / SCAN_RESULT_FILENAME)
+
+        mode = 'full' if full_mode else 'incremental'
+        return f"[{self.category}] {mode}: {len(changed)} pending, {len(deleted)} deletions"
+
+    def write_status(self, mode, interval):
+        """Write heartbeat status (atomically)"""
+        status = {
+            'pid': os.getpid(),
+            'mode': mode,
+            'interval': interval,
+            'heartbeat': time.time(),
+            'frozen': self.frozen,
+            'changed': self.changed,
+            'deleted': self.deleted,
+        }
+        try:
+            # Heartbeat: rewritten every interval, not worth an fsync
+            with atomic_write(self.status_file, fsync=False) as f:
+                json.dump(status, f)
+        except OSError as e:
+            print(f"Warning: Failed to write watcher status: {e}")
+
+    def remove_status(self):
+        try:
+            self.status_file.unlink()
+        except OSError:
+            pass
+
+
+def claim(watcher):
+    """
+    Freeze the watcher's .toc_work/ for an orchestrator run
+
+    Prints the same outcome messages as create_pending_yaml_*.py.
+
+    Returns:
+        int: 0 on success, 1 if no healthy watcher is running
+    """
+    if not is_healthy(read_status(watcher.status_file)):
+        print(f"Watcher not running - run create_pending_yaml_{watcher.category}.py")
+        return 1
+
+    lock = watcher.lock()
+    try:
+        lock.acquire()
+    except (TimeoutError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    with lock:
+        # Re-read under the lock: the watcher writes .toc_work/ and status while holding it
+        status = read_status(watcher.status_file) or {}
+        if watcher.work_dir.exists():
+            (watcher.work_dir / CLAIM_MARKER_FILENAME).touch()
+            pending = sum(1 for p in watcher.work_dir.glob('*.yaml') if not p.name.startswith('.'))
+            print(f"Claimed watcher output: {pending} pending YAMLs in {watcher.work_dir}")
+            return 0
+        deleted = status.get('deleted', 0)
+        if deleted:
+            print(f"\nDeleted files only: {deleted} files")
+            print("Use --delete-only with merge script")
+            return 0
+    print(f"No changes - {watcher.category}_toc.yaml is up to date")
+    return 0
+
+
+def parse_option(argv, name, default):
+    """Get the value following an option (default if absent, None if missing value)"""
+    if name not in argv:
+        return default
+    idx = argv.index(name)
+    return argv[idx + 1] if idx + 1 < len(argv) else None
+
+
+def main():
+    # Log lines reach a redirected stdout immediately
+    sys.stdout.reconfigure(line_buffering=True)
+
+    target = parse_option(sys.argv, '--target', 'all')
+    if target not in ('rules', 'specs', 'all'):
+        print("Error: --target must be rules, specs or all")
+        return 1
+    try:
+        interval = float(parse_option(sys.argv, '--interval', DEFAULT_INTERVAL))
+    except (TypeError, ValueError):
+        interval = 0
+    if interval <= 0:
+        print("Error: --interval requires a positive number")
+        return 1
+
+    categories = ['rules', 'specs'] if target == 'all' else [target]
+    watchers = []
+    for category in categories:
+        if not PHASE1_MODULES[category].init_config():
+            return 1
+        watchers.append(TargetWatcher(category))
+
+    if '--status' in sys.argv or '--claim' in sys.argv:
+        if len(watchers) != 1:
+            print("Error: --status and --claim require --target rules or --target specs")
+            return 1
+        if '--claim' in sys.argv:
+            return claim(watchers[0])
+        status = read_status(watchers[0].status_file)
+        if is_healthy(status):
+            print(f"Watcher healthy: pid {status['pid']} ({status.get('mode')}), "
+                  f"{status.get('changed', 0)} pending, {status.get('deleted', 0)} deletions")
+            return 0
+        print("Watcher not running")
+        return 1
+
+    max_workers, fallback_to_serial = get_parallel_config()
+
+    if '--once' in sys.argv:
+        for watcher in watchers:
+            summary = watcher.refresh(max_workers, fallback_to_serial)
+            print(summary or f"[{watcher.category}] .toc_work/ is frozen (claimed or not created by the watcher)")
+        return 0
+
+    waiter = make_waiter('--poll' in sys.argv)
+    # SIGTERM unwinds through finally (status files removed)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Watching {', '.join(categories)} ({waiter.mode}, interval {interval}s)")
+
+    try:
+        rescan = True
+        ticks = 0
+        while True:
+            for watcher in watchers:
+                if watcher.control_changed() or rescan:
+                    summary = watcher.refresh(max_workers, fallback_to_serial)
+                    if summary:
+                        print(f"{time.strftime('%H:%M:%S')} {summary}")
+                watcher.write_status(waiter.mode, interval)
+            try:
+                waiter.sync([d for watcher in watchers for d in watcher.dirs])
+            except OSError as e:
+                print(f"Warning: {e} - falling back to polling")
+                waiter.close()
+                waiter = PollWaiter()
+            ticks += 1
+            rescan = waiter.wait(interval) or ticks % RESCAN_EVERY == 0
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for watcher in watchers:
+            watcher.remove_status()
+        waiter.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
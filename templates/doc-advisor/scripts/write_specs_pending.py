@@ -6,6 +6,8 @@ pending YAML 書き込みスクリプト（specs 用）
 
 サブエージェントが解析した結果を pending YAML に書き込み、
 status を completed に変更する。
+--entry-file と同じディレクトリに work.db（common.work.db）があり、
+同名のエントリを含む場合は work.db の行を更新する。
 
 使用方法:
     python3 write_specs_pending.py \
@@ -17,26 +19,39 @@ status を completed に変更する。
       --keywords "kw1,kw2,kw3,kw4,kw5" \
       --references "参照1,参照2"
 
+    # バッチモード（1 プロセスで複数エントリを書き込み）
+    python3 write_specs_pending.py --batch entries.jsonl   # '-' で標準入力
+    # 1 行 1 エントリの JSON Lines（配列は JSON 配列または ||| 区切り文字列、force は任意）:
+    # {"entry_file": "...", "title": "...", "purpose": "...", "content_details": [...],
+    #  "applicable_tasks": [...], "keywords": [...], "references": []}
+
 終了コード:
     0: 成功
     1: ファイル不存在
-    2: 必須フィールド欠落
-    3: 配列要素数不足
+    2: 必須フィールド欠落・型不正
+    3: 配列要素数の過不足
     4: 書き込み失敗
+    --batch: エントリごとの終了コードを "Result: <コード> <entry_file>" で出力し、
+             全件成功で 0、失敗があればその最大値を返す
 """
 
 import sys
 import argparse
+import json
+import sqlite3
 from datetime import datetime, timezone
 from pathlib import Path
 
-from toc_utils import yaml_escape, load_entry_file
+from toc_utils import format_entry_yaml, parse_simple_yaml, load_entry_file, atomic_write, WorkDB, delegate_to_server
+from toc_schema import compile_entry_check, describe_problem, make_schema_stamp
+
 
+# バリデーション（toc_schema.py の書き込み時スキーマ: 要素数の下限など）
+CHECK_ENTRY = compile_entry_check('specs', 'write')
 
-# バリデーション設定
-MIN_CONTENT_DETAILS = 5
-MIN_APPLICABLE_TASKS = 1
-MIN_KEYWORDS = 5
+# 必須フィールド（--batch 以外では必須引数、--batch では各行の必須キー）
+REQUIRED_FIELDS = ('entry_file', 'title', 'purpose', 'content_details', 'applicable_tasks', 'keywords')
+ARRAY_FIELDS = ('content_details', 'applicable_tasks', 'keywords', 'references')
 
 
 def parse_args():
@@ -44,24 +59,32 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description='pending YAML に解析結果を書き込む（specs 用）'
     )
-    parser.add_argument('--entry-file', required=True,
+    parser.add_argument('--entry-file',
                         help='対象の entry YAML ファイルパス')
-    parser.add_argument('--title', required=True,
+    parser.add_argument('--title',
                         help='ドキュメントタイトル')
-    parser.add_argument('--purpose', required=True,
+    parser.add_argument('--purpose',
                         help='ドキュメントの目的（1-2文）')
-    parser.add_argument('--content-details', required=True,
+    parser.add_argument('--content-details',
                         help='内容詳細（||| 区切り、5-10項目）')
-    parser.add_argument('--applicable-tasks', required=True,
+    parser.add_argument('--applicable-tasks',
                         help='適用タスク（||| 区切り、1項目以上）')
-    parser.add_argument('--keywords', required=True,
+    parser.add_argument('--keywords',
                         help='キーワード（||| 区切り、5-10個）')
     parser.add_argument('--references', default='',
                         help='参照文書（||| 区切り、空文字列で空配列）')
     parser.add_argument('--force', action='store_true',
                         help='completed 状態でも強制上書き')
+    parser.add_argument('--batch', metavar='FILE',
+                        help='JSON Lines のエントリをまとめて書き込む（- は標準入力）')
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.batch is None:
+        missing = [name for name in REQUIRED_FIELDS if getattr(args, name) is None]
+        if missing:
+            parser.error('the following arguments are required: '
+                         + ', '.join('--' + name.replace('_', '-') for name in missing))
+    return args
 
 
 def parse_separated(value, separator='|||'):
@@ -72,13 +95,36 @@ def parse_separated(value, separator='|||'):
     return [item for item in items if item]  # 空文字を除去
 
 
-def validate_array(name, items, min_count):
-    """配列の要素数をバリデーション"""
-    if len(items) < min_count:
-        print(f"Error: {name} requires at least {min_count} items (got {len(items)})")
-        print(f"  Provided: {', '.join(items)}")
-        return False
-    return True
+def validate_entry(entry):
+    """
+    エントリをスキーマでバリデーションし、問題をすべて表示
+
+    Returns:
+        int: 0（問題なし）、2（必須フィールド欠落・型不正、要素数より優先）、3（配列要素数の過不足）
+    """
+    codes = set()
+    for problem in CHECK_ENTRY(entry):
+        print(f"Error: {describe_problem(problem)}")
+        if problem.kind in ('too_few', 'too_many'):
+            print(f"  Provided: {', '.join(entry[problem.field])}")
+            codes.add(3)
+        else:
+            codes.add(2)
+    return min(codes, default=0)
+
+
+def as_read_back(entry, work_db):
+    """
+    merge が読み込むときのエントリの形
+
+    work.db は JSON でそのまま戻るが、entry YAML の読み込み（parse_simple_yaml）は
+    引用符を外すだけなので、書き込んだ YAML を読み戻した形にする。
+    検査と schema_stamp はこの形に対して行う。
+    """
+    if work_db is not None:
+        return entry
+    _, read_back = parse_simple_yaml(format_entry_yaml({}, entry))
+    return read_back
 
 
 def write_entry_yaml(filepath, meta, entry):
@@ -93,63 +139,61 @@ def write_entry_yaml(filepath, meta, entry):
     Returns:
         bool: 成功時 True
     """
-    lines = []
-
-    # _meta セクション（doc_type を含む）
-    lines.append("_meta:")
-    lines.append(f"  source_file: {meta.get('source_file', '')}")
-    lines.append(f"  doc_type: {meta.get('doc_type', '')}")
-    lines.append(f"  status: {meta.get('status', 'completed')}")
-    lines.append(f"  updated_at: {meta.get('updated_at', '')}")
-    lines.append("")
-
-    # 通常フィールド
-    lines.append(f"title: {yaml_escape(entry.get('title', ''))}")
-    lines.append(f"purpose: {yaml_escape(entry.get('purpose', ''))}")
-
-    # 配列フィールド
-    for field in ['content_details', 'applicable_tasks', 'keywords']:
-        lines.append(f"{field}:")
-        items = entry.get(field, [])
-        for item in items:
-            lines.append(f"  - {yaml_escape(item)}")
-
-    # references フィールド（空配列許容）
-    references = entry.get('references', [])
-    if references:
-        lines.append("references:")
-        for item in references:
-            lines.append(f"  - {yaml_escape(item)}")
-    else:
-        lines.append("references: []")  # 空配列
-
-    lines.append("")  # 末尾の空行
-
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(lines))
+        with atomic_write(filepath) as f:
+            f.write(format_entry_yaml(meta, entry))
         return True
     except (IOError, OSError, PermissionError) as e:
         print(f"Error: Failed to write file: {filepath} - {e}")
         return False
 
 
-def main():
-    args = parse_args()
+def get_work_db(directory, work_dbs):
+    """ディレクトリの work.db を開く（未作成なら None、バッチ内で再利用）"""
+    if directory not in work_dbs:
+        work_dbs[directory] = WorkDB.open(directory)
+    return work_dbs[directory]
 
-    entry_file = Path(args.entry_file)
 
-    # ファイル存在確認
-    if not entry_file.exists():
-        print(f"Error: Entry file not found: {entry_file}")
-        return 1
+def write_entry(entry_file, values, force, work_dbs):
+    """
+    1 エントリをバリデーションして書き込む
 
-    # 既存ファイル読み込み
+    Args:
+        entry_file: 対象の entry YAML ファイルパス（work.db では行名）
+        values: title, purpose と配列フィールド（リスト）の辞書
+        force: completed 状態でも上書き
+        work_dbs: {ディレクトリ: WorkDB or None} のキャッシュ
+
+    Returns:
+        int: 終了コード
+    """
+    entry_file = Path(entry_file)
+
+    # work.db モード: 同じディレクトリの work.db に同名エントリがあればそちらを更新
     try:
-        meta, _ = load_entry_file(entry_file)
-    except IOError as e:
-        print(f"Error: {e}")
+        work_db = get_work_db(entry_file.parent, work_dbs)
+        loaded = work_db.get(entry_file.name) if work_db is not None else None
+    except sqlite3.Error as e:
+        print(f"Error: work.db read error: {e}")
         return 1
+    if loaded is None:
+        work_db = None
+
+    if work_db is not None:
+        meta, _ = loaded
+    else:
+        # ファイル存在確認
+        if not entry_file.exists():
+            print(f"Error: Entry file not found: {entry_file}")
+            return 1
+
+        # 既存ファイル読み込み
+        try:
+            meta, _ = load_entry_file(entry_file)
+        except IOError as e:
+            print(f"Error: {e}")
+            return 1
 
     # _meta セクション確認
     if not meta:
@@ -167,49 +211,50 @@ def main():
         return 1
 
     # completed 状態チェック
-    if meta.get('status') == 'completed' and not args.force:
+    if meta.get('status') == 'completed' and not force:
         print(f"Error: Entry file already completed: {entry_file}")
         print("  Use --force to overwrite")
         return 1
 
-    # 配列をパース
-    content_details = parse_separated(args.content_details)
-    applicable_tasks = parse_separated(args.applicable_tasks)
-    keywords = parse_separated(args.keywords)
-    references = parse_separated(args.references)  # 空配列許容
-
-    # バリデーション
-    valid = True
-    if not validate_array('content_details', content_details, MIN_CONTENT_DETAILS):
-        valid = False
-    if not validate_array('applicable_tasks', applicable_tasks, MIN_APPLICABLE_TASKS):
-        valid = False
-    if not validate_array('keywords', keywords, MIN_KEYWORDS):
-        valid = False
+    # エントリデータ
+    entry = {
+        'title': values['title'],
+        'purpose': values['purpose'],
+        'content_details': values['content_details'],
+        'applicable_tasks': values['applicable_tasks'],
+        'keywords': values['keywords'],
+        'references': values.get('references', [])  # 空配列許容
+    }
 
-    if not valid:
-        return 3
+    # バリデーション（doc_type は _meta の値で検査。merge がエントリに移す）
+    checked = dict(as_read_back(entry, work_db), doc_type=meta['doc_type'])
+    code = validate_entry(checked)
+    if code:
+        return code
 
     # _meta 更新（doc_type を保持）
     updated_meta = {
         'source_file': meta['source_file'],
         'doc_type': meta['doc_type'],
         'status': 'completed',
-        'updated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        'updated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        # 検査済みの印（merge / validate は内容が変わっていなければ再検査しない）
+        'schema_stamp': make_schema_stamp('specs', checked)
     }
 
-    # エントリデータ
-    entry = {
-        'title': args.title,
-        'purpose': args.purpose,
-        'content_details': content_details,
-        'applicable_tasks': applicable_tasks,
-        'keywords': keywords,
-        'references': references
-    }
-
-    # 書き込み
-    if not write_entry_yaml(entry_file, updated_meta, entry):
+    # 書き込み（work.db はステータス確認と更新を 1 トランザクションで実行）
+    if work_db is not None:
+        try:
+            completed = work_db.complete(entry_file.name, updated_meta['updated_at'], entry, force,
+                                        schema_stamp=updated_meta['schema_stamp'])
+        except sqlite3.Error as e:
+            print(f"Error: Failed to write work.db: {entry_file} - {e}")
+            return 4
+        if not completed:
+            print(f"Error: Entry file already completed: {entry_file}")
+            print("  Use --force to overwrite")
+            return 1
+    elif not write_entry_yaml(entry_file, updated_meta, entry):
         return 4
 
     # 成功メッセージ
@@ -222,5 +267,90 @@ def main():
     return 0
 
 
+def parse_batch_line(line):
+    """
+    JSON Lines の 1 行をエントリに変換
+
+    Returns:
+        tuple: (entry_file, values, force)
+
+    Raises:
+        ValueError: JSON 不正・必須キー欠落・型不正
+    """
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("entry must be a JSON object")
+    missing = [name for name in REQUIRED_FIELDS if record.get(name) in (None, '')]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+    values = {'title': str(record['title']), 'purpose': str(record['purpose'])}
+    for name in ARRAY_FIELDS:
+        value = record.get(name, [])
+        if isinstance(value, str):
+            value = parse_separated(value)
+        elif isinstance(value, list):
+            value = [str(item).strip() for item in value if str(item).strip()]
+        else:
+            raise ValueError(f"{name} must be an array or a '|||'-separated string")
+        values[name] = value
+    return record['entry_file'], values, bool(record.get('force', False))
+
+
+def run_batch(source, work_dbs):
+    """
+    --batch: JSON Lines のエントリを順に書き込み、エントリごとの終了コードを出力
+
+    Returns:
+        int: 全件成功で 0、失敗があれば終了コードの最大値
+    """
+    try:
+        if source == '-':
+            lines = sys.stdin.read().splitlines()
+        else:
+            with open(source, 'r', encoding='utf-8') as f:
+                lines = f.read().splitlines()
+    except (IOError, OSError) as e:
+        print(f"Error: Failed to read batch file: {source} - {e}")
+        return 1
+
+    results = []
+    for line_no, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entry_file, values, force = parse_batch_line(line)
+        except ValueError as e:
+            print(f"Error: line {line_no}: {e}")
+            results.append((2, f"line {line_no}"))
+            continue
+        results.append((write_entry(entry_file, values, force, work_dbs), entry_file))
+
+    print("")
+    for code, label in results:
+        print(f"Result: {code} {label}")
+    failed = [code for code, _ in results if code != 0]
+    print(f"Batch complete: {len(results) - len(failed)} succeeded, {len(failed)} failed")
+    return max(failed) if failed else 0
+
+
+def main():
+    args = parse_args()
+
+    work_dbs = {}
+    try:
+        if args.batch is not None:
+            return run_batch(args.batch, work_dbs)
+
+        values = {'title': args.title, 'purpose': args.purpose}
+        for name in ARRAY_FIELDS:
+            values[name] = parse_separated(getattr(args, name))  # references は空配列許容
+        return write_entry(args.entry_file, values, args.force, work_dbs)
+    finally:
+        for work_db in work_dbs.values():
+            if work_db is not None:
+                work_db.close()
+
+
 if __name__ == '__main__':
-    sys.exit(main())
+    exit_code = delegate_to_server('write_entry', 'specs', stdin_option='--batch')
+    sys.exit(main() if exit_code is None else exit_code)
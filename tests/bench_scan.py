@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: directory scan with excluded subtrees
+
+Builds a synthetic specs/ tree with large excluded subtrees (archive/, plan/)
+and compares the legacy walk (os.walk + per-file Path.stat + should_exclude
+filtering) with toc_scan() (os.scandir + directory-level pruning).
+
+Usage:
+    python3 tests/bench_scan.py [--features N] [--excluded-dirs N] [--files-per-dir N] [--repeat N]
+
+Not part of run_all_tests.sh (timing only, no pass/fail).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'templates' / 'doc-advisor' / 'scripts'
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from toc_utils import (  # noqa: E402
+    get_default_target_dirs,
+    get_system_exclude_patterns,
+    normalize_path,
+    should_exclude,
+    toc_scan,
+)
+
+
+def build_tree(root, features, excluded_dirs, files_per_dir):
+    """Create specs tree: target docs per feature + large excluded subtrees"""
+    for i in range(features):
+        for sub in ('requirements', 'design', 'plan'):
+            d = root / f'feature{i:03d}' / sub
+            d.mkdir(parents=True)
+            for j in range(files_per_dir):
+                (d / f'doc{j:03d}.md').write_text(f'# {sub} {i}-{j}\n', encoding='utf-8')
+    for i in range(excluded_dirs):
+        d = root / 'archive' / f'old{i:03d}' / 'requirements'
+        d.mkdir(parents=True)
+        for j in range(files_per_dir):
+            (d / f'doc{j:03d}.md').write_text(f'# archived {i}-{j}\n', encoding='utf-8')
+
+
+def legacy_scan(root, exclude_patterns, target_dirs):
+    """Reference implementation of the pre-toc_scan walk"""
+    target_dir_names = set(target_dirs.values())
+    seen_inodes = set()
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        current = Path(dirpath)
+        st = current.stat()
+        if (st.st_dev, st.st_ino) in seen_inodes:
+            dirnames.clear()
+            continue
+        seen_inodes.add((st.st_dev, st.st_ino))
+        for name in filenames:
+            if not name.endswith('.md'):
+                continue
+            filepath = current / name
+            fst = filepath.stat()
+            if (fst.st_dev, fst.st_ino) in seen_inodes:
+                continue
+            seen_inodes.add((fst.st_dev, fst.st_ino))
+            if should_exclude(filepath, root, exclude_patterns):
+                continue
+            parts = normalize_path(filepath.relative_to(root)).split('/')
+            if any(part in target_dir_names for part in parts):
+                files.append(filepath)
+    return files
+
+
+def measure(func, repeat):
+    """Return (best elapsed seconds, scandir calls of the best run, result)"""
+    real_scandir = os.scandir
+    best = None
+    for _ in range(repeat):
+        calls = [0]
+
+        def counting_scandir(path='.'):
+            calls[0] += 1
+            return real_scandir(path)
+
+        os.scandir = counting_scandir
+        try:
+            start = time.perf_counter()
+            result = func()
+            elapsed = time.perf_counter() - start
+        finally:
+            os.scandir = real_scandir
+        if best is None or elapsed < best[0]:
+            best = (elapsed, calls[0], result)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark toc_scan() against the legacy walk')
+    parser.add_argument('--features', type=int, default=50)
+    parser.add_argument('--excluded-dirs', type=int, default=200)
+    parser.add_argument('--files-per-dir', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    exclude_patterns = get_system_exclude_patterns('specs') + ['plan', 'archive']
+    target_dirs = get_default_target_dirs()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / 'specs'
+        build_tree(root, args.features, args.excluded_dirs, args.files_per_dir)
+        total = sum(1 for _ in root.rglob('*.md'))
+
+        legacy = measure(lambda: legacy_scan(root, exclude_patterns, target_dirs), args.repeat)
+        new = measure(lambda: toc_scan('specs', root, 'specs', exclude_patterns, target_dirs=target_dirs), args.repeat)
+
+    legacy_count = len(legacy[2])
+    new_count = len(new[2])
+    print(f"Tree: {total} .md files, {legacy_count} targets "
+          f"({total - legacy_count} in excluded subtrees)")
+    print(f"{'walker':<10} {'time (ms)':>10} {'dirs listed':>12} {'results':>8}")
+    print(f"{'legacy':<10} {legacy[0] * 1000:>10.1f} {legacy[1]:>12} {legacy_count:>8}")
+    print(f"{'toc_scan':<10} {new[0] * 1000:>10.1f} {new[1]:>12} {new_count:>8}")
+    if new[0] > 0:
+        print(f"Speedup: {legacy[0] / new[0]:.1f}x")
+    if legacy_count != new_count:
+        print("Error: result count mismatch")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: ToC parsing
+
+Writes a synthetic specs_toc.yaml with N entries and compares the three
+legacy per-script parsers (read whole file + split into lines) with the
+shared streaming parser iter_toc_entries() and with read_toc_entries()
+loading the parsed sidecar (specs_toc.cache.json) written by merge.
+
+Usage:
+    python3 tests/bench_toc_parse.py [--entries N] [--repeat N]
+
+Reports the best wall time and the peak traced allocation of each parser.
+Not part of run_all_tests.sh (timing only, no pass/fail).
+"""
+
+import argparse
+import gc
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent.parent / 'templates' / 'doc-advisor' / 'scripts'
+sys.path.insert(0, str(SCRIPTS_DIR))
+
+from toc_utils import iter_toc_entries, read_toc_entries, write_toc_caches  # noqa: E402
+
+
+def write_toc(path, entries):
+    """Write a specs_toc.yaml-shaped file with the given number of entries"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("# .claude/doc-advisor/toc/specs/specs_toc.yaml\n\n")
+        f.write(f"metadata:\n  name: Bench\n  file_count: {entries}\n\ndocs:\n")
+        for i in range(entries):
+            doc_type = 'requirement' if i % 2 == 0 else 'design'
+            f.write(f"  specs/feature{i // 100:04d}/{doc_type}s/doc{i:06d}.md:\n")
+            f.write(f"    doc_type: {doc_type}\n")
+            f.write(f"    title: Document {i}\n")
+            f.write(f"    purpose: \"Purpose of document {i}: benchmark\"\n")
+            for field in ('content_details', 'applicable_tasks', 'keywords'):
+                f.write(f"    {field}:\n")
+                for j in range(5):
+                    f.write(f"      - {field} item {j} of {i}\n")
+            f.write("    references: []\n")
+
+
+def legacy_merge_specs(toc_path):
+    """Reference: merge_specs_toc.load_existing_toc before iter_toc_entries()"""
+    with open(toc_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    docs = {}
+    current_section = None
+    current_path = None
+    current_entry = {}
+    current_list = None
+    for line in content.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('#') or not stripped:
+            continue
+        if stripped == 'docs:':
+            current_section = 'docs'
+            continue
+        elif stripped.startswith('metadata:'):
+            current_section = 'metadata'
+            continue
+        if current_section == 'docs':
+            if line.startswith('  ') and not line.startswith('    ') and stripped.endswith('.md:'):
+                if current_path and current_entry:
+                    docs[current_path] = current_entry
+                current_path = stripped.rstrip(':')
+                current_entry = {}
+                current_list = None
+            elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
+                if current_path:
+                    key, _, val = stripped.partition(':')
+                    key = key.strip()
+                    val = val.strip().strip('"\'')
+                    if val == '[]':
+                        current_list = []
+                        current_entry[key] = current_list
+                    elif val:
+                        current_entry[key] = val
+                    else:
+                        current_list = []
+                        current_entry[key] = current_list
+            elif stripped.startswith('- ') and current_list is not None:
+                current_list.append(stripped[2:].strip().strip('"\''))
+    if current_path and current_entry:
+        docs[current_path] = current_entry
+    return docs
+
+
+def legacy_merge_rules(toc_path):
+    """Reference: merge_rules_toc / validate_rules_toc parser before iter_toc_entries()"""
+    with open(toc_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    docs = {}
+    current_file = None
+    current_entry = {}
+    current_list = None
+    in_docs = False
+    for line in content.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('#') or not stripped:
+            continue
+        if stripped == 'docs:':
+            in_docs = True
+            continue
+        if not in_docs:
+            continue
+        if line.startswith('  ') and not line.startswith('    ') and stripped.endswith(':'):
+            if current_file and current_entry:
+                docs[current_file] = current_entry
+            current_file = stripped.rstrip(':')
+            current_entry = {}
+            current_list = None
+        elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
+            if current_file:
+                key, _, val = stripped.partition(':')
+                key = key.strip()
+                val = val.strip().strip('"\'')
+                if val == '[]':
+                    current_list = []
+                    current_entry[key] = current_list
+                elif val:
+                    current_entry[key] = val
+                else:
+                    current_list = []
+                    current_entry[key] = current_list
+        elif stripped.startswith('- ') and current_list is not None:
+            current_list.append(stripped[2:].strip().strip('"\''))
+    if current_file and current_entry:
+        docs[current_file] = current_entry
+    return docs
+
+
+def legacy_validate_specs(toc_path):
+    """Reference: validate_specs_toc parser (split by doc_type, '[]' kept as a string)"""
+    with open(toc_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    requirements = {}
+    designs = {}
+    current_section = None
+    current_path = None
+    current_entry = {}
+    current_list = None
+
+    def store():
+        doc_type = current_entry.get('doc_type', '')
+        if doc_type == 'requirement':
+            requirements[current_path] = current_entry
+        elif doc_type == 'design':
+            designs[current_path] = current_entry
+
+    for line in content.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('#') or not stripped:
+            continue
+        if stripped == 'docs:':
+            current_section = 'docs'
+            continue
+        elif stripped.startswith('metadata:'):
+            current_section = 'metadata'
+            continue
+        if current_section == 'docs':
+            if line.startswith('  ') and not line.startswith('    ') and stripped.endswith(':'):
+                if current_path and current_entry:
+                    store()
+                current_path = stripped.rstrip(':')
+                current_entry = {}
+                current_list = None
+            elif line.startswith('    ') and ':' in stripped and not stripped.startswith('-'):
+                if current_path:
+                    key, _, val = stripped.partition(':')
+                    key = key.strip()
+                    val = val.strip().strip('"\'')
+                    if val:
+                        current_entry[key] = val
+                    else:
+                        current_list = []
+                        current_entry[key] = current_list
+            elif stripped.startswith('- ') and current_list is not None:
+                current_list.append(stripped[2:].strip().strip('"\''))
+    if current_path and current_entry:
+        store()
+    return requirements, designs
+
+
+def load_parsed(toc_path):
+    """Build {source_file: entry} from read_toc_entries() without a sidecar (text parse)"""
+    return dict(read_toc_entries(toc_path))
+
+
+def load_sidecar(toc_path):
+    """Build {source_file: entry} from read_toc_entries() with a fresh sidecar"""
+    return dict(read_toc_entries(toc_path))
+
+
+def count_streamed(toc_path):
+    """Consume iter_toc_entries() without keeping entries (validate-style single pass)"""
+    return sum(1 for _ in iter_toc_entries(toc_path))
+
+
+def measure(func, toc_path, repeat):
+    """Return (best elapsed seconds, peak traced bytes, result)"""
+    best = None
+    for _ in range(repeat):
+        gc.collect()  # Do not charge the previous run's garbage to this one
+        start = time.perf_counter()
+        result = func(toc_path)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        del result
+    tracemalloc.start()
+    result = func(toc_path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark iter_toc_entries() against the legacy ToC parsers')
+    parser.add_argument('--entries', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        toc_path = Path(tmp) / 'specs_toc.yaml'
+        write_toc(toc_path, args.entries)
+        size = toc_path.stat().st_size
+
+        results = [
+            ('merge_specs (legacy)', measure(legacy_merge_specs, toc_path, args.repeat)),
+            ('merge_rules (legacy)', measure(legacy_merge_rules, toc_path, args.repeat)),
+            ('validate_specs (legacy)', measure(legacy_validate_specs, toc_path, args.repeat)),
+            ('read_toc_entries (parse)', measure(load_parsed, toc_path, args.repeat)),
+            ('iter_toc_entries (stream)', measure(count_streamed, toc_path, args.repeat)),
+        ]
+        start = time.perf_counter()
+        write_toc_caches(toc_path)
+        sidecar_write = time.perf_counter() - start
+        results.append(('read_toc_entries (sidecar)', measure(load_sidecar, toc_path, args.repeat)))
+
+    print(f"ToC: {args.entries} entries, {size / 1024 / 1024:.1f} MiB")
+    print(f"Sidecar + index write (merge): {sidecar_write * 1000:.1f} ms")
+    print(f"{'parser':<26} {'time (ms)':>10} {'peak (MiB)':>11}")
+    for name, (elapsed, peak, _) in results:
+        print(f"{name:<26} {elapsed * 1000:>10.1f} {peak / 1024 / 1024:>11.1f}")
+
+    legacy = results[0][1][2]
+    new = results[3][1][2]
+    if results[4][1][2] != args.entries or len(new) != args.entries:
+        print("Error: entry count mismatch")
+        return 1
+    if legacy != new:
+        print("Error: iter_toc_entries() result differs from the legacy merge_specs parser")
+        return 1
+    if results[5][1][2] != new:
+        print("Error: sidecar result differs from the text parse")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -164,6 +164,74 @@ else
 fi
 echo ""
 
+echo "=================================================="
+echo "Test: Stat fast path (stats section and hash reuse)"
+echo "=================================================="
+
+rm -f "$RULES_CHECKSUMS"
+# Make file mtimes old enough to be recorded (not racy)
+find rules -name "*.md" -exec touch -d "1 hour ago" {} +
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+
+RULES_FILE_COUNT=$(find rules -name "*.md" -type f 2>/dev/null | wc -l | tr -d ' ')
+STATS_COUNT=$(sed -n '/^stats:/,/^[^ ]/p' "$RULES_CHECKSUMS" 2>/dev/null | grep -cE '^  .+: [0-9]+ [0-9]+ [0-9]+ [0-9]+$' || echo "0")
+test_result "stats section records every file" "$RULES_FILE_COUNT" "$STATS_COUNT"
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules 2>&1)
+REUSED=$(echo "$OUTPUT" | grep -oE '再ハッシュ省略（stat 一致）: [0-9]+' | grep -oE '[0-9]+$' || echo "")
+test_result "Unchanged files are not re-hashed" "$RULES_FILE_COUNT" "$REUSED"
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules --paranoid 2>&1)
+REUSED=$(echo "$OUTPUT" | grep -oE '再ハッシュ省略（stat 一致）: [0-9]+' | grep -oE '[0-9]+$' || echo "")
+test_result "--paranoid re-hashes every file" "0" "$REUSED"
+
+# Same-size modification must still be detected (mtime changes)
+ORIGINAL_HASH=$(sed -n '/^checksums:/,/^[^ ]/p' "$RULES_CHECKSUMS" | grep "coding_standards" | grep -oE '[a-f0-9]{64}' || echo "")
+cp rules/coding_standards.md rules/coding_standards.md.orig
+printf 'X' | dd of=rules/coding_standards.md bs=1 seek=0 conv=notrunc 2>/dev/null
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+NEW_HASH=$(sed -n '/^checksums:/,/^[^ ]/p' "$RULES_CHECKSUMS" | grep "coding_standards" | grep -oE '[a-f0-9]{64}' || echo "")
+if [[ -n "$ORIGINAL_HASH" && "$ORIGINAL_HASH" != "$NEW_HASH" ]]; then
+    echo -e "${GREEN}PASS${NC}: Same-size modification detected via stat change"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Same-size modification not detected"
+    ((FAIL_COUNT++))
+fi
+mv rules/coding_standards.md.orig rules/coding_standards.md
+echo ""
+
+echo "=================================================="
+echo "Test: Parallel hashing (--jobs)"
+echo "=================================================="
+
+rm -f "$SPECS_CHECKSUMS"
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs --jobs 1 >/dev/null 2>&1 || true
+SERIAL=$(sed -n '/^checksums:/,/^[^ ]/p' "$SPECS_CHECKSUMS")
+rm -f "$SPECS_CHECKSUMS"
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs --jobs 4 >/dev/null 2>&1 || EXIT_CODE=$?
+PARALLEL=$(sed -n '/^checksums:/,/^[^ ]/p' "$SPECS_CHECKSUMS")
+test_result "create_checksums --jobs 4" "0" "$EXIT_CODE"
+if [[ -n "$SERIAL" && "$SERIAL" == "$PARALLEL" ]]; then
+    echo -e "${GREEN}PASS${NC}: Parallel output identical to serial output"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Parallel output differs from serial output"
+    ((FAIL_COUNT++))
+fi
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs --jobs 0 >/dev/null 2>&1 || EXIT_CODE=$?
+if [[ "$EXIT_CODE" -ne 0 ]]; then
+    echo -e "${GREEN}PASS${NC}: Invalid --jobs rejected (exit=$EXIT_CODE)"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Invalid --jobs should have been rejected"
+    ((FAIL_COUNT++))
+fi
+echo ""
+
 echo "=================================================="
 echo "Test: Invalid target"
 echo "=================================================="
@@ -211,7 +279,7 @@ if [[ -f "$PENDING_CHECKSUMS" ]]; then
     fi
 
     # Verify all target files are included (not just changed ones)
-    PENDING_ENTRY_COUNT=$(grep -c '^  ' "$PENDING_CHECKSUMS" 2>/dev/null || echo "0")
+    PENDING_ENTRY_COUNT=$(sed -n '/^checksums:/,/^[^ ]/p' "$PENDING_CHECKSUMS" 2>/dev/null | grep -c '^  ' || echo "0")
     RULES_FILE_COUNT=$(find rules -name "*.md" -type f 2>/dev/null | wc -l | tr -d ' ')
     test_result "Pending checksums includes all files" "$RULES_FILE_COUNT" "$PENDING_ENTRY_COUNT"
 else
@@ -261,6 +329,163 @@ fi
 rm -rf .claude/doc-advisor/toc/specs/.toc_work
 echo ""
 
+echo "=================================================="
+echo "Test: Single-pass hashing in create_pending_yaml (rules)"
+echo "=================================================="
+
+rm -rf .claude/doc-advisor/toc/rules/.toc_work
+find rules -name "*.md" -exec touch -d "1 hour ago" {} +
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+RULES_TOC_CREATED=0
+if [[ ! -f .claude/doc-advisor/toc/rules/rules_toc.yaml ]]; then
+    touch .claude/doc-advisor/toc/rules/rules_toc.yaml
+    RULES_TOC_CREATED=1
+fi
+RULES_FILE_COUNT=$(find rules -name "*.md" -type f 2>/dev/null | wc -l | tr -d ' ')
+
+# --paranoid: every file hashed exactly once (change detection + snapshot share results)
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" --paranoid 2>&1)
+HASHED=$(echo "$OUTPUT" | grep -oE 'Hashing: [0-9]+ files hashed' | grep -oE '[0-9]+' || echo "")
+test_result "Each file hashed once per run (--paranoid, no changes)" "$RULES_FILE_COUNT" "$HASHED"
+
+# One modified file: only that file is read, snapshot reuses the cache
+echo "" >> rules/coding_standards.md
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" 2>&1)
+HASHED=$(echo "$OUTPUT" | grep -oE 'Hashing: [0-9]+ files hashed' | grep -oE '[0-9]+' || echo "")
+test_result "Only the modified file is hashed" "1" "$HASHED"
+head -n -1 rules/coding_standards.md > rules/coding_standards.md.tmp
+mv rules/coding_standards.md.tmp rules/coding_standards.md
+
+[[ $RULES_TOC_CREATED -eq 1 ]] && rm -f .claude/doc-advisor/toc/rules/rules_toc.yaml
+rm -rf .claude/doc-advisor/toc/rules/.toc_work
+echo ""
+
+echo "=================================================="
+echo "Test: Git index change detection (--source git)"
+echo "=================================================="
+
+if ! command -v git >/dev/null 2>&1; then
+    echo -e "${YELLOW}SKIP${NC}: git not installed"
+else
+    # Outside this repository, so git does not pick up the parent work tree
+    GIT_PROJECT=$(mktemp -d)
+    mkdir -p "$GIT_PROJECT/rules/sub" "$GIT_PROJECT/specs/main/requirements"
+    echo "# Rule A" > "$GIT_PROJECT/rules/a.md"
+    echo "# Rule B" > "$GIT_PROJECT/rules/sub/b.md"
+    echo "# Spec" > "$GIT_PROJECT/specs/main/requirements/spec.md"
+    echo -e "rules\nspecs\nrequirements\ndesign\nplan\nopus" | "$PROJECT_ROOT/setup.sh" "$GIT_PROJECT" >/dev/null 2>&1
+    git -C "$GIT_PROJECT" init -q
+    git -C "$GIT_PROJECT" add rules
+    git -C "$GIT_PROJECT" -c user.name=test -c user.email=test@example.com commit -qm "init"
+    find "$GIT_PROJECT/rules" -name "*.md" -exec touch -d "1 hour ago" {} +
+
+    GIT_SCRIPTS="$GIT_PROJECT/.claude/doc-advisor/scripts"
+    GIT_CHECKSUMS="$GIT_PROJECT/.claude/doc-advisor/toc/rules/.toc_checksums.yaml"
+    git_reused() {
+        echo "$1" | grep -oE '再ハッシュ省略（git blob 一致）: [0-9]+' | grep -oE '[0-9]+$' || echo ""
+    }
+
+    $PYTHON_CMD "$GIT_SCRIPTS/create_checksums.py" --target rules --source git >/dev/null 2>&1 || true
+    BLOB_COUNT=$(sed -n '/^blobs:/,/^[^ ]/p' "$GIT_CHECKSUMS" 2>/dev/null | grep -cE '^  .+: [a-f0-9]{40,64}$' || echo "0")
+    test_result "blobs section records clean tracked files" "2" "$BLOB_COUNT"
+
+    # Content unchanged, stat changed: git blob id still matches
+    find "$GIT_PROJECT/rules" -name "*.md" -exec touch -d "30 minutes ago" {} +
+    OUTPUT=$($PYTHON_CMD "$GIT_SCRIPTS/create_checksums.py" --target rules --source git 2>&1)
+    test_result "Unchanged blobs are not re-hashed (stat changed)" "2" "$(git_reused "$OUTPUT")"
+
+    # Dirty and untracked files fall back to SHA-256
+    ORIGINAL_HASH=$(grep "rules/a.md:" "$GIT_CHECKSUMS" | head -1 | grep -oE '[a-f0-9]{64}' || echo "")
+    echo "dirty" >> "$GIT_PROJECT/rules/a.md"
+    echo "# Untracked" > "$GIT_PROJECT/rules/untracked.md"
+    OUTPUT=$($PYTHON_CMD "$GIT_SCRIPTS/create_checksums.py" --target rules --source git 2>&1)
+    test_result "Only the clean tracked file reuses its hash" "1" "$(git_reused "$OUTPUT")"
+    NEW_HASH=$(grep "rules/a.md:" "$GIT_CHECKSUMS" | head -1 | grep -oE '[a-f0-9]{64}' || echo "")
+    if [[ -n "$ORIGINAL_HASH" && "$ORIGINAL_HASH" != "$NEW_HASH" ]] && grep -q "rules/untracked.md:" "$GIT_CHECKSUMS"; then
+        echo -e "${GREEN}PASS${NC}: Dirty and untracked files hashed with SHA-256"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: Dirty or untracked file not detected"
+        ((FAIL_COUNT++))
+    fi
+    BLOB_COUNT=$(sed -n '/^blobs:/,/^[^ ]/p' "$GIT_CHECKSUMS" | grep -c 'rules/a.md:' || true)
+    test_result "Dirty file has no blob id recorded" "0" "$BLOB_COUNT"
+
+    # Not a git work tree: warning and SHA-256 fallback
+    rm -rf "$GIT_PROJECT/.git"
+    EXIT_CODE=0
+    OUTPUT=$($PYTHON_CMD "$GIT_SCRIPTS/create_checksums.py" --target rules --source git 2>&1) || EXIT_CODE=$?
+    test_result "Fallback without git exits 0" "0" "$EXIT_CODE"
+    if echo "$OUTPUT" | grep -q "falling back to SHA-256"; then
+        echo -e "${GREEN}PASS${NC}: Fallback warning printed"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: Fallback warning not printed"
+        ((FAIL_COUNT++))
+    fi
+
+    EXIT_CODE=0
+    $PYTHON_CMD "$GIT_SCRIPTS/create_checksums.py" --target rules --source svn >/dev/null 2>&1 || EXIT_CODE=$?
+    if [[ "$EXIT_CODE" -ne 0 ]]; then
+        echo -e "${GREEN}PASS${NC}: Invalid --source rejected (exit=$EXIT_CODE)"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: Invalid --source should have been rejected"
+        ((FAIL_COUNT++))
+    fi
+
+    rm -rf "$GIT_PROJECT"
+fi
+echo ""
+
+echo "=================================================="
+echo "Test: Compact checksum store (common.checksums.format: binary)"
+echo "=================================================="
+
+INSTALLED_CONFIG=".claude/doc-advisor/config.yaml"
+rm -rf .claude/doc-advisor/toc/rules/.toc_work
+find rules -name "*.md" -exec touch -d "1 hour ago" {} +
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+YAML_ENTRIES=$(sed -n '/^checksums:/,$p' "$RULES_CHECKSUMS")
+
+sed -i.bak 's/^    format: yaml$/    format: binary/' "$INSTALLED_CONFIG"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules 2>&1)
+test_result "Binary store written with magic header" "DACS" "$(head -c 4 "$RULES_CHECKSUMS")"
+REUSED=$(echo "$OUTPUT" | grep -oE '再ハッシュ省略（stat 一致）: [0-9]+' | grep -oE '[0-9]+$' || echo "")
+test_result "YAML store read before switching format (stats reused)" "$RULES_FILE_COUNT" "$REUSED"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules 2>&1)
+REUSED=$(echo "$OUTPUT" | grep -oE '再ハッシュ省略（stat 一致）: [0-9]+' | grep -oE '[0-9]+$' || echo "")
+test_result "Binary store read back (stats reused)" "$RULES_FILE_COUNT" "$REUSED"
+
+EXPORTED=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules --export-yaml 2>&1 | sed -n '/^checksums:/,$p')
+test_result "--export-yaml matches the YAML form" "$YAML_ENTRIES" "$EXPORTED"
+
+RULES_TOC_CREATED=0
+if [[ ! -f .claude/doc-advisor/toc/rules/rules_toc.yaml ]]; then
+    touch .claude/doc-advisor/toc/rules/rules_toc.yaml
+    RULES_TOC_CREATED=1
+fi
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" 2>&1)
+if echo "$OUTPUT" | grep -q "No changes"; then
+    echo -e "${GREEN}PASS${NC}: create_pending_yaml reads binary store (no changes)"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: create_pending_yaml with binary store: $OUTPUT"
+    ((FAIL_COUNT++))
+fi
+echo "" >> rules/coding_standards.md
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" >/dev/null 2>&1 || true
+test_result "Changed file detected against binary store" "1" "$(ls .claude/doc-advisor/toc/rules/.toc_work/*.yaml 2>/dev/null | wc -l | tr -d ' ')"
+test_result "Pending snapshot written in binary format" "DACS" "$(head -c 4 .claude/doc-advisor/toc/rules/.toc_work/.toc_checksums_pending.yaml 2>/dev/null)"
+head -n -1 rules/coding_standards.md > rules/coding_standards.md.tmp
+mv rules/coding_standards.md.tmp rules/coding_standards.md
+
+mv "$INSTALLED_CONFIG.bak" "$INSTALLED_CONFIG"
+[[ $RULES_TOC_CREATED -eq 1 ]] && rm -f .claude/doc-advisor/toc/rules/rules_toc.yaml
+rm -rf .claude/doc-advisor/toc/rules/.toc_work
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+echo ""
+
 echo "=================================================="
 echo "Summary"
 echo "=================================================="
@@ -204,6 +204,99 @@ else
 fi
 echo ""
 
+echo "=================================================="
+echo "Test: merge reuses Phase 1 scan result (.scan.json)"
+echo "=================================================="
+
+SCAN_FILE=".claude/doc-advisor/toc/specs/.toc_work/.scan.json"
+if [[ -f "$SCAN_FILE" ]]; then
+    echo -e "${GREEN}PASS${NC}: .scan.json saved by create_pending_yaml_specs.py"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: .scan.json not saved"
+    ((FAIL_COUNT++))
+fi
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1)
+if echo "$OUTPUT" | grep -q "Using Phase 1 scan result"; then
+    echo -e "${GREEN}PASS${NC}: merge_specs_toc.py reused the scan result"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: merge_specs_toc.py re-scanned the tree"
+    ((FAIL_COUNT++))
+fi
+
+# A scan result saved with different settings must be ignored
+$PYTHON_CMD - "$SCAN_FILE" << 'PYEOF'
+import json, sys
+path = sys.argv[1]
+with open(path, encoding='utf-8') as f:
+    data = json.load(f)
+data['fingerprint']['exclude'] = ['something-else']
+with open(path, 'w', encoding='utf-8') as f:
+    json.dump(data, f)
+PYEOF
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1)
+if echo "$OUTPUT" | grep -q "Using Phase 1 scan result"; then
+    echo -e "${RED}FAIL${NC}: Stale scan result was reused"
+    ((FAIL_COUNT++))
+else
+    echo -e "${GREEN}PASS${NC}: Stale scan result ignored"
+    ((PASS_COUNT++))
+fi
+
+# A file deleted after Phase 1 must not be trusted from .scan.json
+GONE_DIR="specs/main/requirements"
+GONE_FILE="$GONE_DIR/scan_gone.md"
+GONE_PENDING=".claude/doc-advisor/toc/specs/.toc_work/specs_main_requirements_scan_gone.yaml"
+echo "# Gone Spec" > "$GONE_FILE"
+# Old directory mtime: a just-modified directory is never trusted (racy)
+touch -d '1 hour ago' "$GONE_DIR"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" --full > /dev/null 2>&1 || true
+$PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" \
+    --entry-file "$GONE_PENDING" \
+    --title "Gone Spec" \
+    --purpose "Deleted between Phase 1 and merge" \
+    --content-details "Item1 ||| Item2 ||| Item3 ||| Item4 ||| Item5" \
+    --applicable-tasks "Testing" \
+    --keywords "gone ||| spec ||| scan ||| stale ||| test" \
+    --force > /dev/null 2>&1 || true
+rm -f "$GONE_FILE"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental 2>&1)
+test_result "Scan result rescanned after a file deletion" "0" \
+    "$(echo "$OUTPUT" | grep -c "Using Phase 1 scan result")"
+test_result "File deleted after Phase 1 skipped" "1" \
+    "$(echo "$OUTPUT" | grep -c "Skipped (excluded or missing: $GONE_FILE)")"
+
+# Deletion-only cycle: Phase 1 drops the earlier .scan.json, delete-only ignores a leftover one
+echo "# Gone Spec" > "$GONE_FILE"
+touch -d '1 hour ago' "$GONE_DIR"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" --full > /dev/null 2>&1 || true
+$PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" \
+    --entry-file "$GONE_PENDING" \
+    --title "Gone Spec" \
+    --purpose "Deleted in a deletion-only cycle" \
+    --content-details "Item1 ||| Item2 ||| Item3 ||| Item4 ||| Item5" \
+    --applicable-tasks "Testing" \
+    --keywords "gone ||| spec ||| scan ||| stale ||| test" \
+    --force > /dev/null 2>&1 || true
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental > /dev/null 2>&1 || true
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs > /dev/null 2>&1 || true
+cp "$SCAN_FILE" "$SCAN_FILE.saved"
+rm -f "$GONE_FILE"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" 2>&1)
+test_result "Deletion-only Phase 1 detected" "1" "$(echo "$OUTPUT" | grep -c "Deleted files only")"
+test_result "Deletion-only Phase 1 removes .scan.json" "no" "$([[ -f "$SCAN_FILE" ]] && echo yes || echo no)"
+mv "$SCAN_FILE.saved" "$SCAN_FILE"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --delete-only 2>&1)
+test_result "delete-only ignores a leftover .scan.json" "0" \
+    "$(echo "$OUTPUT" | grep -c "Using Phase 1 scan result")"
+test_result "delete-only removes the deleted file's entry" "1" \
+    "$(echo "$OUTPUT" | grep -c "Deleted.*: $GONE_FILE")"
+test_result "Deleted file's entry gone from specs_toc.yaml" "0" \
+    "$(grep -c "$GONE_FILE" .claude/doc-advisor/toc/specs/specs_toc.yaml)"
+echo ""
+
 echo "=================================================="
 echo "Test: merge with --cleanup option"
 echo "=================================================="
@@ -235,6 +328,762 @@ else
 fi
 echo ""
 
+echo "=================================================="
+echo "Test: Work database (common.work.db)"
+echo "=================================================="
+
+INSTALLED_CONFIG=".claude/doc-advisor/config.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+sed -i.bak 's/^    db: false$/    db: true/' "$INSTALLED_CONFIG"
+rm -rf "$SPECS_WORK"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" --full >/dev/null 2>&1 || true
+
+test_result "work.db created" "1" "$([[ -f "$SPECS_WORK/work.db" ]] && echo 1 || echo 0)"
+test_result "No per-file pending YAMLs" "0" "$(ls "$SPECS_WORK"/*.yaml 2>/dev/null | wc -l | tr -d ' ')"
+
+PENDING_LIST=$($PYTHON_CMD "$SCRIPTS_DIR/toc_work.py" --target specs --list 2>/dev/null)
+SPECS_MD_COUNT=$(find specs \( -path "*/requirements/*.md" -o -path "*/design/*.md" \) | wc -l | tr -d ' ')
+test_result "toc_work.py --list shows pending entries" "$SPECS_MD_COUNT" "$(echo "$PENDING_LIST" | grep -c $'\tpending$')"
+
+write_db_entry() {
+    $PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" \
+        --entry-file "$1" \
+        --title "DB Entry" \
+        --purpose "Stored in work.db" \
+        --content-details "a ||| b ||| c ||| d ||| e" \
+        --applicable-tasks "test" \
+        --keywords "a ||| b ||| c ||| d ||| e" \
+        --references "" >/dev/null 2>&1
+}
+
+FIRST_ENTRY=$(echo "$PENDING_LIST" | head -1 | cut -f1)
+write_db_entry "$FIRST_ENTRY"
+test_result "write_specs_pending.py updates work.db row" "0" "$?"
+test_result "Entry stays out of the file layout" "0" "$([[ -f "$FIRST_ENTRY" ]] && echo 1 || echo 0)"
+EXIT_CODE=0
+write_db_entry "$FIRST_ENTRY" || EXIT_CODE=$?
+test_result "Completed row requires --force" "1" "$EXIT_CODE"
+EXIT_CODE=0
+write_db_entry "$SPECS_WORK/specs_no_such_file.yaml" || EXIT_CODE=$?
+test_result "Unknown entry reported as not found" "1" "$EXIT_CODE"
+
+# Export: per-file layout carries pending and completed entries
+$PYTHON_CMD "$SCRIPTS_DIR/toc_work.py" --target specs --export >/dev/null 2>&1
+test_result "--export removes work.db" "0" "$([[ -f "$SPECS_WORK/work.db" ]] && echo 1 || echo 0)"
+test_result "--export writes one YAML per entry" "$SPECS_MD_COUNT" "$(ls "$SPECS_WORK"/*.yaml 2>/dev/null | wc -l | tr -d ' ')"
+if grep -q "status: completed" "$FIRST_ENTRY" && grep -q "references: \[\]" "$FIRST_ENTRY"; then
+    echo -e "${GREEN}PASS${NC}: Exported entry keeps completed fields"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Exported entry content"
+    ((FAIL_COUNT++))
+fi
+
+# Back to work.db for the merge: remaining entries completed in the database
+rm -rf "$SPECS_WORK"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" --full >/dev/null 2>&1 || true
+for entry_file in $($PYTHON_CMD "$SCRIPTS_DIR/toc_work.py" --target specs --list | cut -f1); do
+    write_db_entry "$entry_file"
+done
+test_result "No pending entries remain" "0" "$($PYTHON_CMD "$SCRIPTS_DIR/toc_work.py" --target specs --list | wc -l | tr -d ' ')"
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full --cleanup >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "merge_specs_toc.py reads work.db" "0" "$EXIT_CODE"
+test_result "Merged entries from work.db" "$SPECS_MD_COUNT" "$(grep -c 'title: DB Entry' .claude/doc-advisor/toc/specs/specs_toc.yaml)"
+test_result "--cleanup removes work area" "0" "$([[ -d "$SPECS_WORK" ]] && echo 1 || echo 0)"
+
+mv "$INSTALLED_CONFIG.bak" "$INSTALLED_CONFIG"
+echo ""
+
+echo "=================================================="
+echo "Test: Incremental merge splices changed entries"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+EXTRA_SPEC="specs/main/design/session_api.md"
+echo "# Session API" > "$EXTRA_SPEC"
+
+write_spliced_toc() {
+    cat > "$SPECS_TOC" << 'EOF'
+# .claude/doc-advisor/toc/specs/specs_toc.yaml
+
+metadata:
+  name: Test
+  generated_at: 2026-01-01T00:00:00Z
+  file_count: 3
+
+docs:
+  specs/main/design/removed_api.md:
+    doc_type: design
+    title: Removed
+  specs/main/design/session_api.md:
+    doc_type: design
+    title: Session   # hand-edited, kept verbatim
+    keywords:
+      - session
+  specs/main/requirements/user_authentication.md:
+    doc_type: requirement
+    title: Old title
+EOF
+}
+
+write_completed_entry() {
+    cat > "$SPECS_WORK/$1.yaml" << EOF
+_meta:
+  source_file: $2
+  doc_type: $3
+  status: completed
+  updated_at: "2026-01-31T00:00:00Z"
+
+title: $4
+purpose: Splice test
+content_details:
+  - a
+applicable_tasks:
+  - t
+keywords:
+  - k
+references: []
+EOF
+}
+
+write_spliced_toc
+rm -rf "$SPECS_WORK"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Replaced"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "Added"
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental 2>&1)
+test_result "Incremental splice exit code" "0" "$?"
+test_result "Splice summary" "1" "$(echo "$OUTPUT" | grep -c '(1 added, 1 replaced, 1 deleted)')"
+test_result "Stale entry reported" "1" "$(echo "$OUTPUT" | grep -c 'Deleted (stale): specs/main/design/removed_api.md')"
+test_result "Unchanged entry copied verbatim" "1" "$(grep -c 'title: Session   # hand-edited, kept verbatim' "$SPECS_TOC")"
+test_result "Changed entry replaced" "Replaced" "$(grep -A2 '^  specs/main/requirements/user_authentication.md:' "$SPECS_TOC" | grep 'title:' | sed 's/.*title: //')"
+test_result "Entries in sorted order" \
+    "specs/main/design/authentication_api.md specs/main/design/session_api.md specs/main/requirements/user_authentication.md" \
+    "$(grep -E '^  specs/' "$SPECS_TOC" | tr -d ' :' | tr '\n' ' ' | sed 's/ $//')"
+test_result "file_count updated" "1" "$(grep -c '^  file_count: 3$' "$SPECS_TOC")"
+
+# Unsorted ToC (e.g. hand-edited) falls back to a full rewrite
+write_spliced_toc
+sed -i.bak 's|^  specs/main/design/removed_api.md:|  specs/main/zz_removed.md:|' "$SPECS_TOC"
+rm -f "$SPECS_TOC.bak"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental 2>&1)
+test_result "Unsorted ToC merge exit code" "0" "$?"
+test_result "Unsorted ToC rewritten in full" "1" "$(echo "$OUTPUT" | grep -c 'Rewriting specs_toc.yaml in full')"
+test_result "Full rewrite keeps entries" "3" "$(grep -cE '^  specs/' "$SPECS_TOC")"
+
+rm -rf "$SPECS_WORK"
+rm -f "$EXTRA_SPEC" "$SPECS_TOC" "$SPECS_TOC.bak"
+echo ""
+
+echo "=================================================="
+echo "Test: Atomic ToC writes and hard-link backup"
+echo "=================================================="
+
+RULES_TOC=".claude/doc-advisor/toc/rules/rules_toc.yaml"
+RULES_WORK=".claude/doc-advisor/toc/rules/.toc_work"
+file_inode() {
+    $PYTHON_CMD -c "import os, sys; print(os.stat(sys.argv[1]).st_ino)" "$1"
+}
+file_mode() {
+    $PYTHON_CMD -c "import os, stat, sys; print(oct(stat.S_IMODE(os.stat(sys.argv[1]).st_mode)))" "$1"
+}
+
+rm -rf "$RULES_WORK"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" --full >/dev/null 2>&1 || true
+for entry_file in "$RULES_WORK"/*.yaml; do
+    $PYTHON_CMD "$SCRIPTS_DIR/write_rules_pending.py" \
+        --entry-file "$entry_file" \
+        --title "Atomic" \
+        --purpose "Atomic write test" \
+        --content-details "a ||| b ||| c ||| d ||| e" \
+        --applicable-tasks "t" \
+        --keywords "a ||| b ||| c ||| d ||| e" \
+        --force >/dev/null 2>&1
+done
+$PYTHON_CMD "$SCRIPTS_DIR/merge_rules_toc.py" --mode full >/dev/null 2>&1
+chmod 640 "$RULES_TOC"
+OLD_INODE=$(file_inode "$RULES_TOC")
+OLD_CONTENT=$(cat "$RULES_TOC")
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/merge_rules_toc.py" --mode full >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "Merge exit code" "0" "$EXIT_CODE"
+test_result "Backup is the previous file (hard link, no copy)" "$OLD_INODE" "$(file_inode "$RULES_TOC.bak")"
+test_result "Backup content" "$OLD_CONTENT" "$(cat "$RULES_TOC.bak")"
+test_result "ToC replaced by rename" "1" "$([[ "$(file_inode "$RULES_TOC")" != "$OLD_INODE" ]] && echo 1 || echo 0)"
+test_result "File mode preserved" "0o640" "$(file_mode "$RULES_TOC")"
+test_result "No temporary files left" "0" "$(ls -a "$(dirname "$RULES_TOC")" "$RULES_WORK" | grep -c '\.tmp$')"
+
+# A failed merge leaves the ToC untouched (backup shares its inode until the next write)
+mkdir -p "$RULES_WORK"
+rm -f "$RULES_WORK"/*.yaml
+echo "not: [valid" > "$RULES_WORK/rules_broken.yaml"
+CURRENT_INODE=$(file_inode "$RULES_TOC")
+$PYTHON_CMD "$SCRIPTS_DIR/merge_rules_toc.py" --mode full >/dev/null 2>&1
+test_result "Failed merge keeps the ToC" "$CURRENT_INODE" "$(file_inode "$RULES_TOC")"
+
+rm -rf "$RULES_WORK"
+rm -f "$RULES_TOC" "$RULES_TOC.bak"
+echo ""
+
+echo "=================================================="
+echo "Test: Shared ToC parser (iter_toc_entries)"
+echo "=================================================="
+
+RULES_TOC=".claude/doc-advisor/toc/rules/rules_toc.yaml"
+cat > "$RULES_TOC" << 'EOF'
+# rules_toc.yaml
+metadata:
+  name: Parser test
+  file_count: 1
+
+docs:
+  rules/coding_standards.md:
+    # comment inside an entry
+    title: "Quoted: title"
+    purpose: Purpose
+    content_details:
+      - a
+      - 'b'
+    applicable_tasks: []
+    keywords:
+      - k1
+EOF
+
+query_field() {
+    DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target rules \
+        | $PYTHON_CMD -c "import json, sys; d = json.load(sys.stdin); print($1)"
+}
+test_result "Quotes stripped from values" "Quoted: title" "$(query_field "d['rules/coding_standards.md']['title']")"
+test_result "Quotes stripped from list items" "['a', 'b']" "$(query_field "d['rules/coding_standards.md']['content_details']")"
+test_result "Inline empty list" "[]" "$(query_field "d['rules/coding_standards.md']['applicable_tasks']")"
+
+cat >> "$RULES_TOC" << 'EOF'
+
+  rules/coding_standards.md:
+    title: Duplicate
+trailer:
+  rules/not_an_entry.md:
+    title: After docs
+EOF
+test_result "Entries end at the next top-level line" "['rules/coding_standards.md']" "$(query_field "sorted(d)")"
+test_result "Duplicate key keeps the last entry" "Duplicate" "$(query_field "d['rules/coding_standards.md']['title']")"
+
+# Validators see every occurrence of a key
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_rules_toc.py" 2>&1)
+test_result "Validator reports duplicate key" "1" "$(echo "$OUTPUT" | grep -c "重複パス: 'rules/coding_standards.md'")"
+
+rm -f "$RULES_TOC"
+echo ""
+
+echo "=================================================="
+echo "Test: Parsed ToC sidecar (rules_toc.cache.json)"
+echo "=================================================="
+
+RULES_TOC=".claude/doc-advisor/toc/rules/rules_toc.yaml"
+RULES_SIDECAR=".claude/doc-advisor/toc/rules/rules_toc.cache.json"
+RULES_WORK=".claude/doc-advisor/toc/rules/.toc_work"
+
+rm -rf "$RULES_WORK"
+rm -f "$RULES_TOC" "$RULES_SIDECAR"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" --full >/dev/null 2>&1 || true
+for entry_file in "$RULES_WORK"/*.yaml; do
+    $PYTHON_CMD "$SCRIPTS_DIR/write_rules_pending.py" \
+        --entry-file "$entry_file" \
+        --title "Sidecar" \
+        --purpose "Sidecar test" \
+        --content-details "a ||| b ||| c ||| d ||| e" \
+        --applicable-tasks "t" \
+        --keywords "a ||| b ||| c ||| d ||| e" \
+        --force >/dev/null 2>&1
+done
+$PYTHON_CMD "$SCRIPTS_DIR/merge_rules_toc.py" --mode full >/dev/null 2>&1
+test_result "Merge writes the sidecar" "1" "$([[ -f "$RULES_SIDECAR" ]] && echo 1 || echo 0)"
+
+query_title() {
+    DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target rules rules/coding_standards.md \
+        | $PYTHON_CMD -c "import json, sys; print(json.load(sys.stdin)['rules/coding_standards.md']['title'])"
+}
+test_result "Sidecar matches the text parse" "Sidecar" "$(query_title)"
+
+# A fresh sidecar is loaded instead of the text (marker only present in the sidecar)
+sed -i.bak 's/"title": "Sidecar"/"title": "From sidecar"/' "$RULES_SIDECAR"
+rm -f "$RULES_SIDECAR.bak"
+test_result "Fresh sidecar is used" "From sidecar" "$(query_title)"
+touch "$RULES_TOC"
+test_result "Touched ToC with same content: sidecar still used (hash)" "From sidecar" "$(query_title)"
+
+sed -i.bak 's/^    title: Sidecar$/    title: Edited/' "$RULES_TOC"
+rm -f "$RULES_TOC.bak"
+test_result "Edited ToC: stale sidecar ignored" "Edited" "$(query_title)"
+echo "not json" > "$RULES_SIDECAR"
+test_result "Corrupt sidecar ignored" "Edited" "$(query_title)"
+
+rm -rf "$RULES_WORK"
+rm -f "$RULES_TOC" "$RULES_TOC.bak" "$RULES_SIDECAR"
+echo ""
+
+echo "=================================================="
+echo "Test: Sharded specs ToC (specs.output.shards)"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+SHARDS_DIR=".claude/doc-advisor/toc/specs/shards"
+MANIFEST=".claude/doc-advisor/toc/specs/specs_toc_manifest.yaml"
+CONFIG_FILE=".claude/doc-advisor/config.yaml"
+
+mkdir -p specs/billing/requirements specs/web/admin/design
+echo "# Invoice" > specs/billing/requirements/invoice.md
+echo "# Admin panel" > specs/web/admin/design/panel.md
+sed -i.bak 's/^    shards: false$/    shards: true/' "$CONFIG_FILE"
+
+rm -rf "$SPECS_WORK" "$SHARDS_DIR"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Auth"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "Auth API"
+write_completed_entry specs_billing_requirements_invoice specs/billing/requirements/invoice.md requirement "Invoice"
+write_completed_entry specs_web_admin_design_panel specs/web/admin/design/panel.md design "Panel"
+
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1) || EXIT_CODE=$?
+test_result "Sharded merge exit code" "0" "$EXIT_CODE"
+test_result "One shard per feature" "billing.yaml main.yaml web_admin.yaml" "$(ls "$SHARDS_DIR" | tr '\n' ' ' | sed 's/ $//')"
+test_result "Shard holds its feature's entries" "specs/main/design/authentication_api.md specs/main/requirements/user_authentication.md" \
+    "$(grep -E '^  specs/' "$SHARDS_DIR/main.yaml" | tr -d ' :' | tr '\n' ' ' | sed 's/ $//')"
+test_result "Shard entries copied verbatim" "$(grep -A10 '^  specs/billing/' "$SPECS_TOC")" "$(grep -A10 '^  specs/billing/' "$SHARDS_DIR/billing.yaml")"
+test_result "Manifest shard count" "1" "$(grep -c '^  shard_count: 3$' "$MANIFEST")"
+test_result "Manifest counts by doc_type" "design_count: 1 requirement_count: 1" \
+    "$(sed -n '/^  main:$/,/^  [a-z_]*:$/p' "$MANIFEST" | grep -E '_count:' | grep -v file_count | tr -d ' ' | sed 's/:/: /' | tr '\n' ' ' | sed 's/ $//')"
+test_result "Nested feature path" "1" "$(grep -c '^      - specs/web/admin/$' "$MANIFEST")"
+test_result "Shard passes validate_specs_toc.py" "0" "$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" --file "$SHARDS_DIR/main.yaml" >/dev/null 2>&1; echo $?)"
+
+# Unchanged shards are not rewritten; shards of removed features are deleted
+rm -rf specs/web
+rm -f "$SPECS_WORK/specs_web_admin_design_panel.yaml"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1)
+test_result "Unchanged shards kept, removed feature deleted" "1" "$(echo "$OUTPUT" | grep -c 'Shards: 2 (0 written, 2 unchanged, 1 removed)')"
+test_result "Removed shard file" "0" "$([[ -f "$SHARDS_DIR/web_admin.yaml" ]] && echo 1 || echo 0)"
+
+# Turning sharding off removes the manifest and shards (the advisor reads the manifest if it exists)
+sed -i.bak 's/^    shards: true$/    shards: false/' "$CONFIG_FILE"
+rm -f "$CONFIG_FILE.bak"
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1) || EXIT_CODE=$?
+test_result "Unsharded merge exit code" "0" "$EXIT_CODE"
+test_result "Shards removal reported" "1" "$(echo "$OUTPUT" | grep -c 'Shards disabled: removed specs_toc_manifest.yaml and 2 shards')"
+test_result "Manifest removed when shards off" "0" "$([[ -f "$MANIFEST" ]] && echo 1 || echo 0)"
+test_result "Shards directory removed when shards off" "0" "$([[ -d "$SHARDS_DIR" ]] && echo 1 || echo 0)"
+test_result "ToC still written when shards off" "1" "$(grep -c '^  specs/billing/requirements/invoice.md:$' "$SPECS_TOC")"
+
+rm -rf specs/billing specs/web "$SPECS_WORK" "$SHARDS_DIR"
+rm -f "$SPECS_TOC" "$SPECS_TOC.bak" "$MANIFEST"
+echo ""
+
+echo "=================================================="
+echo "Test: Keyword index and query_toc.py"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_INDEX=".claude/doc-advisor/toc/specs/specs_toc.index.json"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+
+mkdir -p specs/billing/requirements
+echo "# Invoice" > specs/billing/requirements/invoice.md
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC" "$SPECS_INDEX"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "ログイン認証の要件"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "認証 API 設計"
+write_completed_entry specs_billing_requirements_invoice specs/billing/requirements/invoice.md requirement "請求書の発行"
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full >/dev/null 2>&1
+test_result "Merge writes the index" "1" "$([[ -f "$SPECS_INDEX" ]] && echo 1 || echo 0)"
+
+query_paths() {
+    DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" search --target specs "$@" | grep -v '^Query:' | cut -f3 | tr '\n' ' ' | sed 's/ $//'
+}
+test_result "CJK bigram match" "specs/main/design/authentication_api.md specs/main/requirements/user_authentication.md" "$(query_paths 認証)"
+test_result "Katakana word inside a title" "specs/main/requirements/user_authentication.md" "$(query_paths ログイン)"
+test_result "NFKC + case folding" "specs/main/design/authentication_api.md" "$(query_paths ＡＰＩ)"
+test_result "More matched terms rank first" "specs/main/design/authentication_api.md specs/main/requirements/user_authentication.md" "$(query_paths 認証 設計)"
+test_result "--doc-type filter" "specs/main/requirements/user_authentication.md" "$(query_paths --doc-type requirement 認証)"
+test_result "--limit" "specs/main/design/authentication_api.md" "$(query_paths --limit 1 認証 | cut -d' ' -f1)"
+test_result "No match" "" "$(query_paths 存在しない語)"
+test_result "--json output" "2 2" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" search --target specs --json 認証 \
+    | $PYTHON_CMD -c "import json, sys; d = json.load(sys.stdin); print(d['total'], d['results'][0]['matched'] + 1)")"
+
+rank_paths() {
+    DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" rank --target specs "$@" | grep -v '^Query:' | cut -f2 | tr '\n' ' ' | sed 's/ $//'
+}
+test_result "BM25 rank of a task description" "specs/main/requirements/user_authentication.md specs/main/design/authentication_api.md" \
+    "$(rank_paths ログイン画面の認証エラーを修正する)"
+test_result "Rank without a shared keyword" "specs/billing/requirements/invoice.md" "$(rank_paths 請求まわりの不具合)"
+test_result "Rank --doc-type" "specs/main/design/authentication_api.md" "$(rank_paths --doc-type design ログイン認証)"
+test_result "Rank --limit" "1" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" rank --target specs --limit 1 認証 | grep -c '^\.\.\. 1 more')"
+test_result "Rank --json scores descending" "2 True" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" rank --target specs --json 認証 \
+    | $PYTHON_CMD -c "import json, sys; d = json.load(sys.stdin); s = [r['score'] for r in d['results']]; print(d['total'], s == sorted(s, reverse=True) and s[0] > 0)")"
+
+# A ToC edited after the merge: the stale index is rebuilt in memory
+sed -i.bak 's/^    title: 請求書の発行$/    title: 認証の請求書/' "$SPECS_TOC"
+rm -f "$SPECS_TOC.bak"
+OUTPUT=$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" search --target specs 認証)
+test_result "Stale index rebuilt" "1" "$(echo "$OUTPUT" | grep -c '^Note: specs_toc.yaml index missing or outdated')"
+test_result "Rebuilt index sees the edit" "1" "$(echo "$OUTPUT" | grep -c 'specs/billing/requirements/invoice.md')"
+test_result "Rebuilt index saved" "0" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" search --target specs 認証 | grep -c '^Note:')"
+
+# An incremental merge (splice) leaves the index to the first query
+rm -rf "$SPECS_WORK"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_billing_requirements_invoice specs/billing/requirements/invoice.md requirement "請求書の再発行"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental 2>&1)
+test_result "Incremental merge spliced" "1" "$(echo "$OUTPUT" | grep -c '1 replaced')"
+test_result "Splice removes the outdated index" "0" "$([[ -f "$SPECS_INDEX" ]] && echo 1 || echo 0)"
+OUTPUT=$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" search --target specs 再発行)
+test_result "Index rebuilt after a splice" "1" "$(echo "$OUTPUT" | grep -c '^Note: specs_toc.yaml index missing or outdated')"
+test_result "Rebuilt index sees the spliced entry" "1" "$(echo "$OUTPUT" | grep -c 'specs/billing/requirements/invoice.md')"
+test_result "Index saved on first query" "1" "$([[ -f "$SPECS_INDEX" ]] && echo 1 || echo 0)"
+
+rm -rf specs/billing "$SPECS_WORK"
+rm -f "$SPECS_TOC" "$SPECS_TOC.bak" "$SPECS_INDEX" .claude/doc-advisor/toc/specs/specs_toc.cache.json
+echo ""
+
+echo "=================================================="
+echo "Test: Reference graph and query_toc.py refs"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_GRAPH=".claude/doc-advisor/toc/specs/specs_toc.graph.json"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+
+# ToC order: design/authentication_api (0), requirements/overview (1), requirements/user_authentication (2)
+# design -> user_authentication (plus abstract and self references); user_authentication -> overview (relative path)
+mkdir -p specs/main/requirements specs/main/design
+echo "# Overview" > specs/main/requirements/overview.md
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC" "$SPECS_GRAPH"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_overview specs/main/requirements/overview.md requirement "Overview"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Auth"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "Auth API"
+$PYTHON_CMD - "$SPECS_WORK" <<'EOF'
+import sys
+from pathlib import Path
+work = Path(sys.argv[1])
+links = {
+    'specs_main_requirements_user_authentication': ['overview.md#scope'],
+    'specs_main_design_authentication_api': ['specs/main/requirements/user_authentication.md',
+                                             'error handling design document',
+                                             './specs/main/design/authentication_api.md'],
+}
+for name, refs in links.items():
+    path = work / f'{name}.yaml'
+    text = path.read_text(encoding='utf-8')
+    path.write_text(text.replace('references: []', 'references:\n' + ''.join(f'  - "{r}"\n' for r in refs)), encoding='utf-8')
+EOF
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full >/dev/null 2>&1
+test_result "Merge writes the reference graph" "1" "$([[ -f "$SPECS_GRAPH" ]] && echo 1 || echo 0)"
+test_result "Graph arrays (self and abstract references dropped)" "[[0, 1, 1, 2], [2, 1]] [[0, 0, 1, 2], [2, 0]]" \
+    "$(tail -1 "$SPECS_GRAPH" | $PYTHON_CMD -c "import json, sys; d = json.load(sys.stdin); print(d['forward'], d['backward'])")"
+
+refs_lines() {
+    DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs "$@" | grep -v '^Seeds:' | tr '\t\n' ': ' | sed 's/ $//'
+}
+test_result "refs 1 hop (both directions)" \
+    "0:requirement:specs/main/requirements/user_authentication.md 1:design:specs/main/design/authentication_api.md 1:requirement:specs/main/requirements/overview.md" \
+    "$(refs_lines specs/main/requirements/user_authentication.md)"
+test_result "refs --direction in" "0:requirement:specs/main/requirements/user_authentication.md 1:design:specs/main/design/authentication_api.md" \
+    "$(refs_lines --direction in specs/main/requirements/user_authentication.md)"
+test_result "refs --direction out --hops 0" "0:design:specs/main/design/authentication_api.md" \
+    "$(refs_lines --direction out --hops 0 specs/main/design/authentication_api.md)"
+test_result "refs --direction out stops at --hops" "0:design:specs/main/design/authentication_api.md 1:requirement:specs/main/requirements/user_authentication.md" \
+    "$(refs_lines --direction out specs/main/design/authentication_api.md)"
+test_result "refs 2 hops --direction in" \
+    "0:requirement:specs/main/requirements/overview.md 1:requirement:specs/main/requirements/user_authentication.md 2:design:specs/main/design/authentication_api.md" \
+    "$(refs_lines --direction in --hops 2 specs/main/requirements/overview.md)"
+test_result "refs --doc-type keeps the seeds" "0:requirement:specs/main/requirements/overview.md 2:design:specs/main/design/authentication_api.md" \
+    "$(refs_lines --direction in --hops 2 --doc-type design specs/main/requirements/overview.md)"
+test_result "refs --json" "design 1" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs --json --direction in specs/main/requirements/user_authentication.md \
+    | $PYTHON_CMD -c "import json, sys; r = json.load(sys.stdin)['results'][1]; print(r['doc_type'], r['distance'])")"
+EXIT_CODE=0
+OUTPUT=$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs specs/none.md 2>&1) || EXIT_CODE=$?
+test_result "refs unknown path exit code" "1" "$EXIT_CODE"
+test_result "refs unknown path message" "1" "$(echo "$OUTPUT" | grep -c '^Error: Not in specs_toc.yaml: specs/none.md')"
+
+# A ToC edited after the merge: the stale graph is rebuilt in memory
+sed -i.bak '/^      - "overview.md#scope"$/d' "$SPECS_TOC"
+sed -i.bak 's/^    references:$/    references: []/' "$SPECS_TOC"
+rm -f "$SPECS_TOC.bak"
+OUTPUT=$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs --direction out specs/main/requirements/user_authentication.md)
+test_result "Stale graph rebuilt" "1" "$(echo "$OUTPUT" | grep -c '^Note: specs_toc.yaml reference graph missing or outdated')"
+test_result "Rebuilt graph sees the edit" "0" "$(echo "$OUTPUT" | grep -c 'overview.md')"
+test_result "Rebuilt graph saved" "0" "$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs specs/main/requirements/user_authentication.md | grep -c '^Note:')"
+
+# An incremental merge (splice) leaves the graph to its first use
+rm -rf "$SPECS_WORK"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_overview specs/main/requirements/overview.md requirement "Overview 2"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode incremental 2>&1)
+test_result "Incremental merge spliced (graph)" "1" "$(echo "$OUTPUT" | grep -c '1 replaced')"
+test_result "Splice removes the outdated graph" "0" "$([[ -f "$SPECS_GRAPH" ]] && echo 1 || echo 0)"
+OUTPUT=$(DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" refs --target specs --direction in specs/main/requirements/user_authentication.md)
+test_result "Graph rebuilt after a splice" "1" "$(echo "$OUTPUT" | grep -c '^Note: specs_toc.yaml reference graph missing or outdated')"
+test_result "Rebuilt graph keeps the links" "1" "$(echo "$OUTPUT" | grep -c 'specs/main/design/authentication_api.md')"
+test_result "Graph saved on first use" "1" "$([[ -f "$SPECS_GRAPH" ]] && echo 1 || echo 0)"
+
+rm -rf "$SPECS_WORK"
+rm -f specs/main/requirements/overview.md "$SPECS_TOC" "$SPECS_TOC.bak" "$SPECS_GRAPH"
+rm -f .claude/doc-advisor/toc/specs/specs_toc.cache.json .claude/doc-advisor/toc/specs/specs_toc.index.json
+echo ""
+
+echo "=================================================="
+echo "Test: validate_specs_toc.py references check"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+
+set_references() {
+    $PYTHON_CMD - "$SPECS_WORK/$1.yaml" "${@:2}" <<'EOF'
+import sys
+from pathlib import Path
+path = Path(sys.argv[1])
+refs = ''.join(f'  - "{r}"\n' for r in sys.argv[2:])
+path.write_text(path.read_text(encoding='utf-8').replace('references: []', 'references:\n' + refs), encoding='utf-8')
+EOF
+}
+
+# requirement <-> design cycle; a path outside the scanned directories; a missing path; an abstract reference
+mkdir -p specs/main/plan
+echo "# Roadmap" > specs/main/plan/roadmap.md
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Auth"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "Auth API"
+set_references specs_main_requirements_user_authentication specs/main/design/authentication_api.md
+set_references specs_main_design_authentication_api specs/main/requirements/user_authentication.md \
+    specs/main/plan/roadmap.md ../plan/roadmap.md specs/main/design/missing.md "error handling design document"
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full >/dev/null 2>&1
+
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1) || EXIT_CODE=$?
+test_result "Dangling reference fails validation" "1" "$EXIT_CODE"
+test_result "Dangling reference reported" "1" "$(echo "$OUTPUT" | grep -c "リンク切れ: specs/main/design/authentication_api.md の参照 'specs/main/design/missing.md'")"
+test_result "Only the missing path is dangling" "1" "$(echo "$OUTPUT" | grep -c '1件のリンク切れ')"
+test_result "Cycle reported as a warning" "1" \
+    "$(echo "$OUTPUT" | grep -c '循環参照: specs/main/design/authentication_api.md ⇔ specs/main/requirements/user_authentication.md')"
+
+sed -i.bak '/^      - specs\/main\/design\/missing.md$/d' "$SPECS_TOC"
+rm -f "$SPECS_TOC.bak"
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1) || EXIT_CODE=$?
+test_result "Cycle alone passes validation" "0" "$EXIT_CODE"
+test_result "Path references counted" "1" "$(echo "$OUTPUT" | grep -c '参照リンク検査: OK（4件のパス参照を確認）')"
+test_result "Edited ToC: cycle still found" "1" "$(echo "$OUTPUT" | grep -c '循環参照検査: 1件の循環（警告）')"
+
+rm -rf specs/main/plan "$SPECS_WORK"
+rm -f "$SPECS_TOC" .claude/doc-advisor/toc/specs/specs_toc.{cache,index,graph}.json
+echo ""
+
+echo "=================================================="
+echo "Test: Validators check files against one scan (--timings)"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+
+# plan/ is outside target_dirs (not scanned) but exists: falls back to a disk check
+mkdir -p specs/main/plan specs/main/requirements
+echo "# Roadmap" > specs/main/plan/roadmap.md
+echo "# Gone" > specs/main/requirements/gone.md
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Auth"
+write_completed_entry specs_main_plan_roadmap specs/main/plan/roadmap.md requirement "Roadmap"
+write_completed_entry specs_main_requirements_gone specs/main/requirements/gone.md requirement "Gone"
+$PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full >/dev/null 2>&1
+rm -f specs/main/requirements/gone.md
+
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" --timings 2>&1) || EXIT_CODE=$?
+test_result "Deleted file fails validation" "1" "$EXIT_CODE"
+test_result "Deleted file reported" "1" "$(echo "$OUTPUT" | grep -c "ファイル不在: 'specs/main/requirements/gone.md'")"
+test_result "Unscanned existing file accepted" "0" "$(echo "$OUTPUT" | grep -c "ファイル不在: 'specs/main/plan/roadmap.md'")"
+test_result "--timings stages and total (specs)" "8" "$(echo "$OUTPUT" | sed -n '/^処理時間:/,$p' | grep -cE '^ +[0-9]+\.[0-9] ms  ')"
+test_result "--timings total (specs)" "1" "$(echo "$OUTPUT" | grep -cE '^ +[0-9]+\.[0-9] ms  合計$')"
+test_result "No timings by default" "0" "$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1 | grep -c '^処理時間:')"
+
+RULES_TOC=".claude/doc-advisor/toc/rules/rules_toc.yaml"
+cat > "$RULES_TOC" << 'EOF'
+docs:
+  rules/coding_standards.md:
+    title: Coding standards
+    purpose: Purpose
+    content_details:
+      - a
+    applicable_tasks:
+      - t
+    keywords:
+      - k
+EOF
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_rules_toc.py" --timings 2>&1) || EXIT_CODE=$?
+test_result "Scanned file passes (rules)" "0" "$EXIT_CODE"
+test_result "--timings scan stage (rules)" "1" "$(echo "$OUTPUT" | grep -cE '^ +[0-9]+\.[0-9] ms  ディレクトリ走査$')"
+rm -f "$RULES_TOC"
+
+rm -rf specs/main/plan "$SPECS_WORK"
+rm -f "$SPECS_TOC" .claude/doc-advisor/toc/specs/specs_toc.{cache,index,graph}.json
+echo ""
+
+echo "=================================================="
+echo "Test: Entry schema checked once at write time"
+echo "=================================================="
+
+SPECS_TOC=".claude/doc-advisor/toc/specs/specs_toc.yaml"
+SPECS_WORK=".claude/doc-advisor/toc/specs/.toc_work"
+DESIGN_ENTRY="$SPECS_WORK/specs_main_design_authentication_api.yaml"
+
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC"
+mkdir -p "$SPECS_WORK"
+write_completed_entry specs_main_requirements_user_authentication specs/main/requirements/user_authentication.md requirement "Unstamped"
+write_completed_entry specs_main_design_authentication_api specs/main/design/authentication_api.md design "Stamped"
+
+write_stamped_entry() {
+    $PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" --force \
+        --entry-file "$DESIGN_ENTRY" \
+        --title "$1" \
+        --purpose "Schema test" \
+        --content-details "a ||| b ||| c ||| d ||| e" \
+        --applicable-tasks "t" \
+        --keywords "a ||| b ||| c ||| d ||| e" >/dev/null 2>&1
+}
+
+write_stamped_entry "Stamped"
+test_result "Writer stamps _meta.schema_stamp" "1" "$(grep -cE '^  schema_stamp: v[0-9]+-[0-9a-f]{16}$' "$DESIGN_ENTRY")"
+EXIT_CODE=0
+write_stamped_entry "" || EXIT_CODE=$?
+test_result "Empty title rejected at write time" "2" "$EXIT_CODE"
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1)
+test_result "Stamped entry trusted, unstamped checked" "1" "$(echo "$OUTPUT" | grep -c '^Schema: 1 stamped at write time, 1 checked, 0 invalid$')"
+test_result "Schema version recorded in sidecar" "1" \
+    "$($PYTHON_CMD -c "import json, sys; print(json.loads(open(sys.argv[1]).readline()).get('schema_version'))" \
+        .claude/doc-advisor/toc/specs/specs_toc.cache.json)"
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1) || EXIT_CODE=$?
+test_result "Validate passes after clean merge" "0" "$EXIT_CODE"
+test_result "Validate skips field check after merge" "1" "$(echo "$OUTPUT" | grep -c '必須フィールド検査: OK.*merge 時に検査済み')"
+
+# Hand-edited ToC: the sidecar is stale, every entry is checked again
+sed -i.bak '/^  specs\/main\/requirements\/user_authentication.md:/,/^  specs\//{/^    keywords:/d;/^      - k$/d;}' "$SPECS_TOC"
+rm -f "$SPECS_TOC.bak"
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1) || EXIT_CODE=$?
+test_result "Hand-edited ToC checked again" "1" "$EXIT_CODE"
+test_result "Hand-edited entry reported" "1" \
+    "$(echo "$OUTPUT" | grep -c "必須配列フィールド不正: specs/main/requirements/user_authentication.md の 'keywords'")"
+
+# Edited entry (stamp no longer matches) and invalid unstamped entry: checked, warned, still merged
+sed -i.bak 's/^title: Stamped$/title: Edited/' "$DESIGN_ENTRY"
+sed -i.bak '/^keywords:$/,/^references/{/^keywords:$/s/.*/keywords: []/;/^  - k$/d;}' "$SPECS_WORK/specs_main_requirements_user_authentication.yaml"
+rm -f "$SPECS_WORK"/*.bak
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full 2>&1) || EXIT_CODE=$?
+test_result "Merge with invalid entry exit code" "0" "$EXIT_CODE"
+test_result "Edited stamp checked again" "1" "$(echo "$OUTPUT" | grep -c '^Schema: 0 stamped at write time, 2 checked, 1 invalid$')"
+test_result "Invalid entry warned" "1" \
+    "$(echo "$OUTPUT" | grep -c 'specs_main_requirements_user_authentication.yaml: keywords requires at least 1 items (got 0)')"
+test_result "No schema version for invalid ToC" "None" \
+    "$($PYTHON_CMD -c "import json, sys; print(json.loads(open(sys.argv[1]).readline()).get('schema_version'))" \
+        .claude/doc-advisor/toc/specs/specs_toc.cache.json)"
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" 2>&1) || EXIT_CODE=$?
+test_result "Validate checks unchecked ToC" "1" "$EXIT_CODE"
+
+# work.db version 1 gains the schema_stamp column
+rm -rf "$SPECS_WORK"
+mkdir -p "$SPECS_WORK"
+$PYTHON_CMD - "$SPECS_WORK/work.db" <<'PYEOF'
+import sqlite3, sys
+conn = sqlite3.connect(sys.argv[1])
+conn.executescript("""
+    CREATE TABLE entries (name TEXT PRIMARY KEY, source_file TEXT NOT NULL UNIQUE, doc_type TEXT,
+        status TEXT NOT NULL DEFAULT 'pending', updated_at TEXT, title TEXT, purpose TEXT,
+        content_details TEXT NOT NULL DEFAULT '[]', applicable_tasks TEXT NOT NULL DEFAULT '[]',
+        keywords TEXT NOT NULL DEFAULT '[]', "references" TEXT);
+    INSERT INTO entries (name, source_file, doc_type) VALUES
+        ('specs_main_design_authentication_api.yaml', 'specs/main/design/authentication_api.md', 'design');
+    PRAGMA user_version = 1;
+""")
+conn.close()
+PYEOF
+write_stamped_entry "From work.db"
+test_result "Version 1 work.db written" "0" "$?"
+test_result "Version 1 work.db migrated" "2 1" \
+    "$($PYTHON_CMD -c "import sqlite3, sys; c = sqlite3.connect(sys.argv[1]); print(c.execute('PRAGMA user_version').fetchone()[0], c.execute('SELECT count(*) FROM entries WHERE schema_stamp IS NOT NULL').fetchone()[0])" \
+        "$SPECS_WORK/work.db")"
+
+rm -rf "$SPECS_WORK"
+rm -f "$SPECS_TOC" .claude/doc-advisor/toc/specs/specs_toc.{cache,index,graph}.json
+echo ""
+
+echo "=================================================="
+echo "Test: ToC lock (.toc.lock)"
+echo "=================================================="
+
+RULES_TOC=".claude/doc-advisor/toc/rules/rules_toc.yaml"
+RULES_WORK=".claude/doc-advisor/toc/rules/.toc_work"
+RULES_LOCK=".claude/doc-advisor/toc/rules/.toc.lock"
+CONFIG_FILE=".claude/doc-advisor/config.yaml"
+
+# Hold the lock from another process for $1 seconds
+hold_lock() {
+    $PYTHON_CMD - "$RULES_LOCK" "$1" <<'PYEOF' &
+import fcntl, sys, time
+with open(sys.argv[1], 'a+') as f:
+    fcntl.flock(f, fcntl.LOCK_EX)
+    f.truncate(0)
+    f.write("pid 0 (test holder)\n")
+    f.flush()
+    time.sleep(float(sys.argv[2]))
+PYEOF
+    HOLDER_PID=$!
+    sleep 0.5
+}
+
+rm -rf "$RULES_WORK"
+$PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" --full > /tmp/lock_output.txt 2>&1 || true
+test_result "Uncontended run reports lock times" "1" "$(grep -c '^Lock: waited 0\.[0-9]*s, held' /tmp/lock_output.txt)"
+
+sed -i.bak 's/^    timeout: 600$/    timeout: 1/' "$CONFIG_FILE"
+hold_lock 4
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/merge_rules_toc.py" --mode full 2>&1) || EXIT_CODE=$?
+test_result "Merge fails while lock is held" "1" "$EXIT_CODE"
+test_result "Error names the holder" "1" "$(echo "$OUTPUT" | grep -c 'still held by pid 0 (test holder)')"
+wait "$HOLDER_PID"
+
+sed -i.bak 's/^    timeout: 1$/    timeout: 10/' "$CONFIG_FILE"
+hold_lock 2
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_rules.py" --full 2>&1) || EXIT_CODE=$?
+test_result "Waiting run succeeds after release" "0" "$EXIT_CODE"
+test_result "Waiting message printed" "1" "$(echo "$OUTPUT" | grep -c '^Waiting for lock')"
+test_result "Wait time reported" "1" "$(echo "$OUTPUT" | grep -cE '^Lock: waited [1-9][0-9]*\.[0-9]+s')"
+wait "$HOLDER_PID"
+
+sed -i.bak 's/^    timeout: 10$/    timeout: 600/' "$CONFIG_FILE"
+rm -f "$CONFIG_FILE.bak" /tmp/lock_output.txt
+rm -rf "$RULES_WORK"
+echo ""
+
 echo "=================================================="
 echo "Summary"
 echo "=================================================="
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# doc-advisor-version-xK9XmQ: 3.5
+"""
+.toc_checksums.yaml 生成スクリプト（統合版）
+
+rules/ または specs/ 配下の全 .md ファイルの SHA-256 ハッシュを計算し、
+.toc_checksums.yaml に保存する。incremental モード判定に使用。
+
+使用方法:
+    python3 create_checksums.py --target rules
+    python3 create_checksums.py --target specs
+
+オプション:
+    --paranoid  全ファイルを再ハッシュ（デフォルト: stat 情報が前回と一致するファイルは前回のハッシュを再利用）
+    --jobs N    並列ハッシュ計算のスレッド数（デフォルト: config.yaml の common.parallel.max_workers）
+    --source git
+                git インデックスの blob ID で変更判定（前回と blob ID が一致するクリーンな
+                追跡ファイルはハッシュ計算を省略。未追跡・未コミットの変更があるファイルは SHA-256）
+    --export-yaml [PATH]
+                既存のチェックサムファイルを YAML 形式で PATH（省略時・'-' は標準出力）に書き出す
+                （common.checksums.format: binary の内容確認用。スキャン・ハッシュ計算は行わない）
+"""
+
+import sys
+from pathlib import Path
+
+from toc_utils import get_project_root, load_config, resolve_config_path, get_default_target_dirs, get_system_exclude_patterns, toc_scan
+from toc_utils import compile_exclude_patterns, open_dir_cache
+from toc_utils import ChecksumStore, FileHashCache, get_checksum_format, get_parallel_config, parse_jobs_option
+from toc_utils import load_git_blobs, parse_source_option, delegate_to_server, acquire_toc_lock
+
+
+def write_checksums_file(store, output_path, target, fmt='yaml'):
+    """
+    チェックサムファイルを出力（fmt: 'yaml' または 'binary'）
+
+    Returns:
+        bool: 成功時True、失敗時False
+    """
+    try:
+        store.write(output_path, fmt, comments=[
+            f"{target}_toc.yaml 用チェックサムファイル",
+            "自動生成 - 手動編集禁止",
+        ])
+        return True
+    except (OSError, ValueError) as e:
+        print(f"エラー: ファイル書き込み失敗: {output_path} - {e}")
+        return False
+
+
+def export_yaml(checksums_file, export_path, target):
+    """
+    既存のチェックサムファイル（YAML / バイナリ）を YAML 形式で書き出す
+
+    Args:
+        export_path: 出力先（'-' は標準出力）
+
+    Returns:
+        int: 終了コード
+    """
+    if not checksums_file.exists():
+        print(f"エラー: {checksums_file} が存在しません")
+        return 1
+    store = ChecksumStore.load(checksums_file)
+    if export_path == '-':
+        print('\n'.join(store.to_yaml_lines()))
+        return 0
+    if not write_checksums_file(store, export_path, target):
+        return 1
+    print(f"YAML 書き出し完了: {export_path}（{len(store)} 件）")
+    return 0
+
+
+def main():
+    # オプション解析
+    if '--target' not in sys.argv:
+        print("エラー: --target オプションが必要です（rules または specs）")
+        print("使用方法: python3 create_checksums.py --target rules")
+        print("         python3 create_checksums.py --target specs")
+        return 1
+
+    idx = sys.argv.index('--target')
+    if idx + 1 >= len(sys.argv):
+        print("エラー: --target の値が指定されていません")
+        return 1
+
+    target = sys.argv[idx + 1]
+    if target not in ('rules', 'specs'):
+        print(f"エラー: --target は 'rules' または 'specs' を指定してください（指定: {target}）")
+        return 1
+
+    paranoid = '--paranoid' in sys.argv
+    max_workers, fallback_to_serial = get_parallel_config()
+    jobs = parse_jobs_option(sys.argv, max_workers)
+    if jobs is None:
+        print("エラー: --jobs には 1 以上の整数を指定してください")
+        return 1
+    source = parse_source_option(sys.argv)
+    if source is None:
+        print("エラー: --source には 'hash' または 'git' を指定してください")
+        return 1
+    export_path = None
+    if '--export-yaml' in sys.argv:
+        idx = sys.argv.index('--export-yaml')
+        has_value = idx + 1 < len(sys.argv) and not sys.argv[idx + 1].startswith('--')
+        export_path = sys.argv[idx + 1] if has_value else '-'
+
+    print("=" * 50)
+    print(f".toc_checksums.yaml 生成スクリプト（{target}）")
+    print("=" * 50)
+
+    # 設定読み込み
+    config = load_config(target)
+    try:
+        project_root = get_project_root()
+    except RuntimeError as e:
+        print(f"エラー: {e}")
+        return 1
+
+    root_dir_name = config.get('root_dir', f'{target}').rstrip('/')
+    root_dir = project_root / root_dir_name
+    output_file = resolve_config_path(config.get('checksums_file', '.toc_checksums.yaml'), root_dir, project_root)
+    patterns_config = config.get('patterns', {})
+    # System patterns (always excluded) + user-defined patterns
+    exclude_matcher = compile_exclude_patterns(
+        get_system_exclude_patterns(target) + patterns_config.get('exclude', []))
+
+    if export_path is not None:
+        return export_yaml(output_file, Path(export_path) if export_path != '-' else '-', target)
+
+    # ToC ファイルと同じディレクトリのロックで Phase 1 / マージ / ウォッチャーと直列化
+    toc_file = resolve_config_path(config.get('toc_file', f'{target}_toc.yaml'), root_dir, project_root)
+    lock = acquire_toc_lock(toc_file.parent)
+    if lock is None:
+        return 1
+    try:
+        # Ensure output directory exists
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+
+        if not root_dir.exists():
+            print(f"エラー: {root_dir} が存在しません")
+            return 1
+
+        # 対象ファイル検索（シンボリックリンク対応、exclude / target_dirs 適用）
+        dir_cache = open_dir_cache(output_file)
+        if target == 'rules':
+            target_glob = patterns_config.get('target_glob', '**/*.md')
+            scan = toc_scan(target, root_dir, root_dir_name, exclude_matcher, target_glob=target_glob, dir_cache=dir_cache)
+        else:
+            # target_dirs はマッピング形式: {doc_type: dir_name}
+            target_dirs_map = patterns_config.get('target_dirs', get_default_target_dirs())
+            scan = toc_scan(target, root_dir, root_dir_name, exclude_matcher, target_dirs=target_dirs_map, dir_cache=dir_cache)
+        if dir_cache is not None:
+            print(dir_cache.summary())
+
+        if not scan:
+            print(f"エラー: {root_dir} に .md ファイルが見つかりません")
+            return 1
+
+        print(f"対象ファイル: {len(scan)} 件（並列数: {jobs}）")
+
+        # git モード: クリーンな追跡ファイルの blob ID（取得できなければ SHA-256 のみで判定）
+        git_blobs = load_git_blobs(project_root, root_dir_name) if source == 'git' else None
+
+        # 前回のチェックサムと stat 情報 / blob ID（一致すれば再ハッシュしない）
+        old_store = ChecksumStore.load(output_file)
+        hash_cache = FileHashCache(old_store.hashes, old_store.stats, paranoid, old_store.blobs, git_blobs)
+
+        # ハッシュ計算（スレッドプールで並列実行、出力順はソート済みパス順で決定的）
+        try:
+            hash_cache.prefetch(scan, jobs, fallback_to_serial)
+        except (RuntimeError, OSError) as e:
+            print(f"エラー: 並列ハッシュ計算に失敗しました: {e}")
+            return 1
+
+        checksums = {}
+        skipped_count = 0
+        for entry in scan:
+            # source_file は root_dir プレフィックス付き（例: "rules/core/..." / "specs/main/..."）
+            hash_value = hash_cache.get(entry.source_file, entry.path, entry.signature)
+            if hash_value is None:
+                skipped_count += 1
+                continue
+            checksums[entry.source_file] = hash_value
+            print(f"  ✓ {entry.source_file}")
+
+        if skipped_count > 0:
+            print(f"\n⚠️ {skipped_count}件のファイルをスキップしました")
+
+        if not checksums:
+            print("エラー: 有効なファイルがありません")
+            return 1
+
+        # 出力
+        store = ChecksumStore(checksums, hash_cache.get_stats(checksums), hash_cache.get_blobs(checksums))
+        if not write_checksums_file(store, output_file, target, get_checksum_format()):
+            return 1
+
+        print(f"\n✅ 生成完了: {output_file}")
+        print(f"   - ファイル数: {len(checksums)}")
+        print(f"   - ハッシュ計算: {hash_cache.files_hashed} 件（{hash_cache.bytes_read} bytes 読み込み）")
+        print(f"   - 再ハッシュ省略（stat 一致）: {hash_cache.files_reused}")
+        if git_blobs is not None:
+            print(f"   - 再ハッシュ省略（git blob 一致）: {hash_cache.files_git_reused}")
+
+        return 0
+    finally:
+        lock.release()
+
+
+if __name__ == '__main__':
+    exit_code = delegate_to_server('checksums')
+    sys.exit(main() if exit_code is None else exit_code)
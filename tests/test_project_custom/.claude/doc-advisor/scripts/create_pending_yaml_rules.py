@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# doc-advisor-version-xK9XmQ: 3.5
+"""
+Generate pending YAML templates in .claude/doc-advisor/toc/rules/.toc_work/
+
+Usage:
+    python3 .claude/doc-advisor/scripts/create_pending_yaml_rules.py [--full] [--paranoid] [--jobs N] [--source hash|git]
+
+Options:
+    --full      Process all files (default: changed files only)
+    --paranoid  Re-hash every file (default: skip files whose stat is unchanged)
+    --jobs N    Hashing threads (default: common.parallel.max_workers in config.yaml)
+    --source git
+                Detect changes from git index blob ids (clean tracked files whose
+                blob id is unchanged are not hashed; untracked/dirty files use SHA-256)
+
+Run from: Project root
+"""
+
+import sqlite3
+import sys
+from pathlib import Path
+
+from toc_utils import get_project_root, load_config, resolve_config_path, get_system_exclude_patterns, compile_exclude_patterns
+from toc_utils import ChecksumStore, FileHashCache, get_checksum_format, get_parallel_config, parse_jobs_option
+from toc_utils import load_git_blobs, parse_source_option
+from toc_utils import WorkDB, get_work_db_enabled, WORK_DB_FILENAME, atomic_write, acquire_toc_lock
+from toc_utils import toc_scan, open_dir_cache, SCAN_RESULT_FILENAME
+
+# Global configuration (initialized in init_config())
+CONFIG = None
+PROJECT_ROOT = None
+RULES_DIR = None
+RULES_DIR_NAME = None
+TOC_WORK_DIR = None
+CHECKSUMS_FILE = None
+RULES_TOC_FILE = None
+PATTERNS_CONFIG = None
+EXCLUDE_MATCHER = None
+
+
+def init_config():
+    """
+    Initialize configuration. Call this at the start of main().
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    global CONFIG, PROJECT_ROOT, RULES_DIR, RULES_DIR_NAME, TOC_WORK_DIR, CHECKSUMS_FILE
+    global RULES_TOC_FILE, PATTERNS_CONFIG, EXCLUDE_MATCHER
+
+    try:
+        CONFIG = load_config('rules')
+        PROJECT_ROOT = get_project_root()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return False
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return False
+
+    RULES_DIR_NAME = CONFIG.get('root_dir', 'rules').rstrip('/')
+    RULES_DIR = PROJECT_ROOT / RULES_DIR_NAME
+    TOC_WORK_DIR = resolve_config_path(CONFIG.get('work_dir', '.toc_work'), RULES_DIR, PROJECT_ROOT)
+    CHECKSUMS_FILE = resolve_config_path(CONFIG.get('checksums_file', '.toc_checksums.yaml'), RULES_DIR, PROJECT_ROOT)
+    RULES_TOC_FILE = resolve_config_path(CONFIG.get('toc_file', 'rules_toc.yaml'), RULES_DIR, PROJECT_ROOT)
+    PATTERNS_CONFIG = CONFIG.get('patterns', {})
+    # System patterns (always excluded) + user-defined patterns
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', []))
+    return True
+
+# Pending YAML template
+PENDING_TEMPLATE = """_meta:
+  source_file: {source_file}
+  status: pending
+  updated_at: null
+
+title: null
+purpose: null
+content_details: []
+applicable_tasks: []
+keywords: []
+"""
+
+
+def scan_md_files(visited_dirs=None):
+    """Scan target .md files once (symlink-aware, exclude applied)
+
+    Args:
+        visited_dirs: Optional list filled with every directory walked (used by watch_toc.py)
+    """
+    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
+    dir_cache = open_dir_cache(CHECKSUMS_FILE)
+    scan = toc_scan('rules', RULES_DIR, RULES_DIR_NAME, EXCLUDE_MATCHER, target_glob=target_glob, dir_cache=dir_cache,
+                    visited_dirs=visited_dirs)
+    if dir_cache is not None:
+        print(dir_cache.summary())
+    return scan
+
+
+def get_yaml_filename(source_file):
+    """Generate YAML filename from source_file"""
+    return source_file.replace("/", "_").replace(".md", ".yaml")
+
+
+def create_pending_yaml(source_file):
+    """
+    Create pending YAML file
+
+    Returns:
+        Path: Created file path, None on error
+    """
+    yaml_name = get_yaml_filename(source_file)
+    yaml_path = TOC_WORK_DIR / yaml_name
+
+    try:
+        with atomic_write(yaml_path) as f:
+            f.write(PENDING_TEMPLATE.format(source_file=source_file))
+        return yaml_path
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Warning: File write error: {yaml_path} - {e}")
+        return None
+
+
+def create_pending_entries(target_files):
+    """
+    Create pending rows in .toc_work/work.db instead of per-file YAMLs (common.work.db)
+
+    Returns:
+        list: Source files of the created entries, None on error
+    """
+    rows = []
+    for entry in target_files:
+        rows.append((get_yaml_filename(entry.source_file), entry.source_file, None))
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR, create=True)
+        try:
+            work_db.add_pending(rows)
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Error: Failed to write {WORK_DB_FILENAME}: {e}")
+        return None
+    return [source_file for _, source_file, _ in rows]
+
+
+def save_pending_checksums(scan, hash_cache):
+    """Save checksums snapshot at Phase 1 time to .toc_work/
+
+    Used to replace .toc_checksums.yaml after merge (Phase 3).
+    This ensures that files modified during Phase 2 will be
+    detected as changed in the next incremental run.
+    Hashes come from hash_cache, so files already hashed during
+    change detection are not read again.
+    """
+    checksums = {}
+    for entry in scan:
+        hash_value = hash_cache.get(entry.source_file, entry.path, entry.signature)
+        if hash_value is not None:
+            checksums[entry.source_file] = hash_value
+    stats = hash_cache.get_stats(checksums)
+    blobs = hash_cache.get_blobs(checksums)
+
+    pending_checksums_path = TOC_WORK_DIR / ".toc_checksums_pending.yaml"
+    store = ChecksumStore(checksums, stats, blobs)
+    try:
+        store.write(pending_checksums_path, get_checksum_format(), comments=[
+            "Phase 1 snapshot - used to replace .toc_checksums.yaml after merge",
+            "Auto-generated - do not edit",
+        ])
+        print(f"Saved pending checksums: {len(checksums)} files")
+    except (OSError, ValueError) as e:
+        print(f"Warning: Failed to save pending checksums: {e}")
+
+
+def main():
+    # Initialize configuration
+    if not init_config():
+        return 1
+
+    # Serialize with merge / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(RULES_TOC_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        return run()
+    finally:
+        lock.release()
+
+
+def run():
+    # Parse options
+    full_mode = "--full" in sys.argv
+    paranoid = "--paranoid" in sys.argv
+    max_workers, fallback_to_serial = get_parallel_config()
+    jobs = parse_jobs_option(sys.argv, max_workers)
+    if jobs is None:
+        print("Error: --jobs requires a positive integer")
+        return 1
+    source = parse_source_option(sys.argv)
+    if source is None:
+        print("Error: --source must be 'hash' or 'git'")
+        return 1
+
+    # Force full mode if rules_toc.yaml doesn't exist
+    if not RULES_TOC_FILE.exists():
+        full_mode = True
+        print("rules_toc.yaml not found, running in full mode")
+
+    # Force full mode if checksums doesn't exist
+    if not full_mode and not CHECKSUMS_FILE.exists():
+        full_mode = True
+        print(".toc_checksums.yaml not found, running in full mode")
+
+    # Scan target files once (reused by merge via .toc_work/.scan.json)
+    scan = scan_md_files()
+
+    # Previous checksums and stat signatures (stat fast path)
+    old_store = ChecksumStore.load(CHECKSUMS_FILE)
+    old_checksums = old_store.hashes
+    # --source git: blob ids of clean tracked files (None falls back to hashing)
+    git_blobs = load_git_blobs(PROJECT_ROOT, RULES_DIR_NAME) if source == 'git' else None
+    # Shared by change detection and the Phase 1 snapshot (each file read once)
+    hash_cache = FileHashCache(old_checksums, old_store.stats, paranoid, old_store.blobs, git_blobs)
+    try:
+        hash_cache.prefetch(scan, jobs, fallback_to_serial)
+    except (RuntimeError, OSError) as e:
+        print(f"Error: Parallel hashing failed: {e}")
+        return 1
+
+    if full_mode:
+        # Full mode: process all files
+        target_files = list(scan)
+        deleted_files = []
+        print(f"Full mode: processing {len(target_files)} files")
+    else:
+        # Incremental mode: changed files only
+        target_files = []
+
+        # Detect new/changed files
+        for entry in scan:
+            source_file = entry.source_file
+            current_hash = hash_cache.get(source_file, entry.path, entry.signature)
+            if current_hash is None:
+                continue  # Skip on hash calculation failure
+            old_hash = old_checksums.get(source_file)
+
+            if old_hash is None:
+                print(f"  [New] {source_file}")
+                target_files.append(entry)
+            elif current_hash != old_hash:
+                print(f"  [Modified] {source_file}")
+                target_files.append(entry)
+
+        # Detect deleted files
+        deleted_files = [
+            sf for sf in old_checksums.keys()
+            if sf not in scan
+        ]
+        for sf in deleted_files:
+            print(f"  [Deleted] {sf}")
+
+        if not target_files and not deleted_files:
+            print(hash_cache.summary())
+            print("No changes - rules_toc.yaml is up to date")
+            return 0
+
+        if not target_files and deleted_files:
+            print(hash_cache.summary())
+            print(f"\nDeleted files only: {len(deleted_files)} files")
+            print("Use --delete-only with merge script")
+            # No scan result for this cycle: drop one left by an earlier cycle
+            (TOC_WORK_DIR / SCAN_RESULT_FILENAME).unlink(missing_ok=True)
+            return 0
+
+        print(f"\nIncremental mode: {len(target_files)} changes, {len(deleted_files)} deletions")
+
+    # Create .toc_work directory
+    TOC_WORK_DIR.mkdir(parents=True, exist_ok=True)
+
+    # Save Phase 1 checksums snapshot (for all target files, not just changed ones)
+    save_pending_checksums(scan, hash_cache)
+    print(hash_cache.summary())
+
+    # Persist scan result so merge can skip re-walking the tree
+    scan.save(TOC_WORK_DIR / SCAN_RESULT_FILENAME)
+
+    if get_work_db_enabled():
+        created_files = create_pending_entries(target_files)
+        if created_files is None:
+            return 1
+        print(f"\nCreated {len(created_files)} pending entries in {TOC_WORK_DIR / WORK_DB_FILENAME}:")
+        for sf in created_files:
+            print(f"  - {sf}")
+        return 0
+
+    # Generate pending YAMLs
+    created_files = []
+    failed_count = 0
+    for entry in target_files:
+        source_file = entry.source_file
+        yaml_path = create_pending_yaml(source_file)
+        if yaml_path is None:
+            failed_count += 1
+            continue
+        created_files.append(source_file)
+
+    if failed_count > 0:
+        print(f"\nWarning: {failed_count} files failed to create")
+
+    print(f"\nCreated {len(created_files)} pending YAMLs:")
+    for sf in created_files:
+        print(f"  - {sf}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
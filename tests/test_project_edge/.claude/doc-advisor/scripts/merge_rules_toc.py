@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# doc-advisor-version-xK9XmQ: 3.5
+"""
+rules_toc.yaml Merge Script (standard library only)
+
+Reads all entries from .claude/doc-advisor/toc/rules/.toc_work/*.yaml (and work.db, if present),
+removes _meta sections, merges them, and generates .claude/doc-advisor/toc/rules/rules_toc.yaml.
+
+Usage:
+    python3 merge_rules_toc.py [--cleanup] [--mode full|incremental]
+
+Options:
+    --cleanup   Delete .toc_work/ after successful merge
+    --mode      full (default): Generate new, incremental: Differential merge
+"""
+
+import sqlite3
+import sys
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from toc_utils import (
+    get_project_root,
+    load_config,
+    load_entry_file,
+    yaml_escape,
+    backup_existing_file,
+    atomic_write,
+    acquire_toc_lock,
+    load_checksums,
+    cleanup_work_dir,
+    resolve_config_path,
+    get_system_exclude_patterns,
+    compile_exclude_patterns,
+    toc_scan,
+    open_dir_cache,
+    load_scan_result,
+    get_scan_fingerprint,
+    SCAN_RESULT_FILENAME,
+    WorkDB,
+    TocSplice,
+    read_toc_entries,
+    write_toc_caches,
+    load_toc_sidecar_header,
+    cached_load,
+    delegate_to_server,
+)
+from toc_schema import SCHEMA_VERSION, compile_entry_check, describe_problem, has_intact_stamp
+
+# ToC format check for entries without an intact schema stamp (toc_schema.py)
+CHECK_ENTRY = compile_entry_check('rules', 'toc')
+
+# Global configuration (initialized in init_config())
+CONFIG = None
+PROJECT_ROOT = None
+RULES_DIR = None
+RULES_DIR_NAME = None
+TOC_WORK_DIR = None
+OUTPUT_FILE = None
+CHECKSUMS_FILE = None
+OUTPUT_CONFIG = None
+PATTERNS_CONFIG = None
+EXCLUDE_MATCHER = None
+
+
+def init_config():
+    """
+    Initialize configuration. Call this at the start of main().
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    global CONFIG, PROJECT_ROOT, RULES_DIR, RULES_DIR_NAME, TOC_WORK_DIR, OUTPUT_FILE
+    global CHECKSUMS_FILE, OUTPUT_CONFIG, PATTERNS_CONFIG, EXCLUDE_MATCHER
+
+    try:
+        CONFIG = load_config('rules')
+        PROJECT_ROOT = get_project_root()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return False
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return False
+
+    RULES_DIR_NAME = CONFIG.get('root_dir', 'rules').rstrip('/')
+    RULES_DIR = PROJECT_ROOT / RULES_DIR_NAME
+    TOC_WORK_DIR = resolve_config_path(CONFIG.get('work_dir', '.toc_work'), RULES_DIR, PROJECT_ROOT)
+    OUTPUT_FILE = resolve_config_path(CONFIG.get('toc_file', 'rules_toc.yaml'), RULES_DIR, PROJECT_ROOT)
+    CHECKSUMS_FILE = resolve_config_path(CONFIG.get('checksums_file', '.toc_checksums.yaml'), RULES_DIR, PROJECT_ROOT)
+    OUTPUT_CONFIG = CONFIG.get('output', {})
+    PATTERNS_CONFIG = CONFIG.get('patterns', {})
+    # System patterns (always excluded) + user-defined patterns
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('rules') + PATTERNS_CONFIG.get('exclude', []))
+    return True
+
+
+def load_existing_toc(toc_path):
+    """Load existing rules_toc.yaml"""
+    if not toc_path.exists():
+        return {}
+
+    try:
+        # Shallow copy: merge adds/removes entries, the cached dict stays intact
+        return dict(cached_load(toc_path, read_toc_entries))
+    except (IOError, OSError, PermissionError, UnicodeDecodeError) as e:
+        print(f"Warning: Failed to read {toc_path}: {e}")
+        return {}
+
+
+def get_existing_files(reuse_scan=True):
+    """
+    Get set of currently existing target files with RULES_DIR prefix (symlink-aware)
+
+    Reuses the Phase 1 scan result (.toc_work/.scan.json) when it matches
+    the current settings and no scanned directory changed since
+    (load_scan_result()), otherwise scans the tree.
+
+    Args:
+        reuse_scan: False to always scan (--delete-only: Phase 1 saves no scan
+            result for a deletion-only change, a .scan.json is from an earlier cycle)
+    """
+    target_glob = PATTERNS_CONFIG.get('target_glob', '**/*.md')
+    fingerprint = get_scan_fingerprint('rules', RULES_DIR, EXCLUDE_MATCHER, target_glob=target_glob)
+    scan = load_scan_result(TOC_WORK_DIR / SCAN_RESULT_FILENAME, fingerprint) if reuse_scan else None
+    if scan is None:
+        dir_cache = open_dir_cache(CHECKSUMS_FILE)
+        scan = toc_scan('rules', RULES_DIR, RULES_DIR_NAME, EXCLUDE_MATCHER, target_glob=target_glob, dir_cache=dir_cache)
+        if dir_cache is not None:
+            print(dir_cache.summary())
+    else:
+        print(f"Using Phase 1 scan result: {len(scan)} files")
+    return scan.source_files()
+
+
+def format_header_lines(file_count):
+    """Lines before the first entry (header comment, metadata, 'docs:')"""
+    header_comment = OUTPUT_CONFIG.get('header_comment', 'Development Document Search Index for rules-advisor Subagent')
+    metadata_name = OUTPUT_CONFIG.get('metadata_name', 'Development Document Search Index')
+
+    return [
+        "# .claude/doc-advisor/toc/rules/rules_toc.yaml",
+        f"# {header_comment}",
+        "",
+        "metadata:",
+        f"  name: {metadata_name}",
+        f"  generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f"  file_count: {file_count}",
+        "",
+        "docs:",
+    ]
+
+
+def format_entry_lines(source_file, entry):
+    """Lines of one docs: entry"""
+    lines = [f"  {source_file}:"]
+
+    for key in ['title', 'purpose']:
+        if key in entry:
+            lines.append(f"    {key}: {yaml_escape(entry[key])}")
+
+    for key in ['content_details', 'applicable_tasks', 'keywords']:
+        if key in entry and entry[key]:
+            lines.append(f"    {key}:")
+            for item in entry[key]:
+                lines.append(f"      - {yaml_escape(item)}")
+    return lines
+
+
+def write_yaml_output(docs, output_path, schema_checked=False):
+    """
+    Write YAML file
+
+    Args:
+        schema_checked: Every entry passed the entry schema (recorded in the
+            sidecar header, see was_schema_checked())
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    lines = format_header_lines(len(docs))
+    for source_file, entry in sorted(docs.items()):
+        lines.extend(format_entry_lines(source_file, entry))
+
+    try:
+        with atomic_write(output_path) as f:
+            f.write('\n'.join(lines) + '\n')
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Error: Failed to write file: {output_path} - {e}")
+        return False
+    write_toc_caches(output_path, SCHEMA_VERSION if schema_checked else None)
+    return True
+
+
+def splice_toc(changes, existing_files, deleted_files, schema_checked=False):
+    """
+    Incremental update without loading the whole ToC (see TocSplice)
+
+    Existing entries are copied verbatim unless replaced by changes or no
+    longer in existing_files. schema_checked: as in write_yaml_output(), for
+    the spliced file (the copied entries included).
+
+    Returns:
+        bool or None: True on success, False on failure,
+            None if the ToC cannot be spliced (caller rewrites it in full)
+    """
+    try:
+        splice = TocSplice(OUTPUT_FILE, changes, lambda source_file: source_file in existing_files)
+    except ValueError as e:
+        print(f"Note: Rewriting rules_toc.yaml in full ({e})")
+        return None
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Warning: Failed to read {OUTPUT_FILE}: {e}")
+        return None
+
+    for source_file in splice.dropped:
+        if source_file in deleted_files:
+            print(f"  Deleted: {source_file}")
+        else:
+            print(f"  Deleted (stale): {source_file}")
+    if splice.file_count == 0:
+        print("Error: No valid entries")
+        return False
+
+    try:
+        splice.write(OUTPUT_FILE, format_header_lines(splice.file_count), format_entry_lines)
+    except (IOError, OSError, PermissionError, ValueError) as e:
+        print(f"Error: Failed to write file: {OUTPUT_FILE} - {e}")
+        return False
+    write_toc_caches(OUTPUT_FILE, SCHEMA_VERSION if schema_checked else None, index=False, graph=False)
+
+    print(f"\nGeneration complete: {OUTPUT_FILE}")
+    print(f"   - File count: {splice.file_count} ({len(changes) - splice.replaced} added, "
+          f"{splice.replaced} replaced, {len(splice.dropped)} deleted)")
+    return True
+
+
+def was_schema_checked(toc_path):
+    """
+    True if every entry of the existing ToC passed the current entry schema
+
+    Read from the sidecar header written with the ToC; a ToC written by an
+    older version or edited by hand counts as unchecked.
+    """
+    header = load_toc_sidecar_header(toc_path)
+    return header is not None and header.get('schema_version') == SCHEMA_VERSION
+
+
+def check_entry_schema(filename, meta, entry, errors):
+    """
+    Check a completed entry unless its _meta.schema_stamp is intact (toc_schema.py)
+
+    Entries stamped by write_rules_pending.py were checked at write time and
+    are trusted; others (older writers, hand edits) get the ToC format check.
+    Problems are added to errors as warnings; the entry is still merged.
+
+    Returns:
+        str: 'stamped', 'checked' or 'invalid'
+    """
+    if has_intact_stamp('rules', meta, entry):
+        return 'stamped'
+    problems = CHECK_ENTRY(entry)
+    for problem in problems:
+        errors.append(f"{filename}: {describe_problem(problem)}")
+    return 'invalid' if problems else 'checked'
+
+
+def delete_only_mode():
+    """Delete-only mode: Apply deletions without .toc_work/"""
+    print("Mode: delete-only")
+
+    if not OUTPUT_FILE.exists():
+        print("Error: rules_toc.yaml does not exist")
+        return False
+
+    # Create backup
+    backup_existing_file(OUTPUT_FILE)
+
+    # Load existing data (deleting entries keeps a schema-checked ToC checked)
+    docs = load_existing_toc(OUTPUT_FILE)
+    schema_checked = was_schema_checked(OUTPUT_FILE)
+
+    # Delete entries that exist in checksums but file doesn't exist
+    checksum_files = load_checksums(CHECKSUMS_FILE)
+    existing_files = get_existing_files(reuse_scan=False)
+    deleted_files = checksum_files - existing_files
+
+    deleted_count = 0
+    for del_file in deleted_files:
+        if del_file in docs:
+            del docs[del_file]
+            print(f"  Deleted: {del_file}")
+            deleted_count += 1
+
+    # Also delete stale entries in ToC but not in current valid files
+    stale_entries = [p for p in docs if p not in existing_files]
+    for stale in stale_entries:
+        del docs[stale]
+        print(f"  Deleted (stale): {stale}")
+        deleted_count += 1
+
+    if deleted_count == 0:
+        print("No entries to delete")
+        return True
+
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
+        return False
+
+    print(f"\nDeletion complete: {deleted_count} entries deleted")
+    return True
+
+
+def load_work_db_entries():
+    """
+    Load all entries of .toc_work/work.db (common.work.db)
+
+    Returns:
+        dict: {entry name: (meta, entry)}; empty if there is no work.db
+    """
+    try:
+        work_db = WorkDB.open(TOC_WORK_DIR)
+        if work_db is None:
+            return {}
+        try:
+            return {name: (meta, entry) for name, meta, entry in work_db.entries()}
+        finally:
+            work_db.close()
+    except sqlite3.Error as e:
+        print(f"Warning: Failed to read work.db: {e}")
+        return {}
+
+
+def merge_toc_files(mode='full'):
+    # work.db rows plus any per-file YAMLs (e.g. exported or written by the watcher)
+    db_entries = load_work_db_entries()
+    yaml_files = {f.name: f for f in TOC_WORK_DIR.glob("*.yaml") if not f.name.startswith('.')}
+    entry_names = sorted(set(db_entries) | set(yaml_files))
+
+    if not entry_names:
+        print(f"Error: No YAML files found in {TOC_WORK_DIR}")
+        return False
+
+    print(f"Target files: {len(entry_names)}")
+    print(f"Mode: {mode}")
+
+    # Create backup (common to all modes)
+    backup_existing_file(OUTPUT_FILE)
+
+    # Get current valid files (exclude applied)
+    existing_files = get_existing_files()
+
+    changes = {}
+    errors = []
+    schema_results = Counter()
+
+    for filename in entry_names:
+        try:
+            if filename in db_entries:
+                meta, entry = db_entries[filename]
+            else:
+                meta, entry = load_entry_file(yaml_files[filename])
+            source_file = meta.get('source_file')
+            status = meta.get('status')
+
+            if not source_file:
+                errors.append(f"{filename}: Cannot get source_file")
+                continue
+
+            if status != 'completed':
+                errors.append(f"{filename}: Status is not completed ({status})")
+                continue
+
+            # Skip excluded or missing files
+            if source_file not in existing_files:
+                errors.append(f"{filename}: Skipped (excluded or missing: {source_file})")
+                continue
+
+            schema_results[check_entry_schema(filename, meta, entry, errors)] += 1
+            changes[source_file] = entry
+            print(f"  {source_file}")
+
+        except Exception as e:
+            errors.append(f"{filename}: {e}")
+
+    if errors:
+        print("\nWarnings:")
+        for err in errors:
+            print(f"  - {err}")
+    print(f"Schema: {schema_results['stamped']} stamped at write time, "
+          f"{schema_results['checked'] + schema_results['invalid']} checked, {schema_results['invalid']} invalid")
+
+    # The ToC is schema-checked if every entry is: the new ones and, when kept, the existing ones
+    schema_checked = schema_results['invalid'] == 0
+    if mode == 'incremental' and OUTPUT_FILE.exists():
+        schema_checked = schema_checked and was_schema_checked(OUTPUT_FILE)
+        # Entries in checksums whose file no longer exists
+        deleted_files = load_checksums(CHECKSUMS_FILE) - existing_files
+        result = splice_toc(changes, existing_files, deleted_files, schema_checked)
+        if result is not None:
+            return result
+
+    # Full rewrite: full mode, no existing ToC, or a ToC that cannot be spliced
+    docs = {}
+    if mode == 'incremental':
+        docs = {p: e for p, e in load_existing_toc(OUTPUT_FILE).items() if p in existing_files}
+    docs.update(changes)
+
+    if not docs:
+        print("Error: No valid entries")
+        return False
+
+    if not write_yaml_output(docs, OUTPUT_FILE, schema_checked):
+        return False
+
+    print(f"\nGeneration complete: {OUTPUT_FILE}")
+    print(f"   - File count: {len(docs)}")
+
+    return True
+
+
+def main():
+    # Initialize configuration
+    if not init_config():
+        return 1
+
+    cleanup = '--cleanup' in sys.argv
+    delete_only = '--delete-only' in sys.argv
+    mode = 'full'
+    if '--mode' in sys.argv:
+        idx = sys.argv.index('--mode')
+        if idx + 1 < len(sys.argv):
+            mode = sys.argv[idx + 1]
+
+    print("=" * 50)
+    print("rules_toc.yaml Merge Script")
+    print("=" * 50)
+
+    # Serialize with Phase 1 / create_checksums / watcher runs on the same ToC
+    lock = acquire_toc_lock(OUTPUT_FILE.parent)
+    if lock is None:
+        return 1
+    try:
+        if delete_only:
+            success = delete_only_mode()
+        else:
+            success = merge_toc_files(mode)
+
+        if success and cleanup:
+            cleanup_work_dir(TOC_WORK_DIR)
+    finally:
+        lock.release()
+
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    exit_code = delegate_to_server('merge', 'rules')
+    sys.exit(main() if exit_code is None else exit_code)
@@ -0,0 +1,3377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# doc-advisor-version-xK9XmQ: 3.5
+"""
+ToC Auto-Generation Common Utilities
+
+Common functions used by merge-rules-toc, merge-specs-toc, create-toc-checksums.
+Uses only standard library.
+"""
+
+import fnmatch
+import functools
+import gc
+import hashlib
+import heapq
+from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import posixpath
+import re
+import json
+import math
+import mmap
+import shutil
+import socket
+import sqlite3
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: ToCLock does nothing
+    fcntl = None
+
+
+# System files that are always excluded (not configurable)
+SYSTEM_EXCLUDE_PATTERNS_RULES = ['.toc_work', 'rules_toc.yaml', '.toc_checksums.yaml']
+SYSTEM_EXCLUDE_PATTERNS_SPECS = ['.toc_work', 'specs_toc.yaml', '.toc_checksums.yaml']
+
+# Stat signatures newer than this (relative to the snapshot) are not recorded
+RACY_WINDOW_NS = 2_000_000_000
+
+# Read size for file hashing (large reads let hashlib release the GIL)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Checksum file formats (common.checksums.format)
+CHECKSUM_FORMATS = ('yaml', 'binary')
+
+# Binary checksum store: header, fixed-width records sorted by path, path table
+CHECKSUM_STORE_MAGIC = b'DACS'
+CHECKSUM_STORE_VERSION = 1
+_STORE_HEADER = struct.Struct('<4sHHI')  # magic, version, reserved, record count
+_STORE_RECORD = struct.Struct('<II32sqqQQBB32s')  # path offset/length, digest, stat, flags, blob length, blob
+_RECORD_HAS_STAT = 0x01
+_RECORD_HAS_BLOB = 0x02
+_HEX_RE = re.compile(r'[a-f0-9]+')
+
+# Optional work database (common.work.db): pending entries in one sqlite3 file
+WORK_DB_FILENAME = 'work.db'
+WORK_DB_VERSION = 2
+ENTRY_LIST_FIELDS = ('content_details', 'applicable_tasks', 'keywords', 'references')
+
+# Persisted scan result (written to work_dir by Phase 1, reused by later phases)
+SCAN_RESULT_FILENAME = '.scan.json'
+SCAN_RESULT_VERSION = 2
+
+# Optional directory listing cache (next to the checksums file, enabled by common.scan.dir_cache)
+DIR_CACHE_FILENAME = '.toc_dircache'
+DIR_CACHE_VERSION = 1
+
+# Parsed ToC sidecar written by merge (specs_toc.yaml -> specs_toc.cache.json)
+TOC_SIDECAR_SUFFIX = '.cache.json'
+TOC_SIDECAR_VERSION = 1
+
+# Inverted keyword index written by merge (specs_toc.yaml -> specs_toc.index.json), read by query_toc.py
+TOC_INDEX_SUFFIX = '.index.json'
+TOC_INDEX_VERSION = 2
+# Entry fields indexed, with the weight of one token occurrence
+INDEX_FIELD_WEIGHTS = {'keywords': 3, 'title': 2, 'applicable_tasks': 1, 'purpose': 1, 'content_details': 1}
+# Reference graph written by merge (specs_toc.yaml -> specs_toc.graph.json), read by query_toc.py
+TOC_GRAPH_SUFFIX = '.graph.json'
+TOC_GRAPH_VERSION = 1
+# BM25 parameters of TocIndex.rank(): term frequency saturation, length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Hiragana, Katakana (without the middle dot), iteration mark, CJK ideographs, Hangul syllables
+_CJK_CHARS = '\u3005\u3040-\u30fa\u30fc-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af'
+_TOKEN_RE = re.compile(f'[{_CJK_CHARS}]+|[^\\W_{_CJK_CHARS}]+')
+_CJK_RE = re.compile(f'[{_CJK_CHARS}]')
+
+# Advisory lock next to each ToC (serializes Phase 1 / merge / checksum runs)
+LOCK_FILENAME = '.toc.lock'
+DEFAULT_LOCK_TIMEOUT = 600  # seconds (common.lock.timeout)
+LOCK_POLL_INTERVAL = 0.1
+
+# ToC server (serve_toc.py) socket, relative to the project root
+SERVE_SOCKET_PATH = '.claude/doc-advisor/toc/.toc_serve.sock'
+# Set to 1 to always run scripts in-process, even while the server is running
+SERVE_DISABLE_ENV = 'DOC_ADVISOR_NO_SERVER'
+
+# Parsed-file cache, enabled by serve_toc.py (None: disabled)
+_LOAD_CACHE = None
+_LOAD_CACHE_STATS = {'hits': 0, 'loads': 0}
+
+
+def get_system_exclude_patterns(category):
+    """
+    Get system exclude patterns that are always applied.
+
+    Args:
+        category: 'rules' or 'specs'
+
+    Returns:
+        list: System exclude patterns
+    """
+    if category == 'rules':
+        return SYSTEM_EXCLUDE_PATTERNS_RULES.copy()
+    elif category == 'specs':
+        return SYSTEM_EXCLUDE_PATTERNS_SPECS.copy()
+    return []
+
+
+def normalize_path(path_str):
+    """
+    Normalize path string to NFC for consistent comparison.
+
+    macOS stores filenames in NFD (decomposed) form, while config files
+    and user input typically use NFC (composed) form. This causes string
+    comparison to fail for Japanese characters with dakuten/handakuten
+    (e.g., プ as U+30D7 vs フ+゚ as U+30D5+U+309A).
+    """
+    return unicodedata.normalize('NFC', str(path_str))
+
+
+def get_project_root():
+    """
+    Detect project root (searches for .git or .claude directory)
+
+    Returns:
+        Path: Path to project root
+
+    Raises:
+        RuntimeError: When project root cannot be found
+    """
+    current = Path(__file__).parent.absolute()
+
+    # Search up to 10 levels
+    for _ in range(10):
+        if (current / ".git").exists() or (current / ".claude").exists():
+            return current
+        parent = current.parent
+        if parent == current:
+            break
+        current = parent
+
+    raise RuntimeError("Project root not found (.git or .claude directory required)")
+
+
+def resolve_config_path(config_value, default_base, project_root):
+    """
+    Resolve configuration path value.
+
+    If the path starts with '.claude/', it is resolved relative to project_root.
+    Otherwise, it is resolved relative to default_base.
+
+    Args:
+        config_value: Path string from configuration
+        default_base: Default base directory (e.g., SPECS_DIR, RULES_DIR)
+        project_root: Project root directory
+
+    Returns:
+        Path: Resolved absolute path
+    """
+    path_str = str(config_value).rstrip('/')
+    if path_str.startswith('.claude/'):
+        return project_root / path_str
+    return default_base / path_str
+
+
+def find_config_file():
+    """
+    Find configuration file.
+
+    Location: {CWD}/.claude/doc-advisor/config.yaml
+
+    Returns:
+        Path: Path to configuration file
+
+    Raises:
+        FileNotFoundError: When no configuration file is found
+    """
+    project_config = Path.cwd() / ".claude/doc-advisor/config.yaml"
+    if project_config.exists():
+        return project_config
+
+    raise FileNotFoundError(
+        "Configuration file not found. Please create one at:\n"
+        "  - .claude/doc-advisor/config.yaml\n"
+        "Run setup.sh to generate the configuration file."
+    )
+
+
+def load_config(target=None):
+    """
+    Load config.yaml and return configuration dictionary
+
+    Args:
+        target: 'rules' or 'specs'. If specified, returns only that section
+
+    Returns:
+        dict: Configuration dictionary
+    """
+    try:
+        config_path = find_config_file()
+    except FileNotFoundError:
+        # Return default configuration if no file found
+        defaults = _get_default_config()
+        if target:
+            return defaults.get(target, {})
+        return defaults
+
+    config = cached_load(config_path, _read_config_file)
+
+    if target:
+        return config.get(target, {})
+    return config
+
+
+def _read_config_file(config_path):
+    with open(config_path, 'r', encoding='utf-8') as f:
+        return _parse_config_yaml(f.read())
+
+
+def enable_load_cache():
+    """Keep parsed files in memory across calls (long-lived processes such as serve_toc.py)"""
+    global _LOAD_CACHE
+    if _LOAD_CACHE is None:
+        _LOAD_CACHE = {}
+
+
+def get_load_cache_stats():
+    """Return (hits, loads) of cached_load() since enable_load_cache()"""
+    return _LOAD_CACHE_STATS['hits'], _LOAD_CACHE_STATS['loads']
+
+
+def cached_load(path, loader):
+    """
+    Return loader(path), reusing the previous result while the file is unchanged
+
+    Without enable_load_cache() this is just loader(path). Results are keyed
+    on the stat signature; files modified within RACY_WINDOW_NS are not
+    cached (a rewrite in the same mtime tick would go unnoticed). Callers
+    must not modify the returned object.
+
+    Raises:
+        Whatever loader raises (failures are never cached)
+    """
+    if _LOAD_CACHE is None:
+        return loader(path)
+    key = (loader, str(path))
+    try:
+        signature = get_stat_signature(os.stat(path))
+    except OSError:
+        _LOAD_CACHE.pop(key, None)
+        return loader(path)
+    cached = _LOAD_CACHE.get(key)
+    if cached is not None and cached[0] == signature:
+        _LOAD_CACHE_STATS['hits'] += 1
+        return cached[1]
+    value = loader(path)
+    _LOAD_CACHE_STATS['loads'] += 1
+    if is_racy_signature(signature, time.time_ns()):
+        _LOAD_CACHE.pop(key, None)
+    else:
+        _LOAD_CACHE[key] = (signature, value)
+    return value
+
+
+def get_parallel_config():
+    """
+    Get common.parallel settings
+
+    Returns:
+        tuple: (max_workers, fallback_to_serial)
+    """
+    common = load_config().get('common', {})
+    parallel = common.get('parallel', {}) if isinstance(common, dict) else {}
+    max_workers = parallel.get('max_workers', 5)
+    if not isinstance(max_workers, int) or max_workers < 1:
+        max_workers = 1
+    return max_workers, parallel.get('fallback_to_serial', True) is not False
+
+
+def get_dir_cache_enabled():
+    """
+    Get common.scan.dir_cache setting
+
+    Returns:
+        bool: True if the directory listing cache is enabled (default: False)
+    """
+    common = load_config().get('common', {})
+    scan = common.get('scan', {}) if isinstance(common, dict) else {}
+    return isinstance(scan, dict) and scan.get('dir_cache', False) is True
+
+
+def get_checksum_format():
+    """
+    Get common.checksums.format setting
+
+    Returns:
+        str: 'yaml' (default) or 'binary'
+    """
+    common = load_config().get('common', {})
+    checksums = common.get('checksums', {}) if isinstance(common, dict) else {}
+    fmt = checksums.get('format') if isinstance(checksums, dict) else None
+    return fmt if fmt in CHECKSUM_FORMATS else 'yaml'
+
+
+def get_work_db_enabled():
+    """
+    Get common.work.db setting
+
+    Returns:
+        bool: True if pending entries are kept in .toc_work/work.db (default: False)
+    """
+    common = load_config().get('common', {})
+    work = common.get('work', {}) if isinstance(common, dict) else {}
+    return isinstance(work, dict) and work.get('db', False) is True
+
+
+def get_lock_timeout():
+    """
+    Get common.lock.timeout setting
+
+    Returns:
+        int: Seconds to wait for another run's lock (0: fail immediately)
+    """
+    common = load_config().get('common', {})
+    lock = common.get('lock', {}) if isinstance(common, dict) else {}
+    timeout = lock.get('timeout', DEFAULT_LOCK_TIMEOUT) if isinstance(lock, dict) else DEFAULT_LOCK_TIMEOUT
+    if not isinstance(timeout, int) or isinstance(timeout, bool) or timeout < 0:
+        return DEFAULT_LOCK_TIMEOUT
+    return timeout
+
+
+def open_dir_cache(checksums_file):
+    """
+    Open the directory listing cache if enabled in config
+
+    Args:
+        checksums_file: Checksums file path; the cache is stored next to it
+
+    Returns:
+        DirListingCache or None: None when common.scan.dir_cache is off
+    """
+    if not get_dir_cache_enabled():
+        return None
+    return DirListingCache(Path(checksums_file).parent / DIR_CACHE_FILENAME)
+
+
+def parse_jobs_option(argv, default):
+    """
+    Parse --jobs N from command line arguments
+
+    Args:
+        argv: Argument list (sys.argv)
+        default: Value used when --jobs is not given
+
+    Returns:
+        int: Number of jobs, None if the value is invalid
+    """
+    if '--jobs' not in argv:
+        return default
+    idx = argv.index('--jobs')
+    try:
+        jobs = int(argv[idx + 1])
+    except (IndexError, ValueError):
+        return None
+    return jobs if jobs >= 1 else None
+
+
+def get_default_target_dirs():
+    """
+    Return default target_dirs configuration for specs.
+
+    This is the single source of truth for default directory mappings.
+    Other scripts should use this instead of hardcoding values.
+
+    Returns:
+        dict: Mapping of doc_type to directory name
+              e.g., {'requirement': 'requirements', 'design': 'design'}
+              Note: 'plan' is excluded per DES-002 (read in full during work, no search index needed)
+    """
+    return {
+        'requirement': 'requirements',
+        'design': 'design',
+    }
+
+
+def _get_default_config():
+    """Return default configuration"""
+    return {
+        'rules': {
+            'root_dir': 'rules/',
+            'toc_file': '.claude/doc-advisor/toc/rules/rules_toc.yaml',
+            'checksums_file': '.claude/doc-advisor/toc/rules/.toc_checksums.yaml',
+            'work_dir': '.claude/doc-advisor/toc/rules/.toc_work/',
+            'patterns': {
+                'target_glob': '**/*.md',
+                'exclude': []  # User-defined only; system files excluded separately
+            },
+            'output': {
+                'header_comment': 'Development Document Search Index for rules-advisor Subagent',
+                'metadata_name': 'Development Document Search Index'
+            }
+        },
+        'specs': {
+            'root_dir': 'specs/',
+            'toc_file': '.claude/doc-advisor/toc/specs/specs_toc.yaml',
+            'checksums_file': '.claude/doc-advisor/toc/specs/.toc_checksums.yaml',
+            'work_dir': '.claude/doc-advisor/toc/specs/.toc_work/',
+            'patterns': {
+                'target_dirs': get_default_target_dirs(),
+                'exclude': []  # User-defined only; system files excluded separately
+            },
+            'output': {
+                'header_comment': 'Requirement & Design Document Search Index for specs-advisor Subagent',
+                'metadata_name': 'Requirement & Design Document Search Index'
+            }
+        },
+        'common': {
+            'parallel': {
+                'max_workers': 5,
+                'fallback_to_serial': True
+            }
+        }
+    }
+
+
+def _parse_config_yaml(content):
+    """
+    Parse config.yaml (simple YAML parser)
+
+    Handles up to 4 levels of nesting:
+    - Level 0: Top-level sections (rules, specs, common)
+    - Level 2: Subsections (root_dir, patterns, output)
+    - Level 4: Sub-subsections (target_dirs, exclude)
+    - Level 6: Items (key-value pairs or list items)
+    """
+    result = {}
+    current_section = None
+    current_subsection = None
+    current_subsubsection = None
+    current_list = None
+    current_dict = None
+
+    lines = content.split('\n')
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+
+        # Skip comments and empty lines
+        if not stripped or stripped.startswith('#'):
+            continue
+
+        # Calculate indent level
+        indent = len(line) - len(line.lstrip())
+
+        if ':' in stripped and not stripped.startswith('- '):
+            key, _, value = stripped.partition(':')
+            key = key.strip()
+            value = value.strip()
+
+            if indent == 0:
+                # Top-level section
+                current_section = key
+                result[key] = {}
+                current_subsection = None
+                current_subsubsection = None
+                current_list = None
+                current_dict = None
+            elif indent == 2 and current_section:
+                # Subsection
+                current_subsection = key
+                if value:
+                    result[current_section][key] = _parse_value(value)
+                else:
+                    result[current_section][key] = {}
+                current_subsubsection = None
+                current_list = None
+                current_dict = None
+            elif indent == 4 and current_section and current_subsection:
+                # Sub-subsection - look ahead to determine if list or dict
+                current_subsubsection = key
+                if value:
+                    result[current_section][current_subsection][key] = _parse_value(value)
+                    current_list = None
+                    current_dict = None
+                else:
+                    # Look ahead to determine structure type
+                    is_list = _lookahead_is_list(lines, i + 1)
+                    if is_list:
+                        result[current_section][current_subsection][key] = []
+                        current_list = result[current_section][current_subsection][key]
+                        current_dict = None
+                    else:
+                        result[current_section][current_subsection][key] = {}
+                        current_dict = result[current_section][current_subsection][key]
+                        current_list = None
+            elif indent == 6 and current_dict is not None:
+                # Key-value pair inside sub-subsection dict
+                current_dict[key] = _parse_value(value) if value else ''
+        elif stripped.startswith('- ') and current_list is not None:
+            item = stripped[2:].strip().strip('"\'')
+            # Strip inline comments (e.g., "plan  # comment" → "plan")
+            if '  #' in item and not item.startswith('"'):
+                item = item[:item.index('  #')].strip()
+            current_list.append(item)
+
+    return result
+
+
+def _lookahead_is_list(lines, start_idx):
+    """
+    Look ahead in lines to determine if the next content is a list or dict.
+
+    Args:
+        lines: List of all lines
+        start_idx: Index to start looking from
+
+    Returns:
+        bool: True if next content is a list (starts with '- ')
+    """
+    for i in range(start_idx, min(start_idx + 10, len(lines))):
+        line = lines[i]
+        stripped = line.strip()
+
+        # Skip comments and empty lines
+        if not stripped or stripped.startswith('#'):
+            continue
+
+        indent = len(line) - len(line.lstrip())
+
+        # If we hit a line with less or equal indent, stop looking
+        if indent <= 4:
+            break
+
+        # Check if it's a list item or key-value
+        if stripped.startswith('- '):
+            return True
+        if ':' in stripped:
+            return False
+
+    # Default to list for backward compatibility
+    return True
+
+
+def _parse_value(value):
+    """Parse value (string, number, boolean)"""
+    value = value.strip().strip('"\'')
+
+    if value.lower() == 'true':
+        return True
+    if value.lower() == 'false':
+        return False
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+
+    return value
+
+
+def parse_simple_yaml(content):
+    """
+    Simple YAML parser (for entry files)
+
+    Separates _meta section and normal entries.
+
+    Args:
+        content: YAML file content
+
+    Returns:
+        tuple: (meta_dict, entry_dict)
+    """
+    result = {}
+    current_key = None
+    current_list = None
+    in_meta = False
+    meta = {}
+
+    lines = content.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        stripped = line.strip()
+
+        if not stripped or stripped.startswith('#'):
+            i += 1
+            continue
+
+        if stripped == '_meta:':
+            in_meta = True
+            i += 1
+            continue
+
+        if in_meta:
+            if line.startswith('  ') and ':' in stripped:
+                key, _, value = stripped.partition(':')
+                meta[key.strip()] = value.strip().strip('"\'')
+            elif not line.startswith(' '):
+                in_meta = False
+            else:
+                i += 1
+                continue
+
+        if not line.startswith(' ') and ':' in line:
+            key, _, value = line.partition(':')
+            key = key.strip()
+            value = value.strip()
+
+            if value == '[]':
+                # Inline empty array (e.g., "references: []")
+                current_key = key
+                current_list = []
+                result[key] = current_list
+            elif value:
+                result[key] = value.strip('"\'')
+                current_key = None
+                current_list = None
+            else:
+                current_key = key
+                current_list = []
+                result[key] = current_list
+            i += 1
+            continue
+
+        if current_list is not None and stripped.startswith('- '):
+            item = stripped[2:].strip().strip('"\'')
+            current_list.append(item)
+            i += 1
+            continue
+
+        i += 1
+
+    return meta, result
+
+
+def load_entry_file(filepath):
+    """
+    Load and parse entry file
+
+    Args:
+        filepath: File path (str or Path)
+
+    Returns:
+        tuple: (meta_dict, entry_dict)
+
+    Raises:
+        IOError: When file read fails
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            content = f.read()
+        return parse_simple_yaml(content)
+    except (IOError, OSError, PermissionError) as e:
+        raise IOError(f"Entry file read error: {filepath} - {e}") from e
+
+
+def format_entry_yaml(meta, entry):
+    """
+    Format an intermediate entry file (.toc_work/*.yaml)
+
+    Pending entries (null fields, empty lists) produce the same layout as
+    the create_pending_yaml_*.py template.
+
+    Args:
+        meta: _meta section (source_file, optional doc_type, status, updated_at,
+            optional schema_stamp)
+        entry: Entry fields; 'references' is written only if present
+
+    Returns:
+        str: YAML content
+    """
+    def scalar(value):
+        return 'null' if value is None else yaml_escape(value)
+
+    lines = ["_meta:", f"  source_file: {meta.get('source_file', '')}"]
+    if meta.get('doc_type') is not None:
+        lines.append(f"  doc_type: {meta['doc_type']}")
+    lines.append(f"  status: {meta.get('status', 'pending')}")
+    lines.append(f"  updated_at: {meta.get('updated_at') or 'null'}")
+    if meta.get('schema_stamp'):
+        lines.append(f"  schema_stamp: {meta['schema_stamp']}")
+    lines.append("")
+
+    lines.append(f"title: {scalar(entry.get('title'))}")
+    lines.append(f"purpose: {scalar(entry.get('purpose'))}")
+    for field in ENTRY_LIST_FIELDS:
+        if field == 'references' and field not in entry:
+            continue
+        items = entry.get(field) or []
+        if not items:
+            lines.append(f"{field}: []")
+            continue
+        lines.append(f"{field}:")
+        for item in items:
+            lines.append(f"  - {yaml_escape(item)}")
+
+    return '\n'.join(lines) + '\n'
+
+
+def yaml_escape(s):
+    """
+    Escape string for YAML output
+
+    Args:
+        s: String to escape
+
+    Returns:
+        str: Escaped string
+    """
+    if not s:
+        return '""'
+
+    # Convert to string if not already
+    s = str(s)
+
+    # Check if special character escaping is needed
+    needs_quotes = any(c in s for c in ':#{}[]&*!|>\'"%@`\n\r\t,?')
+    needs_quotes = needs_quotes or s.startswith('-') or s.startswith(' ')
+    needs_quotes = needs_quotes or s.endswith(' ')  # Trailing space
+
+    # Check if it looks like a number (would be parsed as int/float)
+    if not needs_quotes:
+        try:
+            float(s)
+            needs_quotes = True
+        except ValueError:
+            pass
+
+    # Check if it's a YAML boolean or null keyword
+    if s.lower() in ('true', 'false', 'yes', 'no', 'on', 'off', 'null', 'none', '~'):
+        needs_quotes = True
+
+    if needs_quotes:
+        # Escape backslash first, then double quote
+        escaped = s.replace('\\', '\\\\').replace('"', '\\"')
+        # Escape newline and tab
+        escaped = escaped.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+        return f'"{escaped}"'
+
+    return s
+
+
+def _fsync_dir(dir_path):
+    """fsync a directory so a rename in it survives a crash (best effort)"""
+    try:
+        fd = os.open(dir_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # Not supported by every filesystem
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_write(path, binary=False, fsync=True):
+    """
+    Write a file so that readers see either the old or the new content
+
+    Yields a file object for a temporary file in the same directory; when
+    the block completes it is flushed, fsync'd (fsync=True) and renamed
+    over path. On error the temporary file is removed and path is left
+    untouched. The new file gets the permissions of the file it replaces
+    (or the umask default).
+
+    Args:
+        path: Destination file
+        binary: Open in binary mode instead of UTF-8 text
+        fsync: False for caches and other files that are validated on load
+
+    Raises:
+        OSError: When the file cannot be written
+    """
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix='.tmp')
+    try:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.fchmod(fd, mode)
+        with open(fd, 'wb' if binary else 'w', encoding=None if binary else 'utf-8') as f:
+            yield f
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    if fsync:
+        _fsync_dir(path.parent)
+
+
+def backup_existing_file(file_path):
+    """
+    Backup existing file (with .bak extension)
+
+    The backup is a hard link to the current file, so no data is copied:
+    writers replace the file by rename (atomic_write), which leaves the
+    linked inode as the backup. The previous backup is replaced atomically.
+    Falls back to a copy where hard links are not supported.
+
+    Args:
+        file_path: File path to backup (str or Path)
+    """
+    file_path = Path(file_path)
+    if file_path.exists():
+        backup_path = file_path.with_suffix('.yaml.bak')
+        link_path = backup_path.with_name(f".{backup_path.name}.{os.getpid()}.tmp")
+        try:
+            link_path.unlink(missing_ok=True)
+            os.link(file_path, link_path)
+            os.replace(link_path, backup_path)
+        except OSError:
+            link_path.unlink(missing_ok=True)
+            shutil.copy(file_path, backup_path)
+        print(f"Backup created: {backup_path}")
+
+
+class ToCLock:
+    """
+    Advisory lock (fcntl.flock) on .toc.lock in a ToC directory
+
+    Held by create_pending_yaml_*.py, merge_*_toc.py, create_checksums.py,
+    toc_work.py --export and watch_toc.py while they read or modify the
+    ToC, checksum files and .toc_work/, so concurrent runs serialize
+    instead of interleaving. The lock file records the holder's pid and
+    script for the "Waiting for lock" message; the lock itself is released
+    by the kernel when the holder exits, so a crashed run never leaves it held.
+
+    Usage:
+        with ToCLock(toc_dir):
+            ...
+    """
+
+    def __init__(self, lock_dir, timeout=None, quiet=False):
+        """
+        Args:
+            lock_dir: Directory of the ToC / checksum file (created if missing)
+            timeout: Seconds to wait (None: common.lock.timeout, 0: fail immediately)
+            quiet: Do not print wait/hold times on release (watch_toc.py)
+        """
+        self.path = Path(lock_dir) / LOCK_FILENAME
+        self.timeout = get_lock_timeout() if timeout is None else timeout
+        self.quiet = quiet
+        self.waited = 0.0
+        self.held = 0.0
+        self._file = None
+        self._acquired_at = None
+
+    def _holder(self):
+        try:
+            return self.path.read_text(encoding='utf-8').strip() or 'unknown'
+        except OSError:
+            return 'unknown'
+
+    def acquire(self):
+        """
+        Raises:
+            TimeoutError: When another run still holds the lock after timeout seconds
+            OSError: When the lock file cannot be opened
+        """
+        if fcntl is None or self._file is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 'a': opening must not truncate the current holder's record
+        self._file = open(self.path, 'a+', encoding='utf-8')
+        start = time.monotonic()
+        announced = False
+        while True:
+            try:
+                fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                elapsed = time.monotonic() - start
+                if elapsed >= self.timeout:
+                    holder = self._holder()
+                    self._file.close()
+                    self._file = None
+                    raise TimeoutError(f"Lock {self.path} still held by {holder} after {self.timeout}s "
+                                       f"(common.lock.timeout)")
+                if not announced:
+                    print(f"Waiting for lock {self.path} (held by {self._holder()})")
+                    announced = True
+                time.sleep(min(LOCK_POLL_INTERVAL, self.timeout - elapsed))
+        self._acquired_at = time.monotonic()
+        self.waited = self._acquired_at - start
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(f"pid {os.getpid()} ({Path(sys.argv[0]).name})\n")
+        self._file.flush()
+
+    def release(self):
+        if self._file is None:
+            return
+        self.held = time.monotonic() - self._acquired_at
+        try:
+            self._file.truncate(0)
+        except OSError:
+            pass
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+        if not self.quiet:
+            print(f"Lock: waited {self.waited:.2f}s, held {self.held:.2f}s ({self.path.name})")
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
+
+
+def acquire_toc_lock(lock_dir):
+    """
+    Acquire the ToCLock of a ToC directory for a script's main()
+
+    Returns:
+        ToCLock or None: Held lock (call release()), None after printing the error
+    """
+    lock = ToCLock(lock_dir)
+    try:
+        lock.acquire()
+    except (TimeoutError, OSError) as e:
+        print(f"Error: {e}")
+        return None
+    return lock
+
+
+def iter_toc_entries(toc_path):
+    """
+    Stream the entries of a ToC file's docs: section as parsed dicts
+
+    Single pass over the file with only the current entry in memory; shared
+    by the merge and validate scripts. Entry keys are 2-space indented lines
+    ending with ':', fields are 4-space indented 'key: value' lines, list items
+    are '- item' lines under a field without a value ('key: []' is an empty
+    list). Surrounding quotes are stripped from values and items. docs: ends
+    at the next top-level line (e.g. metadata:); entries without fields are
+    skipped. Duplicate keys are yielded as they appear.
+
+    Yields:
+        tuple: (source_file, entry) in file order; entry values are str or list of str
+
+    Raises:
+        OSError: When the file cannot be read
+        UnicodeDecodeError: When the file is not UTF-8
+    """
+    with open(toc_path, 'r', encoding='utf-8') as f:
+        in_docs = False
+        key = None
+        entry = {}
+        current_list = None
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped[0] == '#':
+                continue
+
+            if line[0] != ' ':
+                # Top-level line: docs: starts the entries, anything else ends them
+                if key is not None and entry:
+                    yield key, entry
+                key, entry, current_list = None, {}, None
+                in_docs = stripped == 'docs:'
+            elif not in_docs:
+                continue
+            elif not line.startswith('    '):
+                if stripped[-1] == ':':
+                    if key is not None and entry:
+                        yield key, entry
+                    key, entry, current_list = stripped[:-1], {}, None
+            elif stripped[0] == '-':
+                if stripped.startswith('- ') and current_list is not None:
+                    current_list.append(stripped[2:].strip().strip('"\''))
+            elif key is not None and ':' in stripped:
+                field, _, val = stripped.partition(':')
+                val = val.strip().strip('"\'')
+                if val and val != '[]':
+                    entry[field.strip()] = val
+                    current_list = None
+                else:
+                    current_list = entry[field.strip()] = []
+
+        if key is not None and entry:
+            yield key, entry
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while building a large ToC structure
+
+    Creating ~100k entry dicts triggers many full collections that find no
+    garbage; pausing them makes large loads several times faster.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class StageTimer:
+    """
+    Wall time of named stages (validate_*_toc.py --timings)
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage('scan'):
+            ...
+        print('\n'.join(timer.format_lines()))
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.append((name, time.perf_counter() - start))
+
+    def format_lines(self, total_label='total'):
+        """One '  N.N ms  name' line per stage (in run order), then the total (time first: names may be CJK)"""
+        lines = [f"  {elapsed * 1000:8.1f} ms  {name}" for name, elapsed in self.stages]
+        total = sum(elapsed for _, elapsed in self.stages)
+        lines.append(f"  {total * 1000:8.1f} ms  {total_label}")
+        return lines
+
+
+def get_toc_sidecar_path(toc_path):
+    """Path of the parsed ToC sidecar (specs_toc.yaml -> specs_toc.cache.json)"""
+    toc_path = Path(toc_path)
+    return toc_path.with_name(toc_path.stem + TOC_SIDECAR_SUFFIX)
+
+
+def get_toc_index_path(toc_path):
+    """Path of the inverted keyword index (specs_toc.yaml -> specs_toc.index.json)"""
+    toc_path = Path(toc_path)
+    return toc_path.with_name(toc_path.stem + TOC_INDEX_SUFFIX)
+
+
+def get_toc_graph_path(toc_path):
+    """Path of the reference graph (specs_toc.yaml -> specs_toc.graph.json)"""
+    toc_path = Path(toc_path)
+    return toc_path.with_name(toc_path.stem + TOC_GRAPH_SUFFIX)
+
+
+def _toc_file_key(toc_path):
+    """
+    Freshness key of a ToC file for its derived files (sidecar, index)
+
+    The stat signature is omitted (None) when the ToC was modified within
+    RACY_WINDOW_NS: a same-tick rewrite would keep it, so readers compare the
+    hash instead.
+
+    Raises:
+        OSError: When the file cannot be read
+    """
+    st = os.stat(toc_path)
+    digest, _ = hash_file(toc_path)
+    if digest is None:
+        raise OSError(f"cannot hash {toc_path}")
+    signature = get_stat_signature(st)
+    return {
+        'size': st.st_size,
+        'sha256': digest,
+        'signature': None if is_racy_signature(signature, time.time_ns()) else list(signature),
+    }
+
+
+def _toc_file_matches(header, toc_path):
+    """
+    Check a derived file's header against the ToC file
+
+    Fresh when size and stat signature equal the recorded ones, or, if the
+    signature differs or was not recorded (touched, copied, racy write),
+    when the SHA-256 does.
+    """
+    try:
+        st = os.stat(toc_path)
+    except OSError:
+        return False
+    if header.get('size') != st.st_size:
+        return False
+    if header.get('signature') == list(get_stat_signature(st)):
+        return True
+    return hash_file(toc_path)[0] == header.get('sha256')
+
+
+def _remove_quietly(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def write_toc_caches(toc_path, schema_version=None, index=True, graph=True):
+    """
+    Write the parsed ToC sidecar, the keyword index and the reference graph for a freshly written ToC
+
+    All three are built from one parse of the written file
+    (iter_toc_entries()), so loading them gives exactly what a text parse
+    would, and are keyed on the ToC's size, SHA-256 and stat signature.
+    Failures only print a warning and remove the file: they are caches.
+
+    Args:
+        schema_version: Recorded in the sidecar header when the writer has
+            checked every entry against that entry schema version
+            (toc_schema.py); validators then skip their field checks
+        index / graph: False skips the keyword index / the reference
+            graph, which hold every entry's postings / references in memory
+            while they are built (the streaming splice); the outdated file
+            is removed and query_toc.py rebuilds it on first use
+            (build_toc_derived())
+
+    Returns:
+        bool: True if all files were written
+    """
+    sidecar = get_toc_sidecar_path(toc_path)
+    derived = []
+    for wanted, path, cls in ((index, get_toc_index_path(toc_path), TocIndex),
+                              (graph, get_toc_graph_path(toc_path), TocGraph)):
+        if wanted:
+            derived.append((path, cls()))
+        else:
+            _remove_quietly(path)
+    try:
+        header = _toc_file_key(toc_path)
+        sidecar_header = dict(header, version=TOC_SIDECAR_VERSION)
+        if schema_version is not None:
+            sidecar_header['schema_version'] = schema_version
+        with atomic_write(sidecar, fsync=False) as f, _gc_paused():
+            # Header on its own line: readers check freshness before decoding the entries
+            f.write(json.dumps(sidecar_header) + '\n[')
+            for i, (source_file, entry) in enumerate(iter_toc_entries(toc_path)):
+                f.write((',\n' if i else '\n') + json.dumps([source_file, entry], ensure_ascii=False))
+                for _, cache in derived:
+                    cache.add(source_file, entry)
+            f.write('\n]\n')
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"Warning: Failed to write {sidecar.name}: {e}")
+        _remove_quietly(sidecar)
+        for path, _ in derived:
+            _remove_quietly(path)
+        return False
+    written = True
+    for path, cache in derived:
+        try:
+            cache.save(path, header)
+        except OSError as e:
+            print(f"Warning: Failed to write {path.name}: {e}")
+            _remove_quietly(path)
+            written = False
+    return written
+
+
+def build_toc_derived(toc_path, cls, path):
+    """
+    Build a derived file (TocIndex / TocGraph) from the ToC and save it for later readers
+
+    It is saved only while the ToC still matches the freshness key taken
+    before reading it, so a ToC replaced meanwhile never gets a mismatched
+    file. Save failures are ignored: the caller still gets the built object.
+
+    Args:
+        cls: TocIndex or TocGraph
+        path: Where to save it (get_toc_index_path() / get_toc_graph_path())
+
+    Returns:
+        tuple: (built object, saved)
+
+    Raises:
+        OSError / UnicodeDecodeError: When the ToC cannot be read
+    """
+    header = _toc_file_key(toc_path)
+    derived = cls.build(read_toc_entries(toc_path))
+    if not _toc_file_matches(header, toc_path):
+        return derived, False
+    try:
+        derived.save(path, header)
+    except OSError:
+        _remove_quietly(path)
+        return derived, False
+    return derived, True
+
+
+def load_toc_sidecar_header(toc_path):
+    """
+    Read only the header line of the parsed ToC sidecar
+
+    Returns:
+        dict or None: The header if the sidecar matches the ToC file, None if missing or stale
+    """
+    try:
+        with open(get_toc_sidecar_path(toc_path), 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(header, dict) or header.get('version') != TOC_SIDECAR_VERSION:
+        return None
+    return header if _toc_file_matches(header, toc_path) else None
+
+
+def load_toc_sidecar(toc_path):
+    """
+    Load the parsed ToC sidecar if it matches the ToC file (see _toc_file_matches())
+
+    Returns:
+        list or None: [(source_file, entry), ...] in file order, None if missing or stale
+    """
+    try:
+        with open(get_toc_sidecar_path(toc_path), 'r', encoding='utf-8') as f:
+            header = json.loads(f.readline())
+            if not isinstance(header, dict) or header.get('version') != TOC_SIDECAR_VERSION:
+                return None
+            if not _toc_file_matches(header, toc_path):
+                return None
+            with _gc_paused():
+                entries = [tuple(pair) for pair in json.loads(f.read())]
+    except (OSError, ValueError, TypeError):
+        return None
+    return entries
+
+
+def read_toc_entries(toc_path):
+    """
+    Read a ToC file as [(source_file, entry), ...] in file order (duplicate keys kept)
+
+    Uses the parsed sidecar when it is fresh, otherwise parses the text with
+    iter_toc_entries().
+
+    Raises:
+        OSError: When the file cannot be read
+        UnicodeDecodeError: When the file is not UTF-8
+    """
+    entries = load_toc_sidecar(toc_path)
+    if entries is None:
+        with _gc_paused():
+            entries = list(iter_toc_entries(toc_path))
+    return entries
+
+
+def tokenize_text(text):
+    """
+    Split text into index tokens (shared by the index and its queries)
+
+    The text is NFKC-normalized (full-width ASCII, half-width Katakana) and
+    case-folded. Runs of letters/digits are one token each; runs of CJK
+    characters, which have no word separators, become overlapping bigrams
+    (a single-character run is kept as is).
+
+    Returns:
+        list: Tokens in text order (duplicates kept)
+    """
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    if not _CJK_RE.search(text):
+        return _TOKEN_RE.findall(text)
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if len(run) > 1 and _CJK_RE.match(run):
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class TocIndex:
+    """
+    Inverted keyword index of a ToC: token -> [[doc number, weight], ...]
+
+    Tokens come from tokenize_text() over the INDEX_FIELD_WEIGHTS fields; the
+    weight of a posting is the summed field weight of the token's occurrences
+    in that entry (a field-weighted term frequency), and lengths holds each
+    entry's summed weight over all tokens. Doc numbers index paths/doc_types/
+    lengths in ToC order. Written next to the ToC by a merge that
+    rewrites the whole file (write_toc_caches()) or, after a splice, by
+    query_toc.py on first use (build_toc_derived()); read by query_toc.py.
+    """
+
+    def __init__(self, paths=None, doc_types=None, postings=None, lengths=None):
+        self.paths = paths if paths is not None else []
+        self.doc_types = doc_types if doc_types is not None else []
+        self.postings = postings if postings is not None else {}
+        self.lengths = lengths if lengths is not None else []
+        self._avg_length = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def build(cls, entries):
+        """Build from (source_file, entry) pairs"""
+        index = cls()
+        with _gc_paused():
+            for source_file, entry in entries:
+                index.add(source_file, entry)
+        return index
+
+    def add(self, source_file, entry):
+        doc = len(self.paths)
+        self.paths.append(source_file)
+        self.doc_types.append(entry.get('doc_type', ''))
+        weights = {}
+        for field, weight in INDEX_FIELD_WEIGHTS.items():
+            value = entry.get(field)
+            if not value:
+                continue
+            # One call per field: list items are separated by a newline, which no token spans
+            for token in tokenize_text('\n'.join(value) if isinstance(value, list) else value):
+                weights[token] = weights.get(token, 0) + weight
+        for token, weight in weights.items():
+            self.postings.setdefault(token, []).append([doc, weight])
+        self.lengths.append(sum(weights.values()))
+        self._avg_length = None
+
+    def save(self, path, header):
+        """
+        Write the index (header line with the ToC freshness key, then the body)
+
+        Raises:
+            OSError: When the file cannot be written
+        """
+        with atomic_write(path, fsync=False) as f:
+            f.write(json.dumps(dict(header, version=TOC_INDEX_VERSION)) + '\n')
+            # json.dumps(): json.dump() encodes in Python chunks, several times slower
+            f.write(json.dumps({'paths': self.paths, 'doc_types': self.doc_types, 'lengths': self.lengths,
+                                'postings': self.postings}, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    @classmethod
+    def load(cls, toc_path):
+        """
+        Load the index of a ToC file if it matches the file (see _toc_file_matches())
+
+        Returns:
+            TocIndex or None: None if missing, stale or unreadable
+        """
+        try:
+            with open(get_toc_index_path(toc_path), 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if not isinstance(header, dict) or header.get('version') != TOC_INDEX_VERSION:
+                    return None
+                if not _toc_file_matches(header, toc_path):
+                    return None
+                with _gc_paused():
+                    body = json.loads(f.read())
+            return cls(body['paths'], body['doc_types'], body['postings'], body['lengths'])
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def search(self, query, doc_type=None):
+        """
+        Rank entries by the query tokens they contain
+
+        Entries matching more distinct query tokens come first, then higher
+        summed weight, then path order.
+
+        Returns:
+            tuple: ([(source_file, score, matched tokens), ...], number of distinct query tokens)
+        """
+        tokens = list(dict.fromkeys(tokenize_text(query)))
+        scores = {}
+        matched = {}
+        for token in tokens:
+            for doc, weight in self.postings.get(token, ()):
+                scores[doc] = scores.get(doc, 0) + weight
+                matched[doc] = matched.get(doc, 0) + 1
+        results = [(self.paths[doc], score, matched[doc]) for doc, score in scores.items()
+                   if doc_type is None or self.doc_types[doc] == doc_type]
+        results.sort(key=lambda result: (-result[2], -result[1], result[0]))
+        return results, len(tokens)
+
+    def rank(self, query, limit=None, doc_type=None):
+        """
+        Rank entries by BM25 relevance to a free-text query (e.g. a task description)
+
+        Term frequencies are the field-weighted posting weights and entry
+        lengths their sums, so a token in keywords counts three times one in
+        content_details. Each distinct query token contributes
+        idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average length))
+        with idf = log(1 + (N - n + 0.5) / (n + 0.5)): rare tokens dominate and
+        tokens found in most entries add almost nothing, so no stop word list
+        is needed.
+
+        Args:
+            query: Query text, tokenized like the index
+            limit: Number of entries to return (None or 0: all)
+            doc_type: Only rank entries of this doc_type
+
+        Returns:
+            tuple: ([(source_file, score), ...] best first, number of entries
+                   with a score, number of distinct query tokens)
+        """
+        tokens = list(dict.fromkeys(tokenize_text(query)))
+        total = len(self.paths)
+        if self._avg_length is None:
+            self._avg_length = (sum(self.lengths) / total if total else 0) or 1
+        norm = BM25_K1 / self._avg_length
+        lengths = self.lengths
+        scores = {}
+        for token in tokens:
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings:
+                score = idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B) + BM25_B * norm * lengths[doc])
+                scores[doc] = scores.get(doc, 0.0) + score
+        if doc_type is not None:
+            scores = {doc: score for doc, score in scores.items() if self.doc_types[doc] == doc_type}
+        ranked = ((self.paths[doc], score) for doc, score in scores.items())
+        if limit:
+            results = heapq.nsmallest(limit, ranked, key=lambda result: (-result[1], result[0]))
+        else:
+            results = sorted(ranked, key=lambda result: (-result[1], result[0]))
+        return results, len(scores), len(tokens)
+
+
+@functools.lru_cache(maxsize=65536)
+def reference_candidates(reference, source_dir):
+    """
+    Project-root paths a references item may name, in lookup order
+
+    References are paths from the project root (see specs_toc_format.md);
+    paths relative to the referencing document, a leading ./ or /, and a
+    #fragment are accepted too. Cached: the same reference from the same
+    directory is only normalized once per process.
+
+    Args:
+        reference: references item
+        source_dir: Directory of the referencing document (posixpath.dirname of its ToC key)
+
+    Returns:
+        tuple: (root-relative, document-relative) paths without duplicates;
+               empty for abstract references ("error handling design document")
+    """
+    ref = str(reference).strip().strip('`').partition('#')[0].replace('\\', '/')
+    if not ref.endswith('.md'):
+        return ()
+    from_root = posixpath.normpath(ref.lstrip('/'))
+    from_document = posixpath.normpath(posixpath.join(source_dir, ref))
+    return (from_root,) if from_document == from_root else (from_root, from_document)
+
+
+def resolve_reference(reference, source_file, paths):
+    """
+    ToC key a references item points to (see reference_candidates())
+
+    Args:
+        reference: references item
+        source_file: ToC key of the referencing entry
+        paths: Container of ToC keys (set or dict)
+
+    Returns:
+        str or None: The ToC key, None if the reference does not name an entry
+    """
+    for candidate in reference_candidates(reference, posixpath.dirname(source_file)):
+        if candidate in paths:
+            return candidate
+    return None
+
+
+class TocGraph:
+    """
+    Reference graph of a ToC as compact adjacency arrays
+
+    Doc numbers index paths/doc_types in ToC order. forward holds
+    [offsets, targets]: the documents entry d references (resolve_reference())
+    are targets[offsets[d]:offsets[d + 1]], without duplicates or
+    self-references; backward holds the same arrays for the entries that
+    reference d. Unresolved references are left out. Written next to the ToC
+    by a merge that rewrites the whole file (write_toc_caches()) or, after a
+    splice, by query_toc.py refs on first use (build_toc_derived()); read by
+    query_toc.py and validate_specs_toc.py.
+    """
+
+    DIRECTIONS = ('out', 'in', 'both')
+
+    def __init__(self, paths=None, doc_types=None, forward=None, backward=None):
+        self.paths = paths if paths is not None else []
+        self.doc_types = doc_types if doc_types is not None else []
+        self.forward = forward
+        self.backward = backward
+        self._references = []
+        self._ids = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def build(cls, entries):
+        """Build from (source_file, entry) pairs"""
+        graph = cls()
+        for source_file, entry in entries:
+            graph.add(source_file, entry)
+        graph._link()
+        return graph
+
+    def add(self, source_file, entry):
+        self.paths.append(source_file)
+        self.doc_types.append(entry.get('doc_type', ''))
+        references = entry.get('references')
+        self._references.append(references if isinstance(references, list) else [])
+        self.forward = self.backward = self._ids = None
+
+    def _link(self):
+        """Resolve the added entries' references into the forward/backward arrays"""
+        ids = self.ids()
+        offsets = [0]
+        targets = []
+        in_degree = [0] * len(self.paths)
+        for doc, references in enumerate(self._references):
+            seen = {doc}
+            for reference in references:
+                target = ids.get(resolve_reference(reference, self.paths[doc], ids))
+                if target is not None and target not in seen:
+                    seen.add(target)
+                    targets.append(target)
+                    in_degree[target] += 1
+            offsets.append(len(targets))
+        back_offsets = [0]
+        for count in in_degree:
+            back_offsets.append(back_offsets[-1] + count)
+        sources = [0] * len(targets)
+        fill = back_offsets[:-1]
+        for doc in range(len(self.paths)):
+            for target in targets[offsets[doc]:offsets[doc + 1]]:
+                sources[fill[target]] = doc
+                fill[target] += 1
+        self.forward = [offsets, targets]
+        self.backward = [back_offsets, sources]
+        self._references = []
+
+    def ids(self):
+        """{source_file: doc number} (the first entry for a duplicated key)"""
+        if self._ids is None:
+            self._ids = {}
+            for doc, path in enumerate(self.paths):
+                self._ids.setdefault(path, doc)
+        return self._ids
+
+    def save(self, path, header):
+        """
+        Write the graph (header line with the ToC freshness key, then the body)
+
+        Raises:
+            OSError: When the file cannot be written
+        """
+        if self.forward is None:
+            self._link()
+        with atomic_write(path, fsync=False) as f:
+            f.write(json.dumps(dict(header, version=TOC_GRAPH_VERSION)) + '\n')
+            f.write(json.dumps({'paths': self.paths, 'doc_types': self.doc_types, 'forward': self.forward,
+                                'backward': self.backward}, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    @classmethod
+    def load(cls, toc_path):
+        """
+        Load the graph of a ToC file if it matches the file (see _toc_file_matches())
+
+        Returns:
+            TocGraph or None: None if missing, stale or unreadable
+        """
+        try:
+            with open(get_toc_graph_path(toc_path), 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if not isinstance(header, dict) or header.get('version') != TOC_GRAPH_VERSION:
+                    return None
+                if not _toc_file_matches(header, toc_path):
+                    return None
+                with _gc_paused():
+                    body = json.loads(f.read())
+            return cls(body['paths'], body['doc_types'], body['forward'], body['backward'])
+        except (OSError, ValueError, TypeError, KeyError):
+            return None
+
+    def neighbors(self, doc, direction='out'):
+        """Doc numbers adjacent to doc ('out': it references, 'in': referencing it, 'both')"""
+        found = []
+        if direction in ('out', 'both'):
+            offsets, targets = self.forward
+            found.extend(targets[offsets[doc]:offsets[doc + 1]])
+        if direction in ('in', 'both'):
+            offsets, sources = self.backward
+            found.extend(sources[offsets[doc]:offsets[doc + 1]])
+        return found
+
+    def cycles(self):
+        """
+        Reference cycles: strongly connected components of two or more entries
+
+        Iterative Tarjan over the forward arrays (no recursion limit on long
+        chains).
+
+        Returns:
+            list: [[source_file, ...], ...] each sorted by ToC order, components by their first entry
+        """
+        offsets, targets = self.forward
+        count = len(self.paths)
+        order = [-1] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        components = []
+        counter = 0
+        for root in range(count):
+            if order[root] != -1:
+                continue
+            work = [(root, offsets[root])]
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            while work:
+                doc, edge = work[-1]
+                if edge < offsets[doc + 1]:
+                    work[-1] = (doc, edge + 1)
+                    target = targets[edge]
+                    if order[target] == -1:
+                        order[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = True
+                        work.append((target, offsets[target]))
+                    elif on_stack[target]:
+                        low[doc] = min(low[doc], order[target])
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[doc])
+                if low[doc] == order[doc]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = False
+                        component.append(member)
+                        if member == doc:
+                            break
+                    if len(component) > 1:
+                        components.append(sorted(component))
+        components.sort()
+        return [[self.paths[doc] for doc in component] for component in components]
+
+    def expand(self, seeds, hops=1, direction='both'):
+        """
+        Documents within hops reference links of the seed documents (breadth-first)
+
+        Args:
+            seeds: ToC keys to start from
+            hops: Maximum number of links followed (0: the seeds only)
+            direction: 'out', 'in' or 'both' (see neighbors())
+
+        Returns:
+            list: [(source_file, doc_type, distance), ...] by distance, then ToC order
+
+        Raises:
+            KeyError: When a seed is not in the ToC
+        """
+        ids = self.ids()
+        distance = {}
+        for seed in seeds:
+            distance.setdefault(ids[seed], 0)
+        frontier = sorted(distance)
+        for hop in range(1, hops + 1):
+            reached = set()
+            for doc in frontier:
+                for neighbor in self.neighbors(doc, direction):
+                    if neighbor not in distance:
+                        distance[neighbor] = hop
+                        reached.add(neighbor)
+            if not reached:
+                break
+            frontier = sorted(reached)
+        return [(self.paths[doc], self.doc_types[doc], hops_away)
+                for doc, hops_away in sorted(distance.items(), key=lambda item: (item[1], item[0]))]
+
+
+def iter_toc_blocks(toc_path):
+    """
+    Stream the entries of a ToC file's docs: section as raw text blocks
+
+    Only the current entry is held in memory. Lines before docs: (header,
+    metadata) are skipped; comments and blank lines inside docs: belong to
+    the preceding entry.
+
+    Yields:
+        tuple: (source_file, lines) in file order; lines include the key line and end with newlines
+
+    Raises:
+        OSError: When the file cannot be read
+        ValueError: When docs: is missing or followed by a non-entry top-level line
+    """
+    with open(toc_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.rstrip('\n') == 'docs:':
+                break
+        else:
+            raise ValueError("no docs: section")
+
+        key = None
+        lines = []
+        for line in f:
+            if not line.endswith('\n'):
+                line += '\n'
+            if line.startswith('  ') and not line.startswith('    ') and line.rstrip().endswith(':'):
+                if key is not None:
+                    yield key, lines
+                key = line.strip()[:-1]
+                lines = [line]
+            elif line.strip() and not line.startswith(' ') and not line.startswith('#'):
+                raise ValueError(f"unexpected top-level line after docs: {line.strip()}")
+            elif key is not None:
+                lines.append(line)
+        if key is not None:
+            yield key, lines
+
+
+class TocSplice:
+    """
+    Incremental ToC rewrite as a merge-join of the existing file and a change set
+
+    The existing file's entries are streamed in (sorted) file order and
+    copied verbatim unless replaced by changes or rejected by keep; new
+    entries are spliced in at their sorted position. Memory use is the
+    change set plus the current entry, independent of the ToC size.
+
+    The constructor makes a first streaming pass to count the resulting
+    entries (metadata.file_count precedes docs:) and to check that the
+    existing keys are strictly sorted; write() makes the second pass.
+    """
+
+    def __init__(self, toc_path, changes, keep):
+        """
+        Args:
+            toc_path: Existing ToC file
+            changes: {source_file: entry} to insert or replace
+            keep: function(source_file) -> bool; existing entries it rejects are dropped
+
+        Raises:
+            OSError: When the file cannot be read
+            ValueError: When the file cannot be spliced (unsorted or duplicate keys,
+                unexpected layout); the caller falls back to a full rewrite
+        """
+        self.toc_path = Path(toc_path)
+        self.changes = changes
+        self.keep = keep
+        self.dropped = []
+        self.replaced = 0
+        kept = 0
+        previous = None
+        for source_file, _ in iter_toc_blocks(self.toc_path):
+            if previous is not None and source_file <= previous:
+                raise ValueError(f"entries not sorted at {source_file}")
+            previous = source_file
+            if source_file in changes:
+                self.replaced += 1
+            elif keep(source_file):
+                kept += 1
+            else:
+                self.dropped.append(source_file)
+        self.file_count = kept + len(changes)
+
+    def write(self, output_path, header_lines, format_entry):
+        """
+        Write the spliced ToC (temporary file renamed into place)
+
+        Args:
+            output_path: Output file (may be the existing ToC)
+            header_lines: Lines before the first entry, including 'docs:'
+            format_entry: function(source_file, entry) -> list of lines
+
+        Raises:
+            OSError: When the file cannot be read or written
+            ValueError: When the existing file changed since the first pass
+        """
+        output_path = Path(output_path)
+        pending = iter(sorted(self.changes.items()))
+        change = next(pending, None)
+        count = 0
+        with atomic_write(output_path) as out:
+            out.write('\n'.join(header_lines) + '\n')
+            for source_file, lines in iter_toc_blocks(self.toc_path):
+                while change is not None and change[0] < source_file:
+                    out.write('\n'.join(format_entry(*change)) + '\n')
+                    count += 1
+                    change = next(pending, None)
+                if change is not None and change[0] == source_file:
+                    out.write('\n'.join(format_entry(*change)) + '\n')
+                    count += 1
+                    change = next(pending, None)
+                elif self.keep(source_file):
+                    out.writelines(lines)
+                    count += 1
+            while change is not None:
+                out.write('\n'.join(format_entry(*change)) + '\n')
+                count += 1
+                change = next(pending, None)
+            if count != self.file_count:
+                raise ValueError(f"{self.toc_path} changed during merge")
+
+
+def get_stat_signature(stat_result):
+    """
+    Build the stat signature used for the change detection fast path
+
+    Args:
+        stat_result: os.stat_result of the file
+
+    Returns:
+        tuple: (st_mtime_ns, st_size, st_dev, st_ino)
+    """
+    return (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_dev, stat_result.st_ino)
+
+
+def is_racy_signature(signature, snapshot_ns):
+    """
+    Check if a stat signature is too close to the snapshot time to be trusted
+
+    A file modified again within the same timestamp granularity as the
+    snapshot would keep an identical (mtime, size) pair while its content
+    changed. Such signatures are not recorded, so the file is re-hashed
+    on the next run (same idea as git's "racily clean" index entries).
+
+    Args:
+        signature: Stat signature from get_stat_signature()
+        snapshot_ns: Snapshot time (time.time_ns())
+
+    Returns:
+        bool: True if the signature must not be recorded
+    """
+    return snapshot_ns - signature[0] < RACY_WINDOW_NS
+
+
+def format_stats_section(stats):
+    """
+    Format the stats: section of a checksum file
+
+    Args:
+        stats: dict of {path: stat signature}
+
+    Returns:
+        list: YAML lines (empty list if stats is empty)
+    """
+    if not stats:
+        return []
+    lines = ["stats:"]
+    for path, signature in sorted(stats.items()):
+        lines.append(f"  {path}: {' '.join(str(v) for v in signature)}")
+    return lines
+
+
+def format_blobs_section(blobs):
+    """
+    Format the blobs: section of a checksum file (--source git)
+
+    Args:
+        blobs: dict of {path: git blob id}
+
+    Returns:
+        list: YAML lines (empty list if blobs is empty)
+    """
+    if not blobs:
+        return []
+    lines = ["blobs:"]
+    for path, blob_id in sorted(blobs.items()):
+        lines.append(f"  {path}: {blob_id}")
+    return lines
+
+
+class _BinaryChecksumFile:
+    """
+    Read-only view of a binary checksum store
+
+    The file is mapped with mmap; lookups binary-search the fixed-width
+    records (sorted by UTF-8 path), so loading does not parse the file.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = _STORE_HEADER.unpack_from(self._mm, 0)
+        if magic != CHECKSUM_STORE_MAGIC or version != CHECKSUM_STORE_VERSION:
+            raise ValueError(f"unsupported checksum store version: {version}")
+        self.count = count
+        self._paths_offset = _STORE_HEADER.size + count * _STORE_RECORD.size
+        if len(self._mm) < self._paths_offset:
+            raise ValueError("truncated checksum store")
+
+    def _record(self, index):
+        return _STORE_RECORD.unpack_from(self._mm, _STORE_HEADER.size + index * _STORE_RECORD.size)
+
+    def _path_bytes(self, record):
+        start = self._paths_offset + record[0]
+        return self._mm[start:start + record[1]]
+
+    def find(self, path):
+        """Return the record of path, None if absent"""
+        key = path.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            record = self._record(mid)
+            current = self._path_bytes(record)
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return record
+        return None
+
+    def records(self):
+        """Yield (path, record) in path order"""
+        for index in range(self.count):
+            record = self._record(index)
+            yield self._path_bytes(record).decode('utf-8'), record
+
+
+class _BinaryChecksumColumn(Mapping):
+    """{path: value} mapping over one column of a binary checksum store"""
+
+    def __init__(self, store, flag, decode):
+        self._store = store
+        self._flag = flag
+        self._decode = decode
+        self._len = None
+
+    def __getitem__(self, path):
+        record = self._store.find(path)
+        if record is None or (self._flag and not record[7] & self._flag):
+            raise KeyError(path)
+        return self._decode(record)
+
+    def __iter__(self):
+        for path, record in self._store.records():
+            if not self._flag or record[7] & self._flag:
+                yield path
+
+    def __len__(self):
+        if self._len is None:
+            self._len = sum(1 for _ in self)
+        return self._len
+
+
+class ChecksumStore:
+    """
+    Checksums, stat signatures and git blob ids of one checksum file
+
+    Single reader/writer for .toc_checksums.yaml and .toc_checksums_pending.yaml.
+    Two on-disk formats (common.checksums.format):
+    - yaml: checksums: / stats: / blobs: sections, human-readable (default)
+    - binary: fixed-width records sorted by path with raw 32-byte SHA-256
+      digests, loaded with mmap and looked up by binary search
+
+    The format is detected from the file content when loading, so a binary
+    store keeps the configured file name and can be copied like the YAML form.
+    hashes, stats and blobs are read-only mappings in both formats.
+    """
+
+    def __init__(self, hashes=None, stats=None, blobs=None):
+        """
+        Args:
+            hashes: dict of {path: SHA-256 hex}
+            stats: dict of {path: stat signature}
+            blobs: dict of {path: git blob id}
+        """
+        self.hashes = hashes if hashes is not None else {}
+        self.stats = stats if stats is not None else {}
+        self.blobs = blobs if blobs is not None else {}
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __contains__(self, path):
+        return path in self.hashes
+
+    @classmethod
+    def load(cls, checksums_file):
+        """
+        Load a checksum file in either format
+
+        Args:
+            checksums_file: Path to checksum file (str or Path)
+
+        Returns:
+            ChecksumStore: Empty store if the file does not exist or read fails
+        """
+        checksums_file = Path(checksums_file)
+        if not checksums_file.exists():
+            return cls()
+
+        try:
+            with open(checksums_file, 'rb') as f:
+                magic = f.read(len(CHECKSUM_STORE_MAGIC))
+            if magic == CHECKSUM_STORE_MAGIC:
+                return cls._load_binary(checksums_file)
+            return cls._load_yaml(checksums_file)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Warning: Checksum file read error: {e}")
+            return cls()
+
+    @classmethod
+    def _load_yaml(cls, checksums_file):
+        """Parse all three sections in a single pass"""
+        hashes, stats, blobs = {}, {}, {}
+        sections = {'checksums:': hashes, 'stats:': stats, 'blobs:': blobs}
+        current = None
+        with open(checksums_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                stripped = line.strip()
+                if not stripped or stripped.startswith('#'):
+                    continue
+                if not line.startswith(' '):
+                    current = sections.get(stripped)
+                    continue
+                if current is None:
+                    continue
+                path, _, value = stripped.rpartition(':')
+                path = path.strip()
+                value = value.strip()
+                if not path:
+                    continue
+                if current is stats:
+                    fields = value.split()
+                    if len(fields) != 4:
+                        continue
+                    try:
+                        stats[path] = tuple(int(v) for v in fields)
+                    except ValueError:
+                        continue
+                elif _HEX_RE.fullmatch(value):
+                    current[path] = value
+        return cls(hashes, stats, blobs)
+
+    @classmethod
+    def _load_binary(cls, checksums_file):
+        store = _BinaryChecksumFile(checksums_file)
+        return cls(
+            _BinaryChecksumColumn(store, 0, lambda r: r[2].hex()),
+            _BinaryChecksumColumn(store, _RECORD_HAS_STAT, lambda r: (r[3], r[4], r[5], r[6])),
+            _BinaryChecksumColumn(store, _RECORD_HAS_BLOB, lambda r: r[9][:r[8]].hex()),
+        )
+
+    def to_yaml_lines(self, comments=()):
+        """
+        Format the store as YAML
+
+        Args:
+            comments: Header comment lines (without '# ')
+
+        Returns:
+            list: YAML lines
+        """
+        lines = [f"# {comment}" for comment in comments]
+        lines.extend([
+            f"generated_at: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+            f"file_count: {len(self.hashes)}",
+            "checksums:",
+        ])
+        for path, hash_value in sorted(self.hashes.items()):
+            lines.append(f"  {path}: {hash_value}")
+        lines.extend(format_stats_section(self.stats))
+        lines.extend(format_blobs_section(self.blobs))
+        return lines
+
+    def _pack(self):
+        """Serialize to the binary format"""
+        paths = sorted(self.hashes)  # Code point order == UTF-8 byte order
+        records = []
+        path_table = bytearray()
+        for path in paths:
+            encoded = path.encode('utf-8')
+            digest = bytes.fromhex(self.hashes[path])
+            if len(digest) != 32:
+                raise ValueError(f"not a SHA-256 digest: {path}")
+            flags = 0
+            signature = self.stats.get(path)
+            if signature is not None:
+                flags |= _RECORD_HAS_STAT
+            else:
+                signature = (0, 0, 0, 0)
+            blob = b''
+            blob_id = self.blobs.get(path)
+            if blob_id is not None:
+                blob = bytes.fromhex(blob_id)
+                if len(blob) > 32:
+                    raise ValueError(f"blob id too long: {path}")
+                flags |= _RECORD_HAS_BLOB
+            records.append(_STORE_RECORD.pack(len(path_table), len(encoded), digest, *signature,
+                                              flags, len(blob), blob))
+            path_table += encoded
+        header = _STORE_HEADER.pack(CHECKSUM_STORE_MAGIC, CHECKSUM_STORE_VERSION, 0, len(paths))
+        return header + b''.join(records) + bytes(path_table)
+
+    def write(self, path, fmt='yaml', comments=()):
+        """
+        Write the store to path
+
+        The data is written to a temporary file and renamed over path, so a
+        binary store still mapped by a reader is never truncated in place.
+
+        Args:
+            path: Output path (str or Path)
+            fmt: 'yaml' or 'binary'
+            comments: Header comment lines for the YAML format
+
+        Raises:
+            OSError: Write failed
+            ValueError: A hash is not a SHA-256 hex digest (binary format)
+        """
+        path = Path(path)
+        if fmt == 'binary':
+            data = self._pack()
+        else:
+            data = ('\n'.join(self.to_yaml_lines(comments)) + '\n').encode('utf-8')
+        with atomic_write(path, binary=True) as f:
+            f.write(data)
+
+
+def load_checksums(checksums_file):
+    """
+    Get file list from checksum file
+
+    Args:
+        checksums_file: Path to checksum file (str or Path)
+
+    Returns:
+        set: Set of file paths
+    """
+    return set(ChecksumStore.load(checksums_file).hashes)
+
+
+def _run_git(project_root, args):
+    """
+    Run a git command in project_root
+
+    Returns:
+        bytes or None: stdout, None if git is missing or the command fails
+    """
+    try:
+        result = subprocess.run(
+            ['git', '-C', str(project_root)] + args,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False,
+        )
+    except OSError:
+        return None
+    if result.returncode != 0:
+        return None
+    return result.stdout
+
+
+def load_git_blobs(project_root, root_dir_name):
+    """
+    Read blob ids of clean tracked files from the git index
+
+    Runs `git ls-files -s` for blob ids and `git diff --name-only` for
+    files whose worktree content differs from the index. Only regular
+    files at stage 0 that are not dirty are returned, so each blob id is
+    the id of the current file content. Untracked, dirty, conflicted and
+    symlinked-in files are left out and fall back to SHA-256 hashing.
+
+    Args:
+        project_root: Project root (git commands run here)
+        root_dir_name: Root directory relative to project_root (pathspec)
+
+    Returns:
+        dict or None: {source_file: blob id} with NFC project-relative paths,
+                      None if git is unavailable (with a warning)
+    """
+    pathspec = ['--', root_dir_name]
+    listing = _run_git(project_root, ['ls-files', '-s', '-z'] + pathspec)
+    dirty = _run_git(project_root, ['diff', '--name-only', '--relative', '-z'] + pathspec)
+    if listing is None or dirty is None:
+        print("Warning: git index unavailable, falling back to SHA-256 change detection")
+        return None
+
+    dirty_paths = {normalize_path(p) for p in dirty.decode('utf-8', 'surrogateescape').split('\0') if p}
+    blobs = {}
+    conflicted = set()
+    for record in listing.decode('utf-8', 'surrogateescape').split('\0'):
+        if not record:
+            continue
+        info, _, path = record.partition('\t')
+        fields = info.split()
+        if len(fields) != 3:
+            continue
+        mode, blob_id, stage = fields
+        path = normalize_path(path)
+        if stage != '0':
+            conflicted.add(path)
+            continue
+        # 通常ファイルのみ（シンボリックリンク 120000 / サブモジュール 160000 は除外）
+        if mode not in ('100644', '100755'):
+            continue
+        blobs[path] = blob_id
+
+    for path in dirty_paths | conflicted:
+        blobs.pop(path, None)
+    return blobs
+
+
+def parse_source_option(argv):
+    """
+    Parse --source {hash,git} from command line arguments
+
+    Returns:
+        str: 'hash' (default) or 'git', None if the value is invalid
+    """
+    if '--source' not in argv:
+        return 'hash'
+    idx = argv.index('--source')
+    source = argv[idx + 1] if idx + 1 < len(argv) else None
+    return source if source in ('hash', 'git') else None
+
+
+def hash_file(filepath):
+    """
+    Calculate SHA-256 hash of file (chunked read)
+
+    Args:
+        filepath: File path (str or Path)
+
+    Returns:
+        tuple: (hash value, bytes read). Hash value is None on error
+    """
+    sha256 = hashlib.sha256()
+    bytes_read = 0
+    try:
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                sha256.update(chunk)
+                bytes_read += len(chunk)
+    except (IOError, OSError, PermissionError) as e:
+        print(f"Warning: File read error: {filepath} - {e}")
+        return None, bytes_read
+    return sha256.hexdigest(), bytes_read
+
+
+class FileHashCache:
+    """
+    Hash results of one run, keyed by source path
+
+    Change detection and the checksum snapshot writer share this cache,
+    so each file is read at most once per run. When the stat signature
+    matches the previous checksum file, the recorded hash is reused
+    without reading the file at all (unless paranoid).
+
+    With git_blobs (--source git), a clean tracked file whose index blob id
+    matches the blob id recorded with the previous hash reuses that hash
+    without stat comparison or reading.
+    """
+
+    def __init__(self, old_checksums=None, old_stats=None, paranoid=False, old_blobs=None, git_blobs=None):
+        """
+        Args:
+            old_checksums: dict of {source_file: hash} from the previous checksum file
+            old_stats: dict of {source_file: stat signature} from the previous checksum file
+            paranoid: If True, always re-hash (ignore old_stats and old_blobs)
+            old_blobs: dict of {source_file: blob id} from the previous checksum file
+            git_blobs: dict of {source_file: blob id} from load_git_blobs(), None outside git mode
+        """
+        # Not 'or {}': the truth value of a binary store column scans every record (__len__)
+        self.old_checksums = old_checksums if old_checksums is not None else {}
+        self.old_stats = {} if paranoid or old_stats is None else old_stats
+        self.old_blobs = {} if paranoid or old_blobs is None else old_blobs
+        self.git_blobs = git_blobs
+        # Taken before any file is read, so is_racy_signature() stays conservative
+        self.started_ns = time.time_ns()
+        self.hashes = {}
+        self.signatures = {}
+        self.files_hashed = 0
+        self.files_reused = 0
+        self.files_git_reused = 0
+        self.bytes_read = 0
+
+    def _check_stat(self, source_file, filepath, signature=None):
+        """
+        Stat the file and reuse the recorded hash when the signature is unchanged
+
+        Args:
+            signature: Stat signature already known from a scan (skips stat)
+
+        Returns:
+            bool: True if the file still has to be read
+        """
+        if signature is None:
+            try:
+                signature = get_stat_signature(Path(filepath).stat())
+            except (OSError, PermissionError) as e:
+                print(f"Warning: File stat error: {filepath} - {e}")
+                self.hashes[source_file] = None
+                return False
+
+        self.signatures[source_file] = signature
+        old_hash = self.old_checksums.get(source_file)
+        if old_hash is None:
+            return True
+        if self.git_blobs and source_file in self.git_blobs \
+                and self.old_blobs.get(source_file) == self.git_blobs[source_file]:
+            self.hashes[source_file] = old_hash
+            self.files_git_reused += 1
+            return False
+        if self.old_stats.get(source_file) == signature:
+            self.hashes[source_file] = old_hash
+            self.files_reused += 1
+            return False
+        return True
+
+    def _store(self, source_file, result):
+        """Record a hash_file() result"""
+        hash_value, bytes_read = result
+        self.hashes[source_file] = hash_value
+        self.files_hashed += 1
+        self.bytes_read += bytes_read
+
+    def get(self, source_file, filepath, signature=None):
+        """
+        Get hash of a file, reading it only on the first request
+
+        Args:
+            source_file: Project-relative path (cache key)
+            filepath: Path to the file
+            signature: Stat signature already known from a scan (optional)
+
+        Returns:
+            str: Hash value, None on error
+        """
+        if source_file not in self.hashes and self._check_stat(source_file, filepath, signature):
+            self._store(source_file, hash_file(filepath))
+        return self.hashes[source_file]
+
+    def prefetch(self, items, jobs=1, fallback_to_serial=True):
+        """
+        Hash many files up front in a bounded thread pool
+
+        Subsequent get() calls for these files are served from the cache.
+
+        Args:
+            items: Iterable of (source_file, filepath, signature or None),
+                   e.g. ScanEntry tuples from toc_scan()
+            jobs: Number of worker threads (1 = serial)
+            fallback_to_serial: If True, hash serially when the pool fails
+
+        Raises:
+            RuntimeError, OSError: When the pool fails and fallback_to_serial is False
+        """
+        to_read = [(source_file, filepath) for source_file, filepath, signature, *_ in items
+                   if source_file not in self.hashes and self._check_stat(source_file, filepath, signature)]
+
+        results = None
+        if jobs > 1 and len(to_read) > 1:
+            try:
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    results = list(executor.map(hash_file, [filepath for _, filepath in to_read]))
+            except (RuntimeError, OSError) as e:
+                if not fallback_to_serial:
+                    raise
+                print(f"Warning: Parallel hashing failed, falling back to serial - {e}")
+
+        if results is None:
+            results = [hash_file(filepath) for _, filepath in to_read]
+
+        for (source_file, _), result in zip(to_read, results):
+            self._store(source_file, result)
+
+    def get_stats(self, source_files):
+        """
+        Get stat signatures to record for the given files
+
+        Racy signatures (see is_racy_signature()) are left out.
+
+        Args:
+            source_files: Iterable of source paths already passed to get()
+
+        Returns:
+            dict: {source_file: stat signature}
+        """
+        stats = {}
+        for source_file in source_files:
+            signature = self.signatures.get(source_file)
+            if signature is not None and not is_racy_signature(signature, self.started_ns):
+                stats[source_file] = signature
+        return stats
+
+    def get_blobs(self, source_files):
+        """
+        Get git blob ids to record for the given files (--source git)
+
+        Only clean tracked files with a non-racy stat signature are recorded:
+        a file modified after the git index was read could otherwise be
+        recorded with a blob id that does not match the hashed content.
+
+        Args:
+            source_files: Iterable of source paths already passed to get()
+
+        Returns:
+            dict: {source_file: blob id}. Empty dict outside git mode
+        """
+        if not self.git_blobs:
+            return {}
+        blobs = {}
+        for source_file in source_files:
+            blob_id = self.git_blobs.get(source_file)
+            signature = self.signatures.get(source_file)
+            if blob_id is not None and signature is not None \
+                    and not is_racy_signature(signature, self.started_ns):
+                blobs[source_file] = blob_id
+        return blobs
+
+    def summary(self):
+        """Return one-line I/O summary for script output"""
+        line = (f"Hashing: {self.files_hashed} files hashed, {self.bytes_read} bytes read, "
+                f"{self.files_reused} reused (stat unchanged)")
+        if self.git_blobs is not None:
+            line += f", {self.files_git_reused} reused (git blob unchanged)"
+        return line
+
+
+def cleanup_work_dir(work_dir):
+    """
+    Delete work directory
+
+    Args:
+        work_dir: Directory path to delete (str or Path)
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    work_dir = Path(work_dir)
+    if work_dir.exists():
+        try:
+            shutil.rmtree(work_dir)
+            print(f"Cleanup complete: {work_dir}")
+            return True
+        except (OSError, PermissionError) as e:
+            print(f"Warning: Cleanup failed: {work_dir} - {e}")
+            print("   Please delete manually")
+            return False
+    return True
+
+
+class WorkDB:
+    """
+    Pending ToC entries in .toc_work/work.db (sqlite3, WAL mode)
+
+    Alternative to one .toc_work/*.yaml per document (common.work.db).
+    Each row holds the fields of the intermediate entry file; list fields
+    are stored as JSON arrays. Rows are keyed by the per-file entry name
+    ({path with / replaced by _}.yaml), so an --entry-file path passed to
+    write_*_pending.py addresses the same entry in both layouts.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            name TEXT PRIMARY KEY,
+            source_file TEXT NOT NULL UNIQUE,
+            doc_type TEXT,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'completed', 'error')),
+            updated_at TEXT,
+            title TEXT,
+            purpose TEXT,
+            content_details TEXT NOT NULL DEFAULT '[]',
+            applicable_tasks TEXT NOT NULL DEFAULT '[]',
+            keywords TEXT NOT NULL DEFAULT '[]',
+            "references" TEXT,
+            schema_stamp TEXT
+        );
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Database file path (created if missing)
+        """
+        self.path = Path(path)
+        self.conn = sqlite3.connect(str(self.path), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, 1, WORK_DB_VERSION):
+            self.conn.close()
+            raise sqlite3.DatabaseError(f"unsupported work.db version: {version}")
+        if version == 0:
+            self.conn.executescript(self.SCHEMA + f"PRAGMA user_version = {WORK_DB_VERSION};")
+        elif version == 1:
+            # Version 1 had no schema_stamp column (its entries are checked at merge time)
+            self.conn.executescript("ALTER TABLE entries ADD COLUMN schema_stamp TEXT;"
+                                    f"PRAGMA user_version = {WORK_DB_VERSION};")
+
+    @classmethod
+    def open(cls, work_dir, create=False):
+        """
+        Open work_dir/work.db
+
+        Args:
+            work_dir: .toc_work directory
+            create: Create the database if it does not exist
+
+        Returns:
+            WorkDB or None: None if the database does not exist and create is False
+        """
+        path = Path(work_dir) / WORK_DB_FILENAME
+        if not create and not path.exists():
+            return None
+        return cls(path)
+
+    def close(self):
+        self.conn.close()
+
+    def add_pending(self, rows):
+        """
+        Insert (or reset) pending entries in one transaction
+
+        Args:
+            rows: Iterable of (name, source_file, doc_type); doc_type is None for rules
+
+        Returns:
+            int: Number of rows written
+        """
+        rows = list(rows)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (name, source_file, doc_type, status) VALUES (?, ?, ?, 'pending')",
+                rows)
+        return len(rows)
+
+    @staticmethod
+    def _row_to_entry(row):
+        name, source_file, doc_type, status, updated_at, schema_stamp, title, purpose = row[:8]
+        meta = {'source_file': source_file, 'status': status, 'updated_at': updated_at}
+        if doc_type is not None:
+            meta['doc_type'] = doc_type
+        if schema_stamp is not None:
+            meta['schema_stamp'] = schema_stamp
+        entry = {'title': title, 'purpose': purpose}
+        for field, value in zip(ENTRY_LIST_FIELDS, row[8:]):
+            if value is not None:
+                entry[field] = json.loads(value)
+        return name, meta, entry
+
+    _SELECT = ('SELECT name, source_file, doc_type, status, updated_at, schema_stamp, title, purpose, '
+               'content_details, applicable_tasks, keywords, "references" FROM entries')
+
+    def get(self, name):
+        """
+        Get one entry
+
+        Returns:
+            tuple or None: (meta, entry) in the shape of load_entry_file(), None if absent
+        """
+        row = self.conn.execute(self._SELECT + ' WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        _, meta, entry = self._row_to_entry(row)
+        return meta, entry
+
+    def entries(self, status=None):
+        """
+        Get all entries ordered by name
+
+        Args:
+            status: Only entries with this status (None: all)
+
+        Returns:
+            list: [(name, meta, entry)]
+        """
+        if status is None:
+            rows = self.conn.execute(self._SELECT + ' ORDER BY name')
+        else:
+            rows = self.conn.execute(self._SELECT + ' WHERE status = ? ORDER BY name', (status,))
+        return [self._row_to_entry(row) for row in rows]
+
+    def complete(self, name, updated_at, entry, force=False, schema_stamp=None):
+        """
+        Store analysis results and mark the entry completed
+
+        The status check and the update run in one statement, so two
+        writers cannot both complete the same entry without force.
+        schema_stamp is the writer's _meta.schema_stamp (toc_schema.py).
+
+        Returns:
+            bool: False if the entry does not exist or is already completed (without force)
+        """
+        values = [entry.get('title'), entry.get('purpose'), updated_at, schema_stamp]
+        values += [json.dumps(entry.get(field, []), ensure_ascii=False) for field in ENTRY_LIST_FIELDS[:3]]
+        references = entry.get('references')
+        values.append(None if references is None else json.dumps(references, ensure_ascii=False))
+        with self.conn:
+            cursor = self.conn.execute(
+                "UPDATE entries SET status = 'completed', title = ?, purpose = ?, updated_at = ?, schema_stamp = ?, "
+                'content_details = ?, applicable_tasks = ?, keywords = ?, "references" = ? '
+                "WHERE name = ? AND (status != 'completed' OR ?)",
+                values + [name, force])
+        return cursor.rowcount == 1
+
+    def export(self, work_dir):
+        """
+        Write every entry as a per-file YAML and remove the database
+
+        Returns:
+            int: Number of files written
+        """
+        work_dir = Path(work_dir)
+        entries = self.entries()
+        for name, meta, entry in entries:
+            with atomic_write(work_dir / name) as f:
+                f.write(format_entry_yaml(meta, entry))
+        self.close()
+        for suffix in ('', '-wal', '-shm'):
+            Path(str(self.path) + suffix).unlink(missing_ok=True)
+        return len(entries)
+
+
+def extract_id_from_filename(filename):
+    """
+    DEPRECATED: This function is no longer recommended.
+
+    Document identification should use file path instead of filename-based ID.
+    See DES-003_document_identifier.md for details.
+
+    This function is kept for backward compatibility but should not be used
+    in new code. The file path (relative to the root directory) serves as
+    the unique identifier for each document.
+
+    ---
+    Original docstring:
+    Extract document ID from filename (generic regex version)
+
+    Args:
+        filename: Filename (path also accepted)
+
+    Returns:
+        str or None: Extracted ID, None if not found
+
+    Examples:
+        'SCR-001_foo.md' → 'SCR-001'
+        'DES-042_bar.md' → 'DES-042'
+        'CUSTOM-123_baz.md' → 'CUSTOM-123'
+    """
+    import warnings
+    warnings.warn(
+        "extract_id_from_filename is deprecated. Use file path as document identifier.",
+        DeprecationWarning,
+        stacklevel=2
+    )
+    # Get only filename part if path is provided
+    if '/' in filename:
+        filename = filename.split('/')[-1]
+
+    # Match [A-Z]+-\d+ pattern
+    match = re.match(r'([A-Z]+-\d+)', filename)
+    if match:
+        return match.group(1)
+    return None
+
+
+class ExcludeMatcher:
+    """
+    Exclude patterns compiled once for repeated matching
+
+    Patterns are stripped of leading/trailing '/' and NFC-normalized at
+    construction time:
+        - Patterns without '/' go into a frozenset of exact directory names
+        - Patterns containing '/' are joined into one regex matched as a
+          substring of the directory path
+
+    Iterating the matcher yields the original patterns (used for the scan
+    fingerprint).
+    """
+
+    __slots__ = ('patterns', 'names', '_substring_re')
+
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        names = set()
+        substrings = set()
+        for pattern in self.patterns:
+            # 先頭・末尾の / を除去し NFC 正規化
+            normalized = normalize_path(pattern.strip('/'))
+            if '/' in normalized:
+                substrings.add(normalized)
+            else:
+                names.add(normalized)
+        self.names = frozenset(names)
+        if substrings:
+            # 長いパターンを先に並べる（どれか一つにマッチすれば除外なので順序は結果に影響しない）
+            alternatives = sorted(substrings, key=lambda p: (-len(p), p))
+            self._substring_re = re.compile('|'.join(re.escape(p) for p in alternatives))
+        else:
+            self._substring_re = None
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __repr__(self):
+        return f"ExcludeMatcher({list(self.patterns)!r})"
+
+    def excludes_dir(self, dir_path):
+        """
+        Check if a directory (and everything below it) is excluded
+
+        Args:
+            dir_path: NFC-normalized directory path relative to root ('' for root)
+
+        Returns:
+            bool: True if excluded
+        """
+        if not dir_path:
+            return False
+        if self.names and not self.names.isdisjoint(dir_path.split('/')):
+            return True
+        return self._substring_re is not None and self._substring_re.search(dir_path) is not None
+
+    def excludes_child(self, dir_path, name):
+        """
+        Check a subdirectory whose parent is already known not to be excluded
+
+        Only the new path component needs the name lookup, so the walker
+        avoids re-splitting the whole path at every level.
+
+        Args:
+            dir_path: NFC-normalized subdirectory path relative to root
+            name: NFC-normalized last component of dir_path
+
+        Returns:
+            bool: True if excluded
+        """
+        if name in self.names:
+            return True
+        return self._substring_re is not None and self._substring_re.search(dir_path) is not None
+
+    def excludes_file(self, filepath, root_dir):
+        """
+        Check if a file should be excluded (see should_exclude())
+
+        Returns:
+            bool: True if excluded
+        """
+        rel_path = normalize_path(filepath.relative_to(root_dir))
+        return self.excludes_dir(rel_path.rpartition('/')[0])
+
+
+@functools.lru_cache(maxsize=32)
+def _compile_exclude_patterns_cached(patterns):
+    return ExcludeMatcher(patterns)
+
+
+def compile_exclude_patterns(exclude_patterns):
+    """
+    Compile exclude patterns into an ExcludeMatcher
+
+    Args:
+        exclude_patterns: List of exclusion patterns, or an ExcludeMatcher
+                          (returned as is)
+
+    Returns:
+        ExcludeMatcher: Compiled matcher (cached per pattern list)
+    """
+    if isinstance(exclude_patterns, ExcludeMatcher):
+        return exclude_patterns
+    return _compile_exclude_patterns_cached(tuple(exclude_patterns))
+
+
+def should_exclude(filepath, root_dir, exclude_patterns):
+    """
+    Check if file should be excluded
+
+    Args:
+        filepath: File path to check (Path)
+        root_dir: Root directory (Path)
+        exclude_patterns: List of exclusion patterns, or an ExcludeMatcher
+
+    Returns:
+        bool: True if should be excluded
+
+    Note:
+        - All patterns are matched against directory path only (filename excluded)
+        - Patterns containing '/' are matched as path substring
+        - Patterns without '/' are matched as exact directory name
+        - This prevents 'plan' from excluding 'planning.md'
+        - NFC normalization is applied for macOS NFD compatibility
+    """
+    return compile_exclude_patterns(exclude_patterns).excludes_file(filepath, root_dir)
+
+
+def should_exclude_dir(dir_path, exclude_patterns):
+    """
+    Check if every file under a directory should be excluded
+
+    A file is excluded exactly when its directory is, so the walker can
+    prune excluded directories instead of filtering their files.
+
+    Args:
+        dir_path: NFC-normalized directory path relative to root ('' for root)
+        exclude_patterns: List of exclusion patterns, or an ExcludeMatcher
+
+    Returns:
+        bool: True if the directory (and everything below it) is excluded
+    """
+    return compile_exclude_patterns(exclude_patterns).excludes_dir(dir_path)
+
+
+class DirListingCache:
+    """
+    Persistent cache of directory listings keyed on directory stat
+
+    Each directory walked is stored with (st_mtime_ns, st_dev, st_ino) of
+    the directory itself (symlinks followed) and its child names split into
+    subdirectories, other entries and symlinks. Adding, removing or renaming
+    a child updates the directory mtime, so an unchanged signature means the
+    listing can be reused without re-reading the directory.
+
+    Symlink children are not trusted: their targets can change without
+    touching the parent, so they are re-resolved with os.stat() on every
+    walk. A directory reached through a symlink is keyed by the path it was
+    reached by and validated against the target's inode, so retargeting the
+    link invalidates the entry.
+
+    Listings whose mtime falls within RACY_WINDOW_NS of the walk are not
+    saved (a change in the same timestamp tick would be invisible).
+    Only directories visited in this walk are saved, so removed or newly
+    excluded directories drop out of the cache.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.started_ns = time.time_ns()
+        self.hits = 0
+        self.misses = 0
+        self._old = self._load()
+        self._new = {}
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if not isinstance(data, dict) or data.get('version') != DIR_CACHE_VERSION:
+            return {}
+        dirs = data.get('dirs')
+        return dirs if isinstance(dirs, dict) else {}
+
+    @staticmethod
+    def _signature(dir_stat):
+        return [dir_stat.st_mtime_ns, dir_stat.st_dev, dir_stat.st_ino]
+
+    def lookup(self, dirpath, dir_stat):
+        """
+        Get the cached listing of a directory if still valid
+
+        Args:
+            dirpath: Directory path as walked (str)
+            dir_stat: os.stat() of the directory (symlinks followed)
+
+        Returns:
+            tuple or None: (dirs, files, links) name lists, None on miss
+        """
+        cached = self._old.get(dirpath)
+        if (isinstance(cached, list) and len(cached) == 4
+                and cached[0] == self._signature(dir_stat)):
+            self.hits += 1
+            self._new[dirpath] = cached
+            return cached[1], cached[2], cached[3]
+        self.misses += 1
+        return None
+
+    def store(self, dirpath, dir_stat, dirs, files, links):
+        """Record a freshly read listing (skipped if racily clean)"""
+        if dir_stat.st_mtime_ns >= self.started_ns - RACY_WINDOW_NS:
+            return
+        self._new[dirpath] = [self._signature(dir_stat), dirs, files, links]
+
+    def save(self):
+        """
+        Write the listings visited in this walk
+
+        Returns:
+            bool: True on success (failures only disable the cache for the next run)
+        """
+        data = {'version': DIR_CACHE_VERSION, 'dirs': self._new}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with atomic_write(self.path, fsync=False) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        except OSError as e:
+            print(f"Warning: Failed to write directory cache {self.path}: {e}")
+            return False
+        return True
+
+    def summary(self):
+        """One-line summary of cache usage"""
+        return f"Directory cache: {self.hits} reused, {self.misses} listed"
+
+
+def _list_dir(dirpath, dir_stat, dir_cache=None):
+    """
+    ディレクトリの子要素を名前順に列挙する。
+
+    dir_cache が有効なら一覧を再利用し、読み直した一覧は dir_cache に記録する。
+
+    Args:
+        dirpath: ディレクトリパス (str)
+        dir_stat: ディレクトリの os.stat() 結果
+        dir_cache: DirListingCache または None
+
+    Returns:
+        list or None: [(名前, ディレクトリか, stat 取得関数)]。読み取り失敗時は None
+    """
+    listing = dir_cache.lookup(dirpath, dir_stat) if dir_cache is not None else None
+
+    if listing is None:
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            return None
+        items = []
+        dirs, files, links = [], [], []
+        for entry in entries:
+            try:
+                is_link = entry.is_symlink()
+                is_dir = entry.is_dir()  # シンボリックリンクは follow
+            except OSError:
+                continue
+            if is_link:
+                links.append(entry.name)
+            elif is_dir:
+                dirs.append(entry.name)
+            else:
+                files.append(entry.name)
+            items.append((entry.name, is_dir, entry.stat))
+        if dir_cache is not None:
+            dir_cache.store(dirpath, dir_stat, dirs, files, links)
+        return items
+
+    # キャッシュヒット: 通常のエントリは種別が変わらない（変われば親の mtime が変わる）
+    dirs, files, links = listing
+    items = [(name, True, functools.partial(os.stat, os.path.join(dirpath, name))) for name in dirs]
+    items += [(name, False, functools.partial(os.stat, os.path.join(dirpath, name))) for name in files]
+    # シンボリックリンクはリンク先が親の mtime と無関係に変わるため毎回解決する
+    for name in links:
+        path = os.path.join(dirpath, name)
+        try:
+            link_stat = os.stat(path)
+        except OSError:
+            items.append((name, False, functools.partial(os.stat, path)))  # リンク切れ
+            continue
+        items.append((name, stat.S_ISDIR(link_stat.st_mode), lambda st=link_stat: st))
+    items.sort(key=lambda item: item[0])
+    return items
+
+
+def rglob_follow_symlinks(root_dir, pattern):
+    """
+    シンボリックリンクを follow して再帰的にファイルを検索する。
+
+    inode を追跡してシンボリックリンクループを防止し、
+    同じファイルへの複数パスを重複排除する。
+
+    Args:
+        root_dir: 検索開始ディレクトリ (Path or str)
+        pattern: glob パターン (例: "*.md", "**/*.md")
+
+    Yields:
+        Path: マッチしたファイルパス
+
+    Note:
+        - シンボリックリンクのループを検出して無限再帰を防止
+        - 同じファイルへの複数パス（シンボリックリンク経由）は一度だけ yield
+        - "**/" を含むパターンは再帰的に検索、含まないパターンは直下のみ
+    """
+    for filepath, _, _, _ in _scan_tree(root_dir, pattern):
+        yield filepath
+
+
+def _scan_tree(root_dir, pattern, exclude_patterns=(), dir_to_doctype=None, dir_cache=None, visited_dirs=None,
+               dir_signatures=None):
+    """
+    os.scandir ベースの走査本体（シンボリックリンク対応）。
+
+    除外パターンと target_dirs をディレクトリ単位で評価し、除外された
+    ディレクトリ配下は列挙も stat もしない（枝刈り）。ディレクトリ判定は
+    DirEntry の d_type を使い、ファイルの stat はマッチしたファイルのみ
+    DirEntry.stat()（結果はキャッシュされ署名にもそのまま使う）で行う。
+
+    Args:
+        root_dir: 検索開始ディレクトリ (Path or str)
+        pattern: glob パターン (例: "*.md", "**/*.md")
+        exclude_patterns: 除外パターンのリストまたは ExcludeMatcher
+        dir_to_doctype: {ディレクトリ名: doc_type}。指定時はパスに対象
+                        ディレクトリを含むファイルのみ返す（specs 用）
+        dir_cache: DirListingCache。指定時は変更のないディレクトリを再列挙しない
+        visited_dirs: リスト指定時、走査したディレクトリのパス (str) を追加する
+        dir_signatures: リスト指定時、走査したディレクトリの (パス, stat 署名) を追加する
+
+    Yields:
+        tuple: (Path, NFC 正規化済み相対パス, os.stat_result, doc_type)
+    """
+    # パターンを解析
+    # "**/*.md" -> 再帰的に検索、"*.md" -> 直下のみ
+    if '**' in pattern:
+        # "**/*.md" -> "*.md", "**/*.yaml" -> "*.yaml"
+        file_pattern = pattern.replace('**/', '').replace('**', '')
+        if not file_pattern:
+            file_pattern = '*'
+        recursive = True
+    else:
+        file_pattern = pattern
+        recursive = False
+
+    try:
+        root_stat = os.stat(root_dir)
+    except OSError:
+        return
+
+    exclude_matcher = compile_exclude_patterns(exclude_patterns)
+    seen_inodes = set()
+    # (ディレクトリパス, 相対パス, 継承した doc_type, stat) のスタック（深さ優先）
+    stack = [(str(root_dir), '', None, root_stat)]
+
+    while stack:
+        dirpath, rel_dir, dir_doc_type, dir_stat = stack.pop()
+
+        # ディレクトリの inode をチェック（シンボリックリンクループ防止）
+        dir_inode = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_inode in seen_inodes:
+            continue
+        seen_inodes.add(dir_inode)
+
+        items = _list_dir(dirpath, dir_stat, dir_cache)
+        if items is None:
+            continue
+        if visited_dirs is not None:
+            visited_dirs.append(dirpath)
+        if dir_signatures is not None:
+            dir_signatures.append((dirpath, get_stat_signature(dir_stat)))
+
+        subdirs = []
+        for entry_name, is_dir, get_stat in items:
+            entry_path = os.path.join(dirpath, entry_name)
+
+            if is_dir:
+                if not recursive:
+                    continue
+                name = normalize_path(entry_name)
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                # 除外ディレクトリは配下を走査しない
+                if exclude_matcher and exclude_matcher.excludes_child(rel_path, name):
+                    continue
+                doc_type = dir_doc_type
+                if doc_type is None and dir_to_doctype:
+                    doc_type = dir_to_doctype.get(name)
+                try:
+                    subdir_stat = get_stat()
+                except OSError:
+                    continue
+                subdirs.append((entry_path, rel_path, doc_type, subdir_stat))
+                continue
+
+            if not fnmatch.fnmatch(entry_name, file_pattern):
+                continue
+
+            name = normalize_path(entry_name)
+            doc_type = dir_doc_type
+            if dir_to_doctype is not None and doc_type is None:
+                doc_type = dir_to_doctype.get(name)
+                if doc_type is None:
+                    continue  # 対象ディレクトリ外
+
+            # ファイルの inode もチェック（同じファイルへの複数パスを防止）
+            try:
+                file_stat = get_stat()
+            except OSError:
+                continue
+            file_inode = (file_stat.st_dev, file_stat.st_ino)
+            if file_inode in seen_inodes:
+                continue
+            seen_inodes.add(file_inode)
+
+            rel_path = f"{rel_dir}/{name}" if rel_dir else name
+            yield Path(entry_path), rel_path, file_stat, doc_type
+
+        # サブディレクトリを名前順に処理
+        stack.extend(reversed(subdirs))
+
+
+# One scanned document. signature is get_stat_signature() of the file,
+# doc_type is None for rules.
+ScanEntry = namedtuple('ScanEntry', ['source_file', 'path', 'signature', 'doc_type'])
+
+
+class ScanResult:
+    """
+    Immutable result of one toc_scan() walk
+
+    Entries are sorted by source_file (project-relative path with the
+    root directory prefix, e.g. 'specs/main/requirements/app.md').
+    dirs holds (path, stat signature) of every walked directory, None for
+    signatures within RACY_WINDOW_NS of the walk; dirs_unchanged() uses it
+    to tell whether a persisted result still lists the current files.
+    """
+
+    __slots__ = ('category', 'fingerprint', 'entries', 'dirs', '_by_source')
+
+    def __init__(self, category, fingerprint, entries, dirs=()):
+        self.category = category
+        self.fingerprint = fingerprint
+        self.entries = tuple(sorted(entries, key=lambda e: e.source_file))
+        self.dirs = tuple(dirs)
+        self._by_source = {entry.source_file: entry for entry in self.entries}
+
+    def __setattr__(self, name, value):
+        if hasattr(self, '_by_source'):
+            raise AttributeError("ScanResult is immutable")
+        object.__setattr__(self, name, value)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, source_file):
+        return source_file in self._by_source
+
+    def get(self, source_file):
+        """Return ScanEntry for source_file, None if not scanned"""
+        return self._by_source.get(source_file)
+
+    def source_files(self):
+        """Return frozenset of all source_file keys"""
+        return frozenset(self._by_source)
+
+    def dirs_unchanged(self):
+        """
+        Check with one stat per walked directory that no file was added, removed or renamed since the walk
+
+        Adding, removing or renaming an entry updates its directory's
+        mtime, so unchanged directories list the same files. Entry
+        signatures are not revalidated: files edited in place keep their
+        directory's mtime.
+
+        Returns:
+            bool: False if any directory changed, is gone, or had a racy signature
+        """
+        if not self.dirs:
+            return False  # Root directory missing at scan time: it may exist now
+        for dirpath, signature in self.dirs:
+            if signature is None:
+                return False
+            try:
+                if get_stat_signature(os.stat(dirpath)) != signature:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def save(self, path):
+        """
+        Persist scan result as JSON (e.g., .toc_work/.scan.json)
+
+        Returns:
+            bool: True on success, False on failure
+        """
+        data = {
+            'version': SCAN_RESULT_VERSION,
+            'category': self.category,
+            'fingerprint': self.fingerprint,
+            'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'entries': [[e.source_file, str(e.path), list(e.signature), e.doc_type] for e in self.entries],
+            'dirs': [[dirpath, None if signature is None else list(signature)] for dirpath, signature in self.dirs],
+        }
+        try:
+            with atomic_write(path, fsync=False) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            return True
+        except (IOError, OSError, PermissionError) as e:
+            print(f"Warning: Failed to save scan result: {path} - {e}")
+            return False
+
+
+def get_scan_fingerprint(category, root_dir, exclude_patterns, target_dirs=None, target_glob='**/*.md'):
+    """
+    Build the settings fingerprint a persisted scan result must match
+
+    Returns:
+        dict: JSON-serializable scan settings
+    """
+    return {
+        'category': category,
+        'root_dir': str(root_dir),
+        'target_glob': target_glob,
+        'exclude': list(exclude_patterns),
+        'target_dirs': dict(target_dirs) if target_dirs else None,
+    }
+
+
+def toc_scan(category, root_dir, root_dir_name, exclude_patterns, target_dirs=None, target_glob='**/*.md',
+             dir_cache=None, visited_dirs=None):
+    """
+    Walk the document tree once and collect every target document
+
+    This is the single implementation of the target file walk
+    (symlink-aware walk + exclude patterns + specs target_dirs).
+
+    Args:
+        category: 'rules' or 'specs'
+        root_dir: Root directory to scan (Path)
+        root_dir_name: Root directory prefix for source_file (e.g., 'specs')
+        exclude_patterns: List of exclusion patterns (system + user), or an ExcludeMatcher
+        target_dirs: specs only - mapping of {doc_type: dir_name}.
+                     Files without a target directory in their path are skipped.
+        target_glob: glob pattern for target files
+        dir_cache: Optional DirListingCache (see open_dir_cache()); saved after the walk
+        visited_dirs: Optional list, filled with every directory walked (excluded
+                      subtrees are not included)
+
+    Returns:
+        ScanResult: Immutable scan result
+    """
+    root_dir = Path(root_dir)
+    exclude_patterns = compile_exclude_patterns(exclude_patterns)
+    dir_to_doctype = {v: k for k, v in target_dirs.items()} if target_dirs is not None else None
+    dir_signatures = []
+    entries = [
+        ScanEntry(f"{root_dir_name}/{rel_path}", filepath, get_stat_signature(file_stat), doc_type)
+        for filepath, rel_path, file_stat, doc_type
+        in _scan_tree(root_dir, target_glob, exclude_patterns, dir_to_doctype, dir_cache, visited_dirs,
+                      dir_signatures)
+    ]
+    if dir_cache is not None:
+        dir_cache.save()
+
+    # A directory changed again in the same mtime tick would look unchanged (see is_racy_signature())
+    now_ns = time.time_ns()
+    dirs = [(dirpath, None if is_racy_signature(signature, now_ns) else signature)
+            for dirpath, signature in dir_signatures]
+    fingerprint = get_scan_fingerprint(category, root_dir, exclude_patterns, target_dirs, target_glob)
+    return ScanResult(category, fingerprint, entries, dirs)
+
+
+def load_scan_result(path, fingerprint):
+    """
+    Load a persisted scan result if it matches the current settings and tree
+
+    The fingerprint only covers the settings; the tree is checked with
+    ScanResult.dirs_unchanged() (one stat per walked directory), so files
+    added or deleted since the walk make the result stale.
+
+    Args:
+        path: Scan result file (e.g., .toc_work/.scan.json)
+        fingerprint: Expected fingerprint from get_scan_fingerprint()
+
+    Returns:
+        ScanResult or None: None if missing, unreadable or stale
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        scan = cached_load(path, _read_scan_result)
+    except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+        print(f"Warning: Ignoring unreadable scan result: {path} - {e}")
+        return None
+    if scan is None or scan.fingerprint != fingerprint or not scan.dirs_unchanged():
+        return None
+    return scan
+
+
+def _read_scan_result(path):
+    """Parse a scan result file (None for another version)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != SCAN_RESULT_VERSION:
+        return None
+    entries = [ScanEntry(source_file, Path(filepath), tuple(signature), doc_type)
+               for source_file, filepath, signature, doc_type in data['entries']]
+    dirs = [(dirpath, None if signature is None else tuple(signature)) for dirpath, signature in data['dirs']]
+    return ScanResult(data.get('category'), data.get('fingerprint'), entries, dirs)
+
+
+def delegate_to_server(call, target=None, stdin_option=None):
+    """
+    Run this script invocation on the ToC server (serve_toc.py) if one is running
+
+    Sends sys.argv[1:] and the working directory over SERVE_SOCKET_PATH and
+    replays the server's stdout/stderr. Called from the __main__ block of
+    the scripts the server implements.
+
+    Args:
+        call: Server call name (write_entry, merge, validate, checksums, query, query_toc)
+        target: 'rules', 'specs' or None when the script parses --target itself
+        stdin_option: Option whose value '-' means the script reads stdin (forwarded to the server)
+
+    Returns:
+        int or None: Exit code, or None to run in-process (no server, disabled or failed)
+    """
+    if os.environ.get(SERVE_DISABLE_ENV) == '1' or not os.path.exists(SERVE_SOCKET_PATH):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    request = {}
+    try:
+        try:
+            sock.connect(SERVE_SOCKET_PATH)
+        except OSError:
+            return None  # Stale socket file (server exited without cleanup)
+        argv = sys.argv[1:]
+        request = {'call': call, 'target': target, 'argv': argv, 'cwd': os.getcwd()}
+        if stdin_option in argv and argv[argv.index(stdin_option) + 1:][:1] == ['-']:
+            request['stdin'] = sys.stdin.read()
+        sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            response = json.loads(f.readline())
+    except (OSError, ValueError) as e:
+        if 'stdin' in request:
+            # stdin is consumed: running in-process would silently see no input
+            print(f"Error: ToC server request failed - {e}", file=sys.stderr)
+            return 1
+        print(f"Warning: ToC server request failed, running in-process - {e}", file=sys.stderr)
+        return None
+    finally:
+        sock.close()
+    if 'error' in response:
+        if 'stdin' in request:
+            print(f"Error: ToC server: {response['error']}", file=sys.stderr)
+            return 1
+        print(f"Warning: ToC server: {response['error']} - running in-process", file=sys.stderr)
+        return None
+    sys.stdout.write(response.get('stdout', ''))
+    sys.stdout.flush()
+    sys.stderr.write(response.get('stderr', ''))
+    return response.get('exit_code', 1)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# doc-advisor-version-xK9XmQ: 3.5
+"""
+specs_toc.yaml 検査スクリプト
+
+生成された specs_toc.yaml の整合性を検査する。
+
+使用方法:
+    python3 validate_specs_toc.py [--file PATH] [--timings]
+
+オプション:
+    --file     検査対象ファイル（デフォルト: .claude/doc-advisor/toc/specs/specs_toc.yaml）
+    --timings  検査段階ごとの処理時間を表示
+
+検査項目:
+    1. YAML構文検査
+    2. 必須フィールド検査（merge 時に検査済みの ToC は省略）
+    3. ファイル参照検査（merge と同じ条件の1回の走査結果と照合）
+    4. 重複ID検査
+    5. references 検査（リンク切れはエラー、循環参照は警告）
+"""
+
+import os
+import posixpath
+import sys
+import re
+from pathlib import Path
+
+from toc_utils import (
+    get_project_root,
+    load_config,
+    resolve_config_path,
+    cached_load,
+    read_toc_entries,
+    get_default_target_dirs,
+    get_system_exclude_patterns,
+    compile_exclude_patterns,
+    toc_scan,
+    open_dir_cache,
+    reference_candidates,
+    TocGraph,
+    StageTimer,
+    load_toc_sidecar_header,
+    delegate_to_server,
+)
+from toc_schema import SCHEMA_VERSION, ENTRY_SCHEMAS, compile_entry_check
+
+# ToC フォーマットの必須フィールド検査（toc_schema.py）
+CHECK_ENTRY = compile_entry_check('specs', 'toc')
+STRING_FIELDS = {field.name for field in ENTRY_SCHEMAS['specs'] if field.kind == 'string'}
+
+# Global configuration (initialized in init_config())
+CONFIG = None
+PROJECT_ROOT = None
+SPECS_DIR = None
+SPECS_DIR_NAME = None
+CHECKSUMS_FILE = None
+TARGET_DIRS = None
+EXCLUDE_MATCHER = None
+DEFAULT_TOC_FILE = None
+
+
+def init_config():
+    """
+    Initialize configuration. Call this at the start of main().
+
+    Returns:
+        bool: True on success, False on failure
+    """
+    global CONFIG, PROJECT_ROOT, SPECS_DIR, SPECS_DIR_NAME, CHECKSUMS_FILE, TARGET_DIRS, EXCLUDE_MATCHER
+    global DEFAULT_TOC_FILE
+
+    try:
+        CONFIG = load_config('specs')
+        PROJECT_ROOT = get_project_root()
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        return False
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return False
+
+    SPECS_DIR_NAME = CONFIG.get('root_dir', 'specs').rstrip('/')
+    SPECS_DIR = PROJECT_ROOT / SPECS_DIR_NAME
+    CHECKSUMS_FILE = resolve_config_path(CONFIG.get('checksums_file', '.toc_checksums.yaml'), SPECS_DIR, PROJECT_ROOT)
+    DEFAULT_TOC_FILE = resolve_config_path(CONFIG.get('toc_file', 'specs_toc.yaml'), SPECS_DIR, PROJECT_ROOT)
+    # merge_specs_toc.py と同じ走査対象（target_dirs + 除外パターン）
+    patterns_config = CONFIG.get('patterns', {})
+    TARGET_DIRS = patterns_config.get('target_dirs', get_default_target_dirs())
+    EXCLUDE_MATCHER = compile_exclude_patterns(
+        get_system_exclude_patterns('specs') + patterns_config.get('exclude', []))
+    return True
+
+
+def load_existing_toc(toc_path):
+    """
+    既存の specs_toc.yaml を (パス, エントリ) のリストとして読み込み
+    （重複キーも保持。merge が書いたサイドカーが最新ならテキストをパースしない）
+
+    Raises:
+        OSError / UnicodeDecodeError: 読み込み失敗時
+    """
+    return cached_load(toc_path, read_toc_entries)
+
+
+def get_existing_files():
+    """
+    走査対象の既存ファイル集合（SPECS_DIR プレフィックス付き）
+
+    merge_specs_toc.py と同じ条件（target_dirs + 除外パターン、除外ディレクトリは
+    降りない）で一度だけ走査する。Phase 1 の .scan.json はその後の削除を反映しない
+    ため使わない（common.scan.dir_cache が有効なら変更のないディレクトリは読まない）。
+    """
+    dir_cache = open_dir_cache(CHECKSUMS_FILE)
+    scan = toc_scan('specs', SPECS_DIR, SPECS_DIR_NAME, EXCLUDE_MATCHER, target_dirs=TARGET_DIRS, dir_cache=dir_cache)
+    return scan.source_files()
+
+
+def find_dangling_references(entries, toc_keys, existing_files):
+    """
+    パスとして書かれた references のうち、どこにも解決できないもの（リンク切れ）を列挙
+
+    参照先は ToC キー → 走査結果の集合の順に照合し、走査対象外のパス
+    （plan/ など）だけファイルシステムを確認する（同じパスは1回のみ）。
+    抽象的な参照（"エラー処理の設計書" など）は対象外。
+
+    Returns:
+        tuple: ([(参照元, 参照), ...], パス参照の件数)
+    """
+    exists_cache = {}
+    dangling = []
+    checked = 0
+    for file_path, entry in entries:
+        references = entry.get('references')
+        if not isinstance(references, list):
+            continue
+        source_dir = posixpath.dirname(file_path)
+        for reference in references:
+            candidates = reference_candidates(reference, source_dir)
+            if not candidates:
+                continue
+            checked += 1
+            if any(c in toc_keys or c in existing_files for c in candidates):
+                continue
+            found = False
+            for candidate in candidates:
+                if candidate not in exists_cache:
+                    exists_cache[candidate] = os.path.isfile(PROJECT_ROOT / candidate)
+                found = found or exists_cache[candidate]
+            if not found:
+                dangling.append((file_path, reference))
+    return dangling, checked
+
+
+def is_schema_checked(toc_path):
+    """
+    ToC の全エントリが merge 時に現行スキーマで検査済みか
+
+    merge_specs_toc.py がサイドカーのヘッダーに記録した schema_version を見る。
+    ToC が手で編集された（サイドカーが古い）場合や --file の別ファイルは False。
+    """
+    header = load_toc_sidecar_header(toc_path)
+    return header is not None and header.get('schema_version') == SCHEMA_VERSION
+
+
+def field_error(file_path, problem):
+    """スキーマ検査の問題（toc_schema.SchemaProblem）をエラーメッセージに変換"""
+    if problem.field in STRING_FIELDS and problem.kind == 'type':
+        return f"必須フィールド不正: {file_path} の '{problem.field}' が文字列ではありません"
+    if problem.field in STRING_FIELDS:
+        return f"必須フィールド欠落: {file_path} に '{problem.field}' がありません"
+    return f"必須配列フィールド不正: {file_path} の '{problem.field}' が未設定または空配列です"
+
+
+def validate_toc(toc_path, timings=False):
+    """
+    生成された toc ファイルを検査する
+    - YAML構文検査
+    - 必須フィールド検査
+    - ファイル参照検査
+    - 重複ID検査
+    - references 検査
+
+    Args:
+        timings: True なら検査段階ごとの処理時間を最後に表示
+    """
+    print("=" * 50)
+    print("specs_toc.yaml 検査")
+    print("=" * 50)
+    print(f"対象: {toc_path}")
+    print()
+
+    timer = StageTimer()
+    success = run_checks(toc_path, timer)
+    if timings:
+        print()
+        print("処理時間:")
+        print("\n".join(timer.format_lines('合計')))
+    return success
+
+
+def run_checks(toc_path, timer):
+    """validate_toc() の検査本体（各段階を timer で計測）"""
+    errors = []
+
+    # 1. YAML構文検査（ファイルが読み込めるか）
+    try:
+        with timer.stage('YAML構文検査'):
+            entries = load_existing_toc(toc_path)
+        print("✓ YAML構文検査: OK（ファイル読み込み成功）")
+    except (OSError, UnicodeDecodeError) as e:
+        errors.append(f"YAML構文検査: ファイル読み込み失敗 - {e}")
+        print(f"\n❌ 検査失敗: {len(errors)} 件のエラー")
+        for err in errors:
+            print(f"  - {err}")
+        return False
+
+    # 新形式: docs セクション内の doc_type で分類（重複キーは後勝ち、4. で検出）
+    requirements = {}  # doc_type: requirement
+    designs = {}       # doc_type: design
+    # 2. 必須フィールド検査
+    # 新形式: キーがファイルパス、doc_type/title/purpose が必須（文字列）
+    # content_details/applicable_tasks/keywords が必須（非空配列）
+    # フォーマット定義: No null, No empty arrays (specs_toc_format.md)
+    # merge 時に全エントリを検査済みの ToC（サイドカーに記録）は再検査しない
+    field_errors = []
+
+    with timer.stage('必須フィールド検査'):
+        for file_path, entry in entries:
+            doc_type = entry.get('doc_type', '')
+            if doc_type == 'requirement':
+                requirements[file_path] = entry
+            elif doc_type == 'design':
+                designs[file_path] = entry
+
+        schema_checked = is_schema_checked(toc_path)
+        if not schema_checked:
+            for file_path, entry in list(requirements.items()) + list(designs.items()):
+                field_errors.extend(field_error(file_path, problem) for problem in CHECK_ENTRY(entry))
+
+    summary = f"requirements: {len(requirements)}件, designs: {len(designs)}件"
+    if schema_checked:
+        print(f"✓ 必須フィールド検査: OK（{summary}、merge 時に検査済み）")
+    elif not field_errors:
+        print(f"✓ 必須フィールド検査: OK（{summary}）")
+    else:
+        print(f"✗ 必須フィールド検査: {len(field_errors)}件のエラー")
+        errors.extend(field_errors)
+
+    # 3. ファイル参照検査
+    # 新形式: キーはプロジェクトルートからの相対パス（例: specs/main/requirements/app.md）
+    # 1回の走査で得た集合と照合し、集合にないキー（除外パターン対象など）だけディスクを確認
+    with timer.stage('ディレクトリ走査'):
+        existing_files = get_existing_files()
+    file_errors = []
+    with timer.stage('ファイル参照検査'):
+        for file_path in list(requirements) + list(designs):
+            if file_path not in existing_files and not (PROJECT_ROOT / file_path).exists():
+                file_errors.append(f"ファイル不在: '{file_path}' が存在しません")
+
+    if not file_errors:
+        print(f"✓ ファイル参照検査: OK（全ファイルが存在）")
+    else:
+        print(f"✗ ファイル参照検査: {len(file_errors)}件のエラー")
+        errors.extend(file_errors)
+
+    # 4. 重複パス検査（パーサは重複キーもそのまま返す）
+    all_paths = [file_path for file_path, _ in entries]
+    seen = set()
+    duplicates = []
+    with timer.stage('重複パス検査'):
+        for file_path in all_paths:
+            if file_path in seen:
+                duplicates.append(f"重複パス: '{file_path}' が複数回定義されています")
+            seen.add(file_path)
+
+    if not duplicates:
+        print(f"✓ 重複パス検査: OK（{len(all_paths)}件のユニークパス）")
+    else:
+        print(f"✗ 重複パス検査: {len(duplicates)}件の重複")
+        errors.extend(duplicates)
+
+    # 5. references 検査
+    # リンク切れ: パス形式の参照が ToC にも走査結果にもディスク上にもない（エラー）
+    # 循環参照: ToC エントリ間の参照が閉路を作る（requirement ⇔ design の相互参照もあり得るため警告のみ）
+    with timer.stage('参照リンク検査'):
+        dangling, checked = find_dangling_references(entries, seen, existing_files)
+    if not dangling:
+        print(f"✓ 参照リンク検査: OK（{checked}件のパス参照を確認）")
+    else:
+        print(f"✗ 参照リンク検査: {len(dangling)}件のリンク切れ")
+        errors.extend(f"リンク切れ: {file_path} の参照 '{reference}' が見つかりません"
+                      for file_path, reference in dangling)
+
+    with timer.stage('循環参照検査'):
+        # 差分マージ後はグラフファイルがないため、読み込み済みのエントリから構築する
+        graph = TocGraph.load(toc_path) or TocGraph.build(entries)
+        cycles = graph.cycles()
+    if not cycles:
+        print("✓ 循環参照検査: OK")
+    else:
+        print(f"⚠ 循環参照検査: {len(cycles)}件の循環（警告）")
+        for members in cycles:
+            print(f"  - 循環参照: {' ⇔ '.join(members)}")
+
+    # 結果サマリー
+    print()
+    if errors:
+        print(f"❌ 検査失敗: {len(errors)} 件のエラー")
+        print("-" * 40)
+        for err in errors:
+            print(f"  - {err}")
+        return False
+    else:
+        print(f"✅ 検査完了: 全チェックOK")
+        return True
+
+
+def main():
+    # Initialize configuration
+    if not init_config():
+        return 1
+
+    # --file オプションの処理
+    toc_path = DEFAULT_TOC_FILE
+    if '--file' in sys.argv:
+        idx = sys.argv.index('--file')
+        if idx + 1 < len(sys.argv):
+            toc_path = Path(sys.argv[idx + 1])
+
+    if not toc_path.exists():
+        print(f"エラー: ファイルが存在しません: {toc_path}")
+        return 1
+
+    success = validate_toc(toc_path, timings='--timings' in sys.argv)
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    exit_code = delegate_to_server('validate', 'specs')
+    sys.exit(main() if exit_code is None else exit_code)
@@ -0,0 +1,257 @@
+#!/bin/bash
+# Test script for serve_toc.py (ToC server and script delegation)
+# Usage: ./test_serve.sh
+
+# Note: Do not use 'set -e' as some tests expect failures
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+PROJECT_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
+TEST_PROJECT="$SCRIPT_DIR/test_project"
+
+# Colors for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m' # No Color
+
+PASS_COUNT=0
+FAIL_COUNT=0
+
+# Test result helper
+test_result() {
+    local name="$1"
+    local expected="$2"
+    local actual="$3"
+
+    if [[ "$expected" == "$actual" ]]; then
+        echo -e "${GREEN}PASS${NC}: $name"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: $name (expected=$expected, actual=$actual)"
+        ((FAIL_COUNT++))
+    fi
+}
+
+# Wait up to 10 seconds for a condition (evaluated with eval)
+wait_for() {
+    local condition="$1"
+    for _ in $(seq 1 50); do
+        eval "$condition" && return 0
+        sleep 0.2
+    done
+    return 1
+}
+
+echo "=================================================="
+echo "serve_toc.py Test Suite"
+echo "=================================================="
+echo ""
+echo "Project root: $PROJECT_ROOT"
+echo "Test project: $TEST_PROJECT"
+echo ""
+
+# Setup test project
+echo "Setting up test project..."
+cd "$TEST_PROJECT"
+rm -rf .claude .last_setup
+echo -e "rules\nspecs\nrequirements\ndesign\nplan\nopus" | "$PROJECT_ROOT/setup.sh" "$TEST_PROJECT"
+echo ""
+
+cd "$TEST_PROJECT"
+
+# Get Python path from orchestrator docs
+PYTHON_CMD=$(grep -oE '(\$HOME|~|/)[^"]*python3' .claude/doc-advisor/docs/rules_orchestrator.md 2>/dev/null | head -1 || echo "python3")
+PYTHON_CMD=$(eval echo "$PYTHON_CMD")
+echo "Using Python: $PYTHON_CMD"
+echo ""
+
+SCRIPTS_DIR=".claude/doc-advisor/scripts"
+SOCKET=".claude/doc-advisor/toc/.toc_serve.sock"
+SPECS_TOC_DIR=".claude/doc-advisor/toc/specs"
+WORK_DIR="$SPECS_TOC_DIR/.toc_work"
+
+# Phase 1-3 for specs: pending YAMLs, one batch of entries, merge, validate
+run_specs_pipeline() {
+    rm -rf "$WORK_DIR" "$SPECS_TOC_DIR/specs_toc.yaml"
+    $PYTHON_CMD "$SCRIPTS_DIR/create_pending_yaml_specs.py" --full >/dev/null 2>&1
+    for entry_file in "$WORK_DIR"/*.yaml; do
+        echo "{\"entry_file\": \"$entry_file\", \"title\": \"T $(basename "$entry_file")\", \"purpose\": \"P\", \"content_details\": [\"a\", \"b\", \"c\", \"d\", \"e\"], \"applicable_tasks\": [\"t\"], \"keywords\": [\"k1\", \"k2\", \"k3\", \"k4\", \"k5\"], \"references\": []}"
+    done | $PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" --batch - > /tmp/doc_advisor_serve_batch_$$.log 2>&1
+    BATCH_EXIT=$?
+    $PYTHON_CMD "$SCRIPTS_DIR/merge_specs_toc.py" --mode full > /tmp/doc_advisor_serve_merge_$$.log 2>&1
+    MERGE_EXIT=$?
+    $PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" > /tmp/doc_advisor_serve_validate_$$.log 2>&1
+    VALIDATE_EXIT=$?
+    # generated_at differs between runs
+    grep -v "generated_at" "$SPECS_TOC_DIR/specs_toc.yaml" > "$1"
+}
+
+echo "=================================================="
+echo "Test: Scripts run in-process without a server"
+echo "=================================================="
+
+run_specs_pipeline /tmp/doc_advisor_serve_local_toc_$$.log
+test_result "Batch write (in-process)" "0" "$BATCH_EXIT"
+test_result "Merge (in-process)" "0" "$MERGE_EXIT"
+test_result "Validate (in-process)" "0" "$VALIDATE_EXIT"
+LOCAL_VALIDATE=$(cat /tmp/doc_advisor_serve_validate_$$.log)
+LOCAL_QUERY=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target specs 2>&1)
+test_result "--query without a server" "0" "$?"
+LOCAL_RANK=$($PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" rank --target specs --limit 0 T 2>&1)
+test_result "query_toc.py rank without a server" "0" "$?"
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --status >/dev/null 2>&1
+test_result "--status fails without a server" "1" "$?"
+echo ""
+
+echo "=================================================="
+echo "Test: Scripts delegate to a running server"
+echo "=================================================="
+
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" > /tmp/doc_advisor_serve_$$.log 2>&1 &
+SERVER_PID=$!
+wait_for "$PYTHON_CMD '$SCRIPTS_DIR/serve_toc.py' --status >/dev/null 2>&1"
+test_result "--status reports running server" "0" "$?"
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "Second server refuses to start" "1" "$EXIT_CODE"
+
+run_specs_pipeline /tmp/doc_advisor_serve_served_toc_$$.log
+test_result "Batch write (server, stdin forwarded)" "0" "$BATCH_EXIT"
+test_result "Merge (server)" "0" "$MERGE_EXIT"
+test_result "Validate (server)" "0" "$VALIDATE_EXIT"
+test_result "Same ToC with and without server" "$(cat /tmp/doc_advisor_serve_local_toc_$$.log)" "$(cat /tmp/doc_advisor_serve_served_toc_$$.log)"
+test_result "Same validate output" "$LOCAL_VALIDATE" "$(cat /tmp/doc_advisor_serve_validate_$$.log)"
+test_result "Same --query output" "$LOCAL_QUERY" "$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target specs 2>&1)"
+test_result "Same query_toc.py rank output" "$LOCAL_RANK" "$($PYTHON_CMD "$SCRIPTS_DIR/query_toc.py" rank --target specs --limit 0 T 2>&1)"
+
+STATUS=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --status 2>&1)
+if echo "$STATUS" | grep -qE "[1-9][0-9]* calls"; then
+    echo -e "${GREEN}PASS${NC}: Calls were handled by the server"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Server status: $STATUS"
+    ((FAIL_COUNT++))
+fi
+
+# Exit codes and argparse errors come back unchanged
+FIRST_SOURCE=$(grep -oE "^  specs/[^:]+\.md" "$SPECS_TOC_DIR/specs_toc.yaml" | head -1 | tr -d ' ')
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target specs "$FIRST_SOURCE" 2>&1)
+test_result "--query single entry" "1" "$(echo "$OUTPUT" | grep -c "\"$FIRST_SOURCE\"")"
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target specs specs/none.md >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "--query unknown entry (server)" "1" "$EXIT_CODE"
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/write_specs_pending.py" --title "x" >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "argparse error exit code (server)" "2" "$EXIT_CODE"
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "create_checksums (server)" "0" "$EXIT_CODE"
+test_result "Checksums written" "1" "$([[ -f "$SPECS_TOC_DIR/.toc_checksums.yaml" ]] && echo 1 || echo 0)"
+
+# ToC edited behind the server's back is re-read
+sed -i.bak "s/^    title: T .*/    title: Edited/" "$SPECS_TOC_DIR/specs_toc.yaml"
+rm -f "$SPECS_TOC_DIR/specs_toc.yaml.bak"
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --query --target specs "$FIRST_SOURCE" 2>&1)
+test_result "Edited ToC is re-read" "1" "$(echo "$OUTPUT" | grep -c '"title": "Edited"')"
+
+# DOC_ADVISOR_NO_SERVER bypasses the server
+CALLS_BEFORE=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --status | grep -oE "[0-9]+ calls")
+DOC_ADVISOR_NO_SERVER=1 $PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" >/dev/null 2>&1
+CALLS_AFTER=$($PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --status | grep -oE "[0-9]+ calls")
+test_result "DOC_ADVISOR_NO_SERVER=1 runs in-process" "$CALLS_BEFORE" "$CALLS_AFTER"
+
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" --stop >/dev/null 2>&1
+test_result "--stop exit code" "0" "$?"
+wait "$SERVER_PID" 2>/dev/null
+test_result "Socket removed on exit" "0" "$([[ -S "$SOCKET" ]] && echo 1 || echo 0)"
+echo ""
+
+echo "=================================================="
+echo "Test: Stale socket falls back to in-process"
+echo "=================================================="
+
+$PYTHON_CMD -c "import socket; s = socket.socket(socket.AF_UNIX); s.bind('$SOCKET')"
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/validate_specs_toc.py" >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "Script runs with a stale socket" "0" "$EXIT_CODE"
+
+$PYTHON_CMD "$SCRIPTS_DIR/serve_toc.py" > /tmp/doc_advisor_serve_$$.log 2>&1 &
+SERVER_PID=$!
+wait_for "$PYTHON_CMD '$SCRIPTS_DIR/serve_toc.py' --status >/dev/null 2>&1"
+test_result "Server replaces a stale socket" "0" "$?"
+kill "$SERVER_PID" 2>/dev/null
+wait "$SERVER_PID" 2>/dev/null
+test_result "Socket removed on SIGTERM" "0" "$([[ -S "$SOCKET" ]] && echo 1 || echo 0)"
+echo ""
+
+echo "=================================================="
+echo "Test: SIGTERM during a call"
+echo "=================================================="
+
+# A call that receives SIGTERM is answered with exit code 1 and the server exits
+# (not reported as the script's own sys.exit(0))
+OUTPUT=$(cd "$SCRIPTS_DIR" && timeout 60 $PYTHON_CMD - "$TEST_PROJECT" <<'PYEOF' 2>&1
+import json, os, signal, socket, sys, threading, time
+sys.path.insert(0, os.getcwd())
+os.chdir(sys.argv[1])
+import serve_toc
+
+def interrupted():
+    os.kill(os.getpid(), signal.SIGTERM)
+    time.sleep(10)
+    return 0
+
+serve_toc.CALLS['interrupted'] = {None: interrupted}
+reply = {}
+
+def client():
+    while True:  # Until the server listens
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(serve_toc.SERVE_SOCKET_PATH)
+            break
+        except OSError:
+            sock.close()
+            time.sleep(0.05)
+    sock.sendall(json.dumps({'call': 'interrupted', 'target': None, 'argv': [], 'cwd': os.getcwd()}).encode() + b'\n')
+    with sock.makefile('rb') as f:
+        reply.update(json.loads(f.readline()))
+    sock.close()
+
+thread = threading.Thread(target=client)
+thread.start()
+code = serve_toc.serve()
+thread.join()
+print("exit_code", reply.get('exit_code'))
+print("server returned", code)
+print("socket exists", os.path.exists(serve_toc.SERVE_SOCKET_PATH))
+print(reply.get('stderr', ''))
+PYEOF
+)
+test_result "Interrupted call exit code" "1" "$(echo "$OUTPUT" | grep '^exit_code ' | cut -d' ' -f2)"
+test_result "Interrupted call reported" "1" "$(echo "$OUTPUT" | grep -c 'terminated (SIGTERM) during the call')"
+test_result "Server exits after interrupted call" "0" "$(echo "$OUTPUT" | grep '^server returned ' | cut -d' ' -f3)"
+test_result "Socket removed after interrupted call" "False" "$(echo "$OUTPUT" | grep '^socket exists ' | cut -d' ' -f3)"
+echo ""
+
+# Cleanup
+rm -rf "$WORK_DIR"
+rm -f "$SPECS_TOC_DIR/specs_toc.yaml" "$SPECS_TOC_DIR/.toc_checksums.yaml" "$SOCKET"
+rm -f /tmp/doc_advisor_serve_*$$.log
+
+echo "=================================================="
+echo "Summary"
+echo "=================================================="
+echo ""
+echo -e "Passed: ${GREEN}$PASS_COUNT${NC}"
+echo -e "Failed: ${RED}$FAIL_COUNT${NC}"
+echo ""
+
+if [[ $FAIL_COUNT -eq 0 ]]; then
+    echo -e "${GREEN}All tests passed!${NC}"
+    exit 0
+else
+    echo -e "${RED}Some tests failed.${NC}"
+    exit 1
+fi
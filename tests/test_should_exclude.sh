@@ -52,7 +52,9 @@ from pathlib import Path
 # Add scripts directory to path
 sys.path.insert(0, str(Path('.claude/doc-advisor/scripts').resolve()))
 
-from toc_utils import should_exclude
+import unicodedata
+
+from toc_utils import should_exclude, should_exclude_dir, compile_exclude_patterns, ExcludeMatcher
 
 def test_should_exclude():
     """Test should_exclude function"""
@@ -98,6 +100,23 @@ def test_should_exclude():
          "deeply nested plan directory"),
         (Path('/project/specs/a/b/c/planning/d/file.md'), ['plan'], False,
          "deeply nested planning directory should NOT match 'plan'"),
+
+        # Several slash patterns (compiled into one regex)
+        (Path('/project/specs/x/old/y/doc.md'), ['/archive/', 'old/y', 'plan'], True,
+         "second slash pattern should match"),
+        (Path('/project/specs/x/old/z/doc.md'), ['/archive/', 'old/y', 'plan'], False,
+         "no slash pattern matches"),
+
+        # Regex metacharacters are matched literally
+        (Path('/project/specs/v1.0/old/doc.md'), ['v1.0/old'], True,
+         "literal dot in slash pattern"),
+        (Path('/project/specs/v1x0/old/doc.md'), ['v1.0/old'], False,
+         "dot should NOT act as regex wildcard"),
+
+        # NFD pattern matches NFC path (macOS)
+        (Path('/project/specs/main/' + unicodedata.normalize('NFC', 'アーカイブ') + '/doc.md'),
+         [unicodedata.normalize('NFD', 'アーカイブ')], True,
+         "NFD pattern should match NFC directory name"),
     ]
 
     results = []
@@ -106,6 +125,19 @@ def test_should_exclude():
         status = "PASS" if actual == expected else "FAIL"
         results.append((status, desc, expected, actual))
 
+        # Directory-level pruning must agree with per-file filtering
+        dir_path = filepath.parent.relative_to(root_dir).as_posix()
+        dir_path = '' if dir_path == '.' else dir_path
+        actual = should_exclude_dir(dir_path, patterns)
+        status = "PASS" if actual == expected else "FAIL"
+        results.append((status, f"[dir] {desc}", expected, actual))
+
+        # Compiled matcher must agree with should_exclude
+        matcher = compile_exclude_patterns(patterns)
+        actual = isinstance(matcher, ExcludeMatcher) and matcher.excludes_file(filepath, root_dir)
+        status = "PASS" if actual == expected else "FAIL"
+        results.append((status, f"[matcher] {desc}", expected, actual))
+
     return results
 
 if __name__ == '__main__':
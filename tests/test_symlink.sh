@@ -239,6 +239,67 @@ fi
 rm -f "$TEST_PROJECT/rules/linked_rules_dup"
 echo ""
 
+echo "=================================================="
+echo "Test 7: Directory listing cache with symlinked directories"
+echo "=================================================="
+
+# Enable common.scan.dir_cache
+sed -i.bak 's/dir_cache: false/dir_cache: true/' .claude/doc-advisor/config.yaml && rm -f .claude/doc-advisor/config.yaml.bak
+DIRCACHE=".claude/doc-advisor/toc/rules/.toc_dircache"
+OLD_TIME="2020-01-01 00:00:00"
+age_dirs() {
+    # Fixed old mtime: listings are cacheable and mtimes compare equal across runs
+    find rules "$EXTERNAL_DIR" -type d -exec touch -d "$OLD_TIME" {} +
+}
+cached_rules_files() {
+    sed -n '/^checksums:/,/^[^ ]/p' "$RULES_CHECKSUMS" | grep -c '\.md:' || echo "0"
+}
+
+rm -f "$DIRCACHE" "$RULES_CHECKSUMS"
+age_dirs
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+BASELINE=$(cached_rules_files)
+test_result "Directory cache file written" "1" "$([[ -f "$DIRCACHE" ]] && echo 1 || echo 0)"
+
+OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules 2>&1)
+LISTED=$(echo "$OUTPUT" | grep -oE 'Directory cache: [0-9]+ reused, [0-9]+ listed' | grep -oE '[0-9]+ listed' | grep -oE '[0-9]+' || echo "")
+test_result "No-change run lists no directories" "0" "$LISTED"
+test_result "No-change run finds the same files" "$BASELINE" "$(cached_rules_files)"
+
+# New file inside the symlink target (parent of the link is unchanged)
+echo "# Added" > "$EXTERNAL_DIR/external_rules/added_rule.md"
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+if grep -q "linked_rules/added_rule.md" "$RULES_CHECKSUMS" 2>/dev/null; then
+    echo -e "${GREEN}PASS${NC}: New file in symlinked directory detected"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: New file in symlinked directory missed (stale listing)"
+    ((FAIL_COUNT++))
+fi
+
+# Retarget the symlink, then restore the parent mtime: only the inode changes
+mkdir -p "$EXTERNAL_DIR/external_rules_v2"
+echo "# Retargeted" > "$EXTERNAL_DIR/external_rules_v2/retargeted_rule.md"
+age_dirs
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+ln -sfn "$EXTERNAL_DIR/external_rules_v2" "$TEST_PROJECT/rules/linked_rules"
+age_dirs
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target rules >/dev/null 2>&1 || true
+if grep -q "linked_rules/retargeted_rule.md" "$RULES_CHECKSUMS" 2>/dev/null \
+    && ! grep -q "linked_rules/external_rule.md" "$RULES_CHECKSUMS" 2>/dev/null; then
+    echo -e "${GREEN}PASS${NC}: Retargeted symlink invalidates the cached listing"
+    ((PASS_COUNT++))
+else
+    echo -e "${RED}FAIL${NC}: Retargeted symlink served from stale cache"
+    ((FAIL_COUNT++))
+fi
+
+# Restore
+ln -sfn "$EXTERNAL_DIR/external_rules" "$TEST_PROJECT/rules/linked_rules"
+rm -f "$EXTERNAL_DIR/external_rules/added_rule.md" "$DIRCACHE"
+sed -i.bak 's/dir_cache: true/dir_cache: false/' .claude/doc-advisor/config.yaml && rm -f .claude/doc-advisor/config.yaml.bak
+echo ""
+
 echo "=================================================="
 echo "Cleanup"
 echo "=================================================="
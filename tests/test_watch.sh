@@ -0,0 +1,198 @@
+#!/bin/bash
+# Test script for watch_toc.py (background Phase 1 watcher)
+# Usage: ./test_watch.sh
+
+# Note: Do not use 'set -e' as some tests expect failures
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+PROJECT_ROOT="$(cd "$SCRIPT_DIR/.." && pwd)"
+TEST_PROJECT="$SCRIPT_DIR/test_project"
+
+# Colors for output
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+YELLOW='\033[1;33m'
+NC='\033[0m' # No Color
+
+PASS_COUNT=0
+FAIL_COUNT=0
+
+# Test result helper
+test_result() {
+    local name="$1"
+    local expected="$2"
+    local actual="$3"
+
+    if [[ "$expected" == "$actual" ]]; then
+        echo -e "${GREEN}PASS${NC}: $name"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: $name (expected=$expected, actual=$actual)"
+        ((FAIL_COUNT++))
+    fi
+}
+
+# Wait up to 10 seconds for a condition (evaluated with eval)
+wait_for() {
+    local condition="$1"
+    for _ in $(seq 1 50); do
+        eval "$condition" && return 0
+        sleep 0.2
+    done
+    return 1
+}
+
+echo "=================================================="
+echo "watch_toc.py Test Suite"
+echo "=================================================="
+echo ""
+echo "Project root: $PROJECT_ROOT"
+echo "Test project: $TEST_PROJECT"
+echo ""
+
+# Setup test project
+echo "Setting up test project..."
+cd "$TEST_PROJECT"
+rm -rf .claude .last_setup
+echo -e "rules\nspecs\nrequirements\ndesign\nplan\nopus" | "$PROJECT_ROOT/setup.sh" "$TEST_PROJECT"
+echo ""
+
+cd "$TEST_PROJECT"
+
+# Get Python path from orchestrator docs
+PYTHON_CMD=$(grep -oE '(\$HOME|~|/)[^"]*python3' .claude/doc-advisor/docs/rules_orchestrator.md 2>/dev/null | head -1 || echo "python3")
+PYTHON_CMD=$(eval echo "$PYTHON_CMD")
+echo "Using Python: $PYTHON_CMD"
+echo ""
+
+SCRIPTS_DIR="$TEST_PROJECT/.claude/doc-advisor/scripts"
+SPECS_TOC_DIR=".claude/doc-advisor/toc/specs"
+WORK_DIR="$SPECS_TOC_DIR/.toc_work"
+REQ_FILE="specs/main/requirements/user_authentication.md"
+DESIGN_FILE="specs/main/design/authentication_api.md"
+REQ_YAML="$WORK_DIR/specs_main_requirements_user_authentication.yaml"
+DESIGN_YAML="$WORK_DIR/specs_main_design_authentication_api.yaml"
+
+cp "$REQ_FILE" "$REQ_FILE.orig"
+cp "$DESIGN_FILE" "$DESIGN_FILE.orig"
+
+# Up-to-date baseline: checksums + ToC exist, no .toc_work
+$PYTHON_CMD "$SCRIPTS_DIR/create_checksums.py" --target specs >/dev/null 2>&1
+touch "$SPECS_TOC_DIR/specs_toc.yaml"
+
+run_watcher_suite() {
+    local mode_option="$1"
+    local label="$2"
+
+    echo "=================================================="
+    echo "Test: Watcher lifecycle ($label)"
+    echo "=================================================="
+
+    rm -rf "$WORK_DIR"
+    $PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --target specs --interval 0.3 $mode_option > /tmp/doc_advisor_watch_$$.log 2>&1 &
+    local watcher_pid=$!
+
+    wait_for "$PYTHON_CMD '$SCRIPTS_DIR/watch_toc.py' --status --target specs >/dev/null 2>&1"
+    test_result "[$label] --status reports healthy watcher" "0" "$?"
+    test_result "[$label] No .toc_work/ without changes" "0" "$([[ -d "$WORK_DIR" ]] && echo 1 || echo 0)"
+
+    # Edit → pending YAML + snapshot appear without running Phase 1
+    echo "watched edit" >> "$REQ_FILE"
+    wait_for "[[ -f '$REQ_YAML' ]]"
+    test_result "[$label] Edited file gets a pending YAML" "0" "$?"
+    test_result "[$label] Snapshot written" "1" "$([[ -f "$WORK_DIR/.toc_checksums_pending.yaml" ]] && echo 1 || echo 0)"
+
+    # Revert → pending YAML removed again
+    cp "$REQ_FILE.orig" "$REQ_FILE"
+    wait_for "[[ ! -d '$WORK_DIR' ]]"
+    test_result "[$label] Reverted file drops .toc_work/" "0" "$?"
+
+    # Claim freezes .toc_work/
+    echo "watched edit" >> "$REQ_FILE"
+    wait_for "[[ -f '$REQ_YAML' ]]"
+    OUTPUT=$($PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --claim --target specs 2>&1)
+    test_result "[$label] --claim exit code" "0" "$?"
+    if echo "$OUTPUT" | grep -q "Claimed watcher output: 1 pending"; then
+        echo -e "${GREEN}PASS${NC}: [$label] --claim reports pending YAMLs"
+        ((PASS_COUNT++))
+    else
+        echo -e "${RED}FAIL${NC}: [$label] --claim output: $OUTPUT"
+        ((FAIL_COUNT++))
+    fi
+    SNAPSHOT_BEFORE=$(cat "$WORK_DIR/.toc_checksums_pending.yaml")
+    echo "edit after claim" >> "$DESIGN_FILE"
+    sleep 1.5
+    test_result "[$label] Claimed .toc_work/ gets no new entries" "0" "$([[ -f "$DESIGN_YAML" ]] && echo 1 || echo 0)"
+    test_result "[$label] Claimed snapshot unchanged" "$SNAPSHOT_BEFORE" "$(cat "$WORK_DIR/.toc_checksums_pending.yaml")"
+
+    # Cleanup (as merge --cleanup) → watcher resumes and picks up the later edit
+    rm -rf "$WORK_DIR"
+    wait_for "[[ -f '$DESIGN_YAML' ]]"
+    test_result "[$label] Watcher resumes after .toc_work/ removal" "0" "$?"
+
+    kill "$watcher_pid" 2>/dev/null
+    wait "$watcher_pid" 2>/dev/null
+    test_result "[$label] Status file removed on exit" "0" "$([[ -f "$SPECS_TOC_DIR/.toc_watch.json" ]] && echo 1 || echo 0)"
+    $PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --status --target specs >/dev/null 2>&1
+    test_result "[$label] --status fails after exit" "1" "$?"
+
+    cp "$REQ_FILE.orig" "$REQ_FILE"
+    cp "$DESIGN_FILE.orig" "$DESIGN_FILE"
+    rm -rf "$WORK_DIR"
+    rm -f /tmp/doc_advisor_watch_$$.log
+    echo ""
+}
+
+run_watcher_suite "--poll" "poll"
+if [[ "$(uname -s)" == "Linux" ]]; then
+    run_watcher_suite "" "inotify"
+else
+    echo -e "${YELLOW}SKIP${NC}: inotify tests (Linux only)"
+fi
+
+echo "=================================================="
+echo "Test: --claim without a watcher"
+echo "=================================================="
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --claim --target specs >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "--claim fails when no watcher is running" "1" "$EXIT_CODE"
+
+EXIT_CODE=0
+$PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --claim >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "--claim requires a single target" "1" "$EXIT_CODE"
+echo ""
+
+echo "=================================================="
+echo "Test: Foreign .toc_work/ is never touched"
+echo "=================================================="
+
+mkdir -p "$WORK_DIR"
+echo "foreign" > "$WORK_DIR/foreign.yaml"
+echo "watched edit" >> "$REQ_FILE"
+$PYTHON_CMD "$SCRIPTS_DIR/watch_toc.py" --target specs --once >/dev/null 2>&1
+test_result "Existing .toc_work/ left as is" "foreign.yaml" "$(ls "$WORK_DIR")"
+cp "$REQ_FILE.orig" "$REQ_FILE"
+rm -rf "$WORK_DIR"
+echo ""
+
+# Restore
+mv "$REQ_FILE.orig" "$REQ_FILE"
+mv "$DESIGN_FILE.orig" "$DESIGN_FILE"
+rm -f "$SPECS_TOC_DIR/specs_toc.yaml" "$SPECS_TOC_DIR/.toc_checksums.yaml" "$SPECS_TOC_DIR/.toc.lock"
+
+echo "=================================================="
+echo "Summary"
+echo "=================================================="
+echo ""
+echo -e "Passed: ${GREEN}$PASS_COUNT${NC}"
+echo -e "Failed: ${RED}$FAIL_COUNT${NC}"
+echo ""
+
+if [[ $FAIL_COUNT -eq 0 ]]; then
+    echo -e "${GREEN}All tests passed!${NC}"
+    exit 0
+else
+    echo -e "${RED}Some tests failed.${NC}"
+    exit 1
+fi
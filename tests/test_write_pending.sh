@@ -202,6 +202,43 @@ $PYTHON_CMD "$WRITE_RULES" \
 test_result "write_rules_pending file not found" "1" "$EXIT_CODE"
 echo ""
 
+echo "=================================================="
+echo "Test 2-6: write_specs_pending.py - Batch mode (--batch)"
+echo "=================================================="
+
+$PYTHON_CMD .claude/doc-advisor/scripts/create_pending_yaml_specs.py --full 2>/dev/null || true
+SPECS_ENTRIES=($(ls .claude/doc-advisor/toc/specs/.toc_work/*.yaml))
+BATCH_FILE=$(mktemp)
+cat > "$BATCH_FILE" <<BATCH
+{"entry_file": "${SPECS_ENTRIES[0]}", "title": "Batch A", "purpose": "First", "content_details": ["a", "b", "c", "d", "e"], "applicable_tasks": ["t"], "keywords": ["k1", "k2", "k3", "k4", "k5"], "references": []}
+{"entry_file": "${SPECS_ENTRIES[1]}", "title": "Batch B", "purpose": "Second", "content_details": "a ||| b ||| c ||| d ||| e", "applicable_tasks": "t", "keywords": "k1 ||| k2 ||| k3 ||| k4 ||| k5", "references": "specs/x.md"}
+{"entry_file": "${SPECS_ENTRIES[0]}", "title": "Again", "purpose": "Completed", "content_details": ["a", "b", "c", "d", "e"], "applicable_tasks": ["t"], "keywords": ["k1", "k2", "k3", "k4", "k5"]}
+{"entry_file": "/nonexistent/file.yaml", "title": "Missing", "purpose": "x", "content_details": ["a"], "applicable_tasks": ["t"], "keywords": ["k"]}
+{"entry_file": "${SPECS_ENTRIES[1]}", "title": "Too few", "purpose": "x", "content_details": ["a"], "applicable_tasks": ["t"], "keywords": ["k"], "force": true}
+{"title": "No entry file"}
+not json
+BATCH
+
+EXIT_CODE=0
+OUTPUT=$($PYTHON_CMD "$WRITE_SPECS" --batch "$BATCH_FILE" 2>&1) || EXIT_CODE=$?
+RESULTS=$(echo "$OUTPUT" | grep "^Result:" | cut -d' ' -f2 | tr '\n' ' ')
+test_result "Per-entry exit codes" "0 0 1 1 3 2 2 " "$RESULTS"
+test_result "Batch exit code is the highest failure" "3" "$EXIT_CODE"
+test_result "First entry written" "1" "$(grep -c 'title: Batch A' "${SPECS_ENTRIES[0]}")"
+test_result "'|||' strings accepted in batch" "1" "$(grep -c '  - specs/x.md' "${SPECS_ENTRIES[1]}")"
+
+# stdin, all succeed
+$PYTHON_CMD .claude/doc-advisor/scripts/create_pending_yaml_specs.py --full 2>/dev/null || true
+EXIT_CODE=0
+head -2 "$BATCH_FILE" | $PYTHON_CMD "$WRITE_SPECS" --batch - >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "Batch from stdin" "0" "$EXIT_CODE"
+rm -f "$BATCH_FILE"
+
+EXIT_CODE=0
+$PYTHON_CMD "$WRITE_SPECS" --title "No entry file" >/dev/null 2>&1 || EXIT_CODE=$?
+test_result "Required arguments still enforced without --batch" "2" "$EXIT_CODE"
+echo ""
+
 echo "=================================================="
 echo "Summary"
 echo "=================================================="